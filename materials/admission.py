@@ -0,0 +1,116 @@
+import fcntl
+import os
+from contextlib import contextmanager
+from tempfile import gettempdir
+from time import monotonic, sleep
+from typing import Iterator, List, Optional, Tuple
+
+from django.conf import settings
+
+# Seconds between attempts to get a slot, while queueing
+POLL_INTERVAL = 0.1
+
+
+class Busy(Exception):
+    """No slot became available in time. Try again after retry_after"""
+
+    def __init__(self, kind: str, retry_after: int):
+        super().__init__(f'Too many concurrent {kind} operations')
+        self.retry_after = retry_after
+
+
+def get_limits(kind: str) -> Tuple[Optional[int], Optional[int]]:
+    """settings.MATERIALS_CONCURRENCY: The global and per-event limits on
+    concurrent operations of kind ('chunk' or 'complete'). None = unlimited.
+    """
+    limits = getattr(settings, 'MATERIALS_CONCURRENCY', {}).get(kind, {})
+    return limits.get('global'), limits.get('per_event')
+
+
+def get_wait() -> float:
+    """settings.MATERIALS_CONCURRENCY_WAIT: Seconds a request queues for a
+    slot, before giving up
+    """
+    return getattr(settings, 'MATERIALS_CONCURRENCY_WAIT', 5)
+
+
+def get_retry_after() -> int:
+    """settings.MATERIALS_RETRY_AFTER: Seconds clients are told to wait,
+    when we're too busy
+    """
+    return getattr(settings, 'MATERIALS_RETRY_AFTER', 10)
+
+
+def get_lock_dir() -> str:
+    """settings.MATERIALS_LOCK_DIR: Directory for slot lock files, shared by
+    all the processes on this host
+    """
+    lock_dir = getattr(settings, 'MATERIALS_LOCK_DIR', None)
+    if not lock_dir:
+        lock_dir = os.path.join(gettempdir(), 'materials-locks')
+    os.makedirs(lock_dir, exist_ok=True)
+    return lock_dir
+
+
+def try_lock_slot(lock_dir: str, pool: str, limit: int) -> Optional[int]:
+    """Lock any one of the pool's limit slots, returning its fd.
+
+    Closing the fd releases the slot. flock()s are released by the kernel
+    if the process dies, so slots can't leak.
+    """
+    for slot in range(limit):
+        path = os.path.join(lock_dir, f'{pool}.{slot}.lock')
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            continue
+        return fd
+    return None
+
+
+def try_lock_slots(pools: List[Tuple[str, int]]) -> Optional[List[int]]:
+    """Lock a slot in every pool, or none of them"""
+    lock_dir = get_lock_dir()
+    fds: List[int] = []
+    for pool, limit in pools:
+        fd = try_lock_slot(lock_dir, pool, limit)
+        if fd is None:
+            for fd in fds:
+                os.close(fd)
+            return None
+        fds.append(fd)
+    return fds
+
+
+@contextmanager
+def admitted(kind: str, event_id: int,
+             wait: Optional[float] = None) -> Iterator[None]:
+    """Run an operation of kind, within its concurrency limits.
+
+    Queues for up to wait seconds (None: forever), then raises Busy.
+    """
+    global_limit, event_limit = get_limits(kind)
+    pools = []
+    if event_limit:
+        pools.append((f'{kind}-event-{event_id}', event_limit))
+    if global_limit:
+        pools.append((kind, global_limit))
+    if not pools:
+        yield
+        return
+
+    deadline = None if wait is None else monotonic() + wait
+    while True:
+        fds = try_lock_slots(pools)
+        if fds is not None:
+            break
+        if deadline is not None and monotonic() >= deadline:
+            raise Busy(kind, get_retry_after())
+        sleep(POLL_INTERVAL)
+    try:
+        yield
+    finally:
+        for fd in fds:
+            os.close(fd)
@@ -8,3 +8,4 @@ class MaterialsConfig(AppConfig):
 
     def ready(self):
         load_materials()
+        import materials.signals  # noqa: F401
@@ -0,0 +1,213 @@
+import asyncio
+from functools import partial, wraps
+from io import BytesIO
+from typing import Awaitable, Callable, ContextManager, Optional, TypeVar
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import (
+    PermissionDenied, SuspiciousOperation, ValidationError)
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections
+from django.http import Http404
+from django.http.request import RawPostDataException
+from django.http.response import HttpResponse
+from django.urls import Resolver404, resolve
+
+from materials.admission import Busy, admitted, get_wait
+from materials.handlers import RawChunkReceiver, is_raw_chunk
+from materials.instrumentation import timed
+from materials.upload import (
+    ChunkCorrupted, ResumableRequest, ResumableUpload)
+from materials.views import (
+    CompletionStatusView, ResumableUploadView, check_csrf)
+
+T = TypeVar('T')
+
+
+def in_thread(func: Callable[..., T]) -> Callable[..., Awaitable[T]]:
+    """Run func in a thread pool, rather than on the event loop, or in
+    Django's single thread for sync code.
+
+    For file and database I/O.
+    """
+    return sync_to_async(func, thread_sensitive=False)
+
+
+def in_db_thread(func: Callable[..., T]) -> Callable[..., Awaitable[T]]:
+    """in_thread, for database work.
+
+    The pool's threads keep their connections between calls, so stale and
+    broken ones are closed around func, as Django does when a request starts
+    and finishes.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return in_thread(wrapper)
+
+
+async def enter(context: ContextManager) -> None:
+    """Enter a (blocking) context manager, in the thread pool.
+
+    If we're cancelled meanwhile, the thread carries on regardless, so the
+    context manager is exited once it has been entered.
+    """
+    entering = asyncio.ensure_future(in_thread(context.__enter__)())
+    try:
+        await asyncio.shield(entering)
+    except asyncio.CancelledError:
+        entering.add_done_callback(partial(exit_entered, context))
+        raise
+
+
+def exit_entered(context: ContextManager, entering: asyncio.Future):
+    if not entering.cancelled() and entering.exception() is None:
+        context.__exit__(None, None, None)
+
+
+class RequestAborted(Exception):
+    pass
+
+
+class StreamingChunkMiddleware:
+    """ASGI middleware that handles resumable.js chunk requests natively.
+
+    Django's ASGI handler reads the whole request body before it calls a
+    view, and then runs sync views in a single thread. Here, raw chunk
+    bodies (resumable.js method: 'octet') are fed into place as they arrive,
+    so a slow upload holds no thread while it waits for data. Chunk tests
+    and completion status polls are run in a thread pool.
+
+    Everything else is passed through to Django. These requests skip
+    Django's middleware, other than CSRF protection for chunk POSTs.
+    """
+
+    def __init__(self, application):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            request = ASGIRequest(scope, BytesIO())
+            handler = self.get_handler(request)
+            if handler:
+                response = await self.handle(handler, request, receive)
+                if response:
+                    await send_response(send, response)
+                return
+        await self.application(scope, receive, send)
+
+    def get_handler(self, request):
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return None
+        if match.url_name == 'materials.completion_status':
+            if request.method == 'GET':
+                return partial(self.view, CompletionStatusView.as_view(),
+                               match.kwargs)
+        elif match.url_name == 'materials.upload':
+            if 'resumableIdentifier' not in request.GET:
+                return None
+            if request.method == 'GET':
+                return partial(self.view, ResumableUploadView.as_view(),
+                               match.kwargs)
+            if request.method == 'POST' and is_raw_chunk(request):
+                return partial(self.stream_chunk, match.kwargs)
+        return None
+
+    async def handle(self, handler, request, receive
+                     ) -> Optional[HttpResponse]:
+        try:
+            return await handler(request, receive)
+        except RequestAborted:
+            return None
+        except Http404 as e:
+            return HttpResponse(str(e), status=404, content_type='text/plain')
+        except PermissionDenied as e:
+            return HttpResponse(str(e), status=403, content_type='text/plain')
+        except (SuspiciousOperation, RawPostDataException) as e:
+            return HttpResponse(str(e), status=400, content_type='text/plain')
+        except ValidationError as e:
+            # As ResumableUploadView
+            return HttpResponse(' '.join(e.messages), status=415,
+                                content_type='text/plain')
+        except ChunkCorrupted as e:
+            return HttpResponse(str(e), status=422, content_type='text/plain')
+        except Busy as e:
+            response = HttpResponse(str(e), status=503,
+                                    content_type='text/plain')
+            response['Retry-After'] = str(e.retry_after)
+            return response
+
+    async def view(self, view, kwargs, request, receive) -> HttpResponse:
+        """Run a (quick) sync view, in the thread pool"""
+        return await in_db_thread(view)(request, **kwargs)
+
+    async def stream_chunk(self, kwargs, request, receive) -> HttpResponse:
+        """Receive a raw chunk body, as ResumableUploadView.save_chunk"""
+        resumable_upload = await in_db_thread(
+            ResumableUpload.from_query_string)(
+                request, kwargs['slug'], kwargs['material'])
+        rejected = await in_thread(check_csrf)(request)
+        if rejected:
+            return rejected
+        upload = resumable_upload.upload
+        r_req = ResumableRequest.parse_query_string(request.GET)
+        resumable_upload.validate_request(r_req)
+
+        admission = admitted('chunk', upload.event_id, get_wait())
+        await enter(admission)
+        try:
+            handler = resumable_upload.get_upload_handler(request)
+            try:
+                with timed('save_chunk', upload,
+                           r_req.expected_size(r_req.chunk_number)):
+                    request.upload_handlers.insert(0, handler)
+                    receiver = RawChunkReceiver(
+                        request.upload_handlers, request.META,
+                        int(request.META.get('CONTENT_LENGTH') or 0),
+                        r_req.filename)
+                    await in_db_thread(receiver.start)()
+                    try:
+                        await self.receive_body(receive, receiver)
+                    except BaseException:
+                        await in_db_thread(receiver.abort)()
+                        raise
+                    chunk_f = await in_db_thread(receiver.complete)()
+                    await in_db_thread(resumable_upload.save_chunk_files)(
+                        r_req, [chunk_f] if chunk_f else [])
+            finally:
+                await in_db_thread(handler.abort)()
+        finally:
+            await in_thread(admission.__exit__)(None, None, None)
+        return HttpResponse(status=201)
+
+    async def receive_body(self, receive, receiver: RawChunkReceiver):
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                raise RequestAborted()
+            body = message.get('body', b'')
+            if body:
+                await in_db_thread(receiver.receive)(body)
+            if not message.get('more_body', False):
+                return
+
+
+async def send_response(send, response: HttpResponse):
+    await send({
+        'type': 'http.response.start',
+        'status': response.status_code,
+        'headers': [
+            (name.encode('ascii'), value.encode('latin1'))
+            for name, value in response.items()
+        ],
+    })
+    await send({
+        'type': 'http.response.body',
+        'body': response.content,
+    })
@@ -0,0 +1,185 @@
+import os
+import resource
+from dataclasses import asdict, dataclass, field
+from io import BytesIO
+from statistics import median
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Dict, List
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from materials import get_event_model, hashing
+
+BACKENDS = {
+    'memory': 'materials.tests.support.InMemoryStorage',
+    'filesystem': 'django.core.files.storage.FileSystemStorage',
+}
+
+# Uploaded under a material of its own, without a max_size, so any --sizes
+# can be benchmarked. Its validators are the usual ones.
+BENCHMARK_MATERIALS = (
+    {
+        'id': 'benchmark',
+        'name': 'Benchmark',
+        'extensions': ['pdf'],
+        'validators': [
+            'materials.validators.filename',
+            'materials.validators.size',
+            'materials.validators.magic_bytes',
+        ],
+    },
+)
+
+SIZE_SUFFIXES = {'K': 1024, 'M': 1024**2, 'G': 1024**3}
+
+
+def parse_size(size: str) -> int:
+    """Parse a human size: 512, 64K, 100M, 1G"""
+    size = size.strip().upper().rstrip('B')
+    if size and size[-1] in SIZE_SUFFIXES:
+        return int(float(size[:-1]) * SIZE_SUFFIXES[size[-1]])
+    return int(size)
+
+
+def peak_rss() -> int:
+    """The process' peak resident set size, in bytes.
+
+    A high-water mark: It only grows over the process' life.
+    """
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if os.uname().sysname == 'Darwin':
+        return maxrss
+    return maxrss * 1024
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+@dataclass
+class BenchmarkResult:
+    backend: str
+    size: int
+    chunk_size: int
+    chunks: int = 0
+    sha256: str = ''
+    seconds: Dict[str, float] = field(default_factory=dict)
+    chunk_seconds: Dict[str, float] = field(default_factory=dict)
+    queries: Dict[str, int] = field(default_factory=dict)
+    throughput: float = 0.0  # Bytes per second, end to end
+    peak_rss: int = 0
+
+    def as_dict(self):
+        return asdict(self)
+
+
+class UploadBenchmark:
+    """Drive create -> chunk POSTs -> complete through the test client.
+
+    Needs a database to write to, the management command sets up a test
+    database.
+    """
+
+    def __init__(self, backend: str, size: int, chunk_size: int):
+        self.result = BenchmarkResult(backend=backend, size=size,
+                                      chunk_size=chunk_size)
+        self.backend = backend
+        self.size = size
+        self.chunk_size = chunk_size
+        self.client = Client()
+
+    def run(self) -> BenchmarkResult:
+        with TemporaryDirectory() as media_root:
+            storage = BACKENDS[self.backend]
+            with override_settings(
+                    MEDIA_ROOT=media_root,
+                    MATERIALS=BENCHMARK_MATERIALS,
+                    MATERIALS_STORAGE=storage,
+                    MATERIALS_TEMP_STORAGE=storage,
+                    MATERIALS_COMPLETION_WORKERS=None):
+                self.reset()
+                try:
+                    self.upload()
+                finally:
+                    self.reset()
+        self.result.peak_rss = peak_rss()
+        return self.result
+
+    def reset(self):
+        cache.clear()
+        hashing._running_hashes.clear()
+        if self.backend == 'memory':
+            from materials.tests.support import InMemoryStorage
+            InMemoryStorage.wipe()
+
+    def phase(self, name, func, *args):
+        with CaptureQueriesContext(connection) as queries:
+            start = perf_counter()
+            response = func(*args)
+            elapsed = perf_counter() - start
+        if response.status_code >= 400:
+            raise BenchmarkError(
+                f'{name} failed: {response.status_code} {response.content}')
+        self.result.seconds[name] = (
+            self.result.seconds.get(name, 0.0) + elapsed)
+        self.result.queries[name] = (
+            self.result.queries.get(name, 0) + len(queries))
+        return response, elapsed
+
+    def upload(self) -> None:
+        event = get_event_model().objects.create(
+            title='Benchmark',
+            slug=f'benchmark-{self.backend}-{self.size}-{self.chunk_size}')
+        target = f'/events/{event.slug}/upload/benchmark'
+        chunks = max(self.size // self.chunk_size, 1)
+        self.result.chunks = chunks
+        # Incompressible, but the same for every chunk. Passes for a PDF
+        data = b'%PDF-' + os.urandom(min(self.chunk_size, self.size) - 5)
+        start = perf_counter()
+
+        r, _ = self.phase('create', self.client.post, target, {
+            'action': 'create',
+            'filename': 'benchmark.pdf',
+            'size': self.size,
+        })
+        identifier = r.json()['identifier']
+
+        chunk_times: List[float] = []
+        for chunk in range(1, chunks + 1):
+            content = data
+            if chunk == chunks:
+                remaining = self.size - self.chunk_size * (chunks - 1)
+                content = (data * (remaining // len(data) + 1))[:remaining]
+            args = urlencode({
+                'resumableIdentifier': identifier,
+                'resumableChunkNumber': chunk,
+                'resumableChunkSize': self.chunk_size,
+                'resumableTotalSize': self.size,
+                'resumableTotalChunks': chunks,
+                'resumableFilename': 'benchmark.pdf',
+                'resumableRelativePath': 'benchmark.pdf',
+            })
+            self.phase('chunk_exists', self.client.get, f'{target}?{args}')
+            _, elapsed = self.phase(
+                'save_chunk', self.client.post, f'{target}?{args}',
+                {'file': BytesIO(content)})
+            chunk_times.append(elapsed)
+
+        r, _ = self.phase('complete', self.client.post, target, {
+            'action': 'complete',
+            'identifier': identifier,
+        })
+        total = perf_counter() - start
+        self.result.sha256 = r.json()['sha256']
+        self.result.seconds['total'] = total
+        self.result.throughput = self.size / total
+        self.result.chunk_seconds = {
+            'min': min(chunk_times),
+            'median': median(chunk_times),
+            'max': max(chunk_times),
+        }
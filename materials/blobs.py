@@ -0,0 +1,69 @@
+from typing import Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from materials.models import Blob
+from materials.storage import get_storage
+
+
+def content_addressed() -> bool:
+    """settings.MATERIALS_CONTENT_ADDRESSED_STORAGE: Store each distinct file
+    once, named by its sha256
+    """
+    return getattr(settings, 'MATERIALS_CONTENT_ADDRESSED_STORAGE', False)
+
+
+def get_blob_path(sha256: str) -> str:
+    """Storage name for content-addressed material"""
+    return f'sha256/{sha256[:2]}/{sha256}'
+
+
+def acquire_blob(sha256: str) -> Optional[Blob]:
+    """Take a reference to an existing Blob with this content, if any"""
+    with transaction.atomic():
+        blob = Blob.objects.select_for_update().filter(sha256=sha256).first()
+        if blob:
+            blob.references = F('references') + 1
+            blob.save(update_fields=['references'])
+            blob.refresh_from_db(fields=['references'])
+    return blob
+
+
+def add_blob(sha256: str, size: int, name: str) -> Blob:
+    """Register a newly stored file as a Blob, holding a reference to it.
+
+    If an identical Blob was stored concurrently, that one is used, and
+    the new file deleted.
+    """
+    with transaction.atomic():
+        blob, created = Blob.objects.select_for_update().get_or_create(
+            sha256=sha256, defaults={
+                'name': name,
+                'size': size,
+                'references': 1,
+            })
+        if not created:
+            blob.references = F('references') + 1
+            blob.save(update_fields=['references'])
+            blob.refresh_from_db(fields=['references'])
+    if not created:
+        get_storage().delete(name)
+    return blob
+
+
+def release_blob(blob_id: int):
+    """Drop a reference to a Blob, deleting it once unreferenced"""
+    with transaction.atomic():
+        blob = Blob.objects.select_for_update().filter(id=blob_id).first()
+        if not blob:
+            return
+        if blob.references > 1:
+            blob.references = F('references') - 1
+            blob.save(update_fields=['references'])
+            return
+        name = blob.name
+        blob.delete()
+        # Only once we're sure nothing new references it
+        transaction.on_commit(lambda: get_storage().delete(name))
@@ -0,0 +1,310 @@
+import os
+from datetime import datetime
+from functools import partial
+from secrets import token_hex
+from typing import Callable, Dict, Iterator, Optional, Tuple, Union
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, PermissionDenied
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from materials.models import Chunk
+from materials.storage import (
+    assemble_chunks, get_chunk_path, get_partial_path, get_temp_storage,
+    move_temp_file)
+
+# Called with the number of chunks assembled so far, and the total
+ProgressCallback = Callable[[int, int], None]
+
+
+class LocalChunkWriter:
+    """Streams a chunk into a new file, moved into place on commit"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.partial = f'{path}.{token_hex(4)}.receiving'
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.f = open(self.partial, 'wb')
+        self.size = 0
+        self.committed = False
+
+    def write(self, data: bytes):
+        self.f.write(data)
+        self.size += len(data)
+
+    def close(self):
+        self.f.close()
+
+    def commit(self):
+        os.rename(self.partial, self.path)
+        self.committed = True
+
+    def abort(self):
+        """Discard the chunk, unless it was committed"""
+        self.f.close()
+        if not self.committed and os.path.exists(self.partial):
+            os.unlink(self.partial)
+
+
+class OffsetChunkWriter:
+    """Streams a chunk into its place in a preallocated file.
+
+    overwritten is called if the writer is aborted after writing anything,
+    as any copy of the chunk received before is no longer intact.
+    """
+
+    def __init__(self, path: str, offset: int, limit: int,
+                 overwritten: Optional[Callable[[], None]] = None):
+        try:
+            self.fd = os.open(path, os.O_WRONLY)
+        except FileNotFoundError:
+            raise PermissionDenied("Upload was not prepared")
+        self.closed = False
+        self.committed = False
+        self.offset = offset
+        self.limit = limit
+        self.overwritten = overwritten
+        self.size = 0
+
+    def write(self, data: bytes):
+        if self.size + len(data) > self.limit:
+            self.close()
+            raise PermissionDenied("Chunk size mismatch")
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(self.fd, view, self.offset + self.size)
+            self.size += written
+            view = view[written:]
+
+    def close(self):
+        if not self.closed:
+            os.close(self.fd)
+            self.closed = True
+
+    def commit(self):
+        self.committed = True
+
+    def abort(self):
+        self.close()
+        if not self.committed and self.size and self.overwritten:
+            self.overwritten()
+
+
+ChunkWriter = Union[LocalChunkWriter, OffsetChunkWriter]
+
+
+class ChunkFiles:
+    """Chunks stored as separate files in temp storage, until completion.
+
+    Received chunks are recorded in the Chunk table, the storage is never
+    probed.
+    """
+
+    def __init__(self, upload):
+        self.upload = upload
+        self.temp_storage = get_temp_storage()
+
+    def prepare(self):
+        """Prepare to receive chunks"""
+
+    def manifest(self) -> Dict[int, int]:
+        """Sizes of all received chunks, by number"""
+        return dict(Chunk.objects.filter(upload=self.upload).values_list(
+            'number', 'size'))
+
+    def received_size(self, chunk: int) -> Optional[int]:
+        """Size of a received chunk, or None if it hasn't been received"""
+        return Chunk.objects.filter(
+            upload=self.upload, number=chunk,
+        ).values_list('size', flat=True).first()
+
+    def received(self) -> Dict[int, Tuple[int, Optional[str], datetime]]:
+        """Sizes, the client's checksums, and receipt times of all received
+        chunks, by number
+        """
+        return {number: (size, sha256, received) for number, size, sha256,
+                received in Chunk.objects.filter(
+                    upload=self.upload).values_list(
+                    'number', 'size', 'sha256', 'received')}
+
+    def digests(self) -> Dict[int, Optional[str]]:
+        """The client's checksums of all received chunks, by number"""
+        return dict(Chunk.objects.filter(upload=self.upload).values_list(
+            'number', 'sha256'))
+
+    def received_sha256(self, chunk: int) -> Optional[str]:
+        """The client's checksum of a received chunk, if it sent one"""
+        return Chunk.objects.filter(
+            upload=self.upload, number=chunk,
+        ).values_list('sha256', flat=True).first()
+
+    def read(self, chunk: int, chunk_size: Optional[int] = None
+             ) -> Iterator[bytes]:
+        """Read a received chunk.
+
+        chunk_size is the client's, where every chunk but the last is that
+        size.
+        """
+        with self.temp_storage.open(get_chunk_path(self.upload, chunk),
+                                    'rb') as chunk_f:
+            yield from iter(lambda: chunk_f.read(1024*1024), b'')
+
+    def open_writer(self, r_req) -> Optional[ChunkWriter]:
+        """Stream a chunk straight into place, if the storage allows it"""
+        if not isinstance(self.temp_storage, FileSystemStorage):
+            return None
+        return LocalChunkWriter(self.temp_storage.path(
+            get_chunk_path(self.upload, r_req.chunk_number)))
+
+    def save(self, r_req, chunk_f) -> datetime:
+        """Store a received chunk, replacing any previous copy.
+
+        Returns when it was recorded as received.
+        """
+        writer = getattr(chunk_f, 'writer', None)
+        if writer:
+            # Atomically replaces any previous copy
+            writer.commit()
+        else:
+            self.forget(r_req.chunk_number)
+            path = get_chunk_path(self.upload, r_req.chunk_number)
+            if self.temp_storage.exists(path):
+                self.temp_storage.delete(path)
+            self.temp_storage.save(path, chunk_f)
+        return self.record(r_req.chunk_number, chunk_f.size,
+                           r_req.chunk_sha256)
+
+    def record(self, chunk: int, size: int, sha256: Optional[str] = None
+               ) -> datetime:
+        """Record a chunk as received, once it's been completely written.
+
+        With the client's (verified) checksum, if it sent one.
+        Returns when it was received.
+        """
+        try:
+            # Usually a new chunk, so try that first
+            with transaction.atomic():
+                return Chunk.objects.create(
+                    upload=self.upload, number=chunk, size=size,
+                    sha256=sha256).received
+        except IntegrityError:
+            received = timezone.now()
+            Chunk.objects.filter(upload=self.upload, number=chunk).update(
+                size=size, sha256=sha256, received=received)
+            return received
+
+    def forget(self, chunk: int):
+        """Stop considering a chunk received, before replacing it"""
+        Chunk.objects.filter(upload=self.upload, number=chunk).delete()
+
+    def assemble(self, chunks: int, name: str,
+                 progress: Optional[ProgressCallback] = None) -> str:
+        """Assemble the first chunks into name, in storage"""
+        def chunk_paths():
+            for chunk in range(1, chunks + 1):
+                yield get_chunk_path(self.upload, chunk)
+                if progress:
+                    progress(chunk, chunks)
+
+        manifest = self.manifest()
+        sizes = [manifest[chunk] for chunk in range(1, chunks + 1)]
+        return assemble_chunks(chunk_paths(), name, sizes)
+
+    def delete(self):
+        """Delete all received chunks"""
+        for chunk in sorted(self.manifest()):
+            path = get_chunk_path(self.upload, chunk)
+            if self.temp_storage.exists(path):
+                self.temp_storage.delete(path)
+        Chunk.objects.filter(upload=self.upload).delete()
+
+
+class PreallocatedFile(ChunkFiles):
+    """Chunks written in place, into a sparse file of the upload's size.
+
+    Chunks can be written concurrently, in any order, and no concatenation is
+    needed on completion. Requires temp storage on a filesystem.
+    """
+
+    def __init__(self, upload):
+        super().__init__(upload)
+        if not isinstance(self.temp_storage, FileSystemStorage):
+            raise ImproperlyConfigured(
+                'MATERIALS_PREALLOCATE_UPLOADS requires '
+                'MATERIALS_TEMP_STORAGE to be a FileSystemStorage')
+        self.path = self.temp_storage.path(get_partial_path(upload))
+
+    def prepare(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'wb') as f:
+            f.truncate(self.upload.size)
+
+    def chunk_offset(self, chunk: int, chunk_size: Optional[int] = None
+                     ) -> int:
+        if chunk_size:
+            # Every resumable.js chunk but the last is chunk_size
+            return (chunk - 1) * chunk_size
+        # tus appends chunks of any size, but always in order
+        manifest = self.manifest()
+        return sum(manifest[n] for n in range(1, chunk))
+
+    def read(self, chunk: int, chunk_size: Optional[int] = None
+             ) -> Iterator[bytes]:
+        offset = self.chunk_offset(chunk, chunk_size)
+        remaining = self.received_size(chunk) or 0
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            while remaining:
+                block = os.pread(fd, min(remaining, 1024*1024), offset)
+                if not block:
+                    return
+                offset += len(block)
+                remaining -= len(block)
+                yield block
+        finally:
+            os.close(fd)
+
+    def open_writer(self, r_req) -> OffsetChunkWriter:
+        # A chunk received before stays received, unless its bytes are
+        # overwritten and the new copy isn't committed
+        return OffsetChunkWriter(
+            self.path, r_req.offset, r_req.expected_size(r_req.chunk_number),
+            overwritten=partial(self.forget, r_req.chunk_number))
+
+    def save(self, r_req, chunk_f) -> datetime:
+        if chunk_f.size != r_req.expected_size(r_req.chunk_number):
+            raise PermissionDenied("Chunk size mismatch")
+        writer = getattr(chunk_f, 'writer', None)
+        if not writer:
+            writer = self.open_writer(r_req)
+            try:
+                for block in chunk_f.chunks():
+                    writer.write(block)
+            except BaseException:
+                writer.abort()
+                raise
+            writer.close()
+        writer.commit()
+        return self.record(r_req.chunk_number, chunk_f.size,
+                           r_req.chunk_sha256)
+
+    def assemble(self, chunks: int, name: str,
+                 progress: Optional[ProgressCallback] = None) -> str:
+        name = move_temp_file(get_partial_path(self.upload), name)
+        if progress:
+            progress(chunks, chunks)
+        return name
+
+    def delete(self):
+        Chunk.objects.filter(upload=self.upload).delete()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def get_chunk_store(upload) -> ChunkFiles:
+    """Chunk storage for an upload, as configured"""
+    if getattr(settings, 'MATERIALS_PREALLOCATE_UPLOADS', False):
+        return PreallocatedFile(upload)
+    return ChunkFiles(upload)
@@ -0,0 +1,113 @@
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+from django.db import transaction
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from materials.blobs import release_blob
+from materials.event_list import invalidate_event_list
+from materials.models import Upload
+from materials.storage import get_storage
+from materials.summary import invalidate_event_summary
+from materials.upload import ResumableUpload, invalidate_active_upload
+
+
+def stale_uploads(cutoff: datetime) -> QuerySet:
+    """CREATED uploads that haven't received a chunk since cutoff"""
+    return Upload.objects.filter(
+        uploaded__isnull=True, deleted__isnull=True, created__lt=cutoff,
+    ).exclude(chunks__received__gte=cutoff)
+
+
+def purgeable_uploads(cutoff: datetime) -> QuerySet:
+    """Uploads deleted before cutoff, that haven't been purged"""
+    return Upload.objects.filter(deleted__lt=cutoff, purged__isnull=True)
+
+
+def in_batches(queryset: QuerySet, batch_size: int) -> Iterator[List[Upload]]:
+    """Iterate through queryset, in batches of Uploads, by id.
+
+    Safe to modify (or delete) each batch, before requesting the next one.
+    """
+    queryset = queryset.select_related('event', 'blob').order_by('id')
+    last_id = 0
+    while True:
+        batch = list(queryset.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            return
+        last_id = batch[-1].id
+        yield batch
+
+
+def expire_uploads(uploads: List[Upload], dry_run: bool = False) -> int:
+    """Abandon stale CREATED uploads, deleting their chunks.
+
+    Returns the number of bytes reclaimed.
+    """
+    size = 0
+    for upload in uploads:
+        resumable_upload = ResumableUpload(upload)
+        size += sum(resumable_upload.chunks.manifest().values())
+        if not dry_run:
+            resumable_upload.delete_upload_chunks()
+    if not dry_run:
+        Upload.objects.filter(id__in=[upload.id for upload in uploads]
+                              ).update(deleted=timezone.now())
+        invalidate_uploads(uploads)
+    return size
+
+
+def invalidate_uploads(uploads: List[Upload]):
+    """Invalidate what caches uploads, after updating them in bulk.
+
+    QuerySet.update() doesn't send the post_save signal that usually does.
+    """
+    for upload in uploads:
+        invalidate_active_upload(upload.id)
+    for event_id in {upload.event_id for upload in uploads}:
+        invalidate_event_summary(event_id)
+    invalidate_event_list()
+
+
+def purge_upload(upload: Upload, dry_run: bool = False,
+                 released: Optional[Dict[int, int]] = None) -> int:
+    """Delete a deleted upload's file (unless its Blob is still referenced
+    by other uploads), or chunks. The upload itself is kept, marked purged,
+    with its reviews and jobs.
+
+    released counts the references to Blobs that earlier uploads in a dry
+    run would have released, by Blob id.
+    Returns the number of bytes reclaimed.
+    """
+    if upload.blob_id:
+        # Other uploads may have released it
+        upload.blob.refresh_from_db(fields=['references'])
+        references = upload.blob.references
+        if dry_run and released is not None:
+            references -= released.get(upload.blob_id, 0)
+            released[upload.blob_id] = released.get(upload.blob_id, 0) + 1
+        # Only the last reference frees its file
+        size = upload.blob.size if references == 1 else 0
+    elif upload.uploaded:
+        size = upload.size
+        if not dry_run:
+            storage = get_storage()
+            if storage.exists(upload.storage_path):
+                storage.delete(upload.storage_path)
+    else:
+        # Chunks are usually deleted when the upload is superseded
+        resumable_upload = ResumableUpload(upload)
+        size = sum(resumable_upload.chunks.manifest().values())
+        if not dry_run:
+            resumable_upload.delete_upload_chunks()
+    if not dry_run:
+        blob_id = upload.blob_id
+        with transaction.atomic():
+            upload.blob = None
+            upload.purged = timezone.now()
+            upload.save()
+            if blob_id:
+                # Once nothing here references it
+                release_blob(blob_id)
+    return size
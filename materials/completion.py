@@ -0,0 +1,165 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from logging import getLogger
+from threading import Lock
+from typing import Optional
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from materials.admission import admitted, get_wait
+from materials.models import (
+    CompletionJob, CompletionStates, Upload, UploadStates)
+from materials.upload import ResumableUpload
+
+
+log = getLogger(__name__)
+
+
+class CompletionError(Exception):
+    pass
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = Lock()
+
+
+def get_completion_workers() -> Optional[int]:
+    """settings.MATERIALS_COMPLETION_WORKERS.
+
+    None: Complete uploads within the request.
+    0: Queue them for the complete_uploads management command.
+    n: Complete them in a pool of n threads, in this process.
+    """
+    return getattr(settings, 'MATERIALS_COMPLETION_WORKERS', None)
+
+
+def get_completion_timeout() -> int:
+    """settings.MATERIALS_COMPLETION_TIMEOUT: Seconds without progress,
+    after which a RUNNING job is considered abandoned (its worker died), and
+    run again.
+    """
+    return getattr(settings, 'MATERIALS_COMPLETION_TIMEOUT', 600)
+
+
+def claimable() -> Q:
+    """Jobs that are QUEUED, or RUNNING but abandoned"""
+    cutoff = timezone.now() - timedelta(seconds=get_completion_timeout())
+    return (Q(state=CompletionStates.QUEUED)
+            | Q(state=CompletionStates.RUNNING, updated__lt=cutoff))
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=get_completion_workers(),
+                thread_name_prefix='materials-completion')
+        return _executor
+
+
+def submit_completion(upload: Upload) -> CompletionJob:
+    """Start completing an upload, as configured.
+
+    Returns the job, which may already have finished.
+    """
+    job = CompletionJob.objects.filter(
+        upload=upload,
+        state__in=(CompletionStates.QUEUED, CompletionStates.RUNNING),
+    ).first()
+    if job:
+        if CompletionJob.objects.filter(claimable(), id=job.id).exists():
+            # A previous attempt was too busy to run it, the pool it was
+            # submitted to is gone (with its process), or it was abandoned
+            start_completion(job)
+        return job
+
+    job = CompletionJob.objects.create(upload=upload)
+    start_completion(job)
+    return job
+
+
+def start_completion(job: CompletionJob):
+    workers = get_completion_workers()
+    if workers is None:
+        # May raise Busy, leaving the job QUEUED
+        run_completion(job, wait=get_wait())
+    elif workers > 0:
+        transaction.on_commit(
+            lambda: get_executor().submit(run_completion_in_thread, job.id))
+
+
+def claim_job(job: CompletionJob) -> bool:
+    """Mark a QUEUED (or abandoned) job RUNNING. False if somebody else got
+    there first
+    """
+    now = timezone.now()
+    claimed = CompletionJob.objects.filter(claimable(), id=job.id).update(
+        state=CompletionStates.RUNNING, updated=now)
+    job.state = CompletionStates.RUNNING
+    job.updated = now
+    return bool(claimed)
+
+
+def run_completion(job: CompletionJob, wait: Optional[float] = None) -> bool:
+    """Complete a QUEUED (or abandoned) job's upload, recording its
+    progress.
+
+    Waits for up to wait seconds (None: forever) for a completion slot,
+    before raising Busy.
+    Returns False if the job was already claimed.
+    """
+    with admitted('complete', job.upload.event_id, wait):
+        return run_admitted_completion(job)
+
+
+def run_admitted_completion(job: CompletionJob) -> bool:
+    if not claim_job(job):
+        return False
+
+    def progress(chunk, chunks):
+        job.progress = chunk * 100 // chunks
+        # Updated, so it isn't considered abandoned
+        CompletionJob.objects.filter(id=job.id).update(
+            progress=job.progress, updated=timezone.now())
+
+    try:
+        upload = job.upload
+        if upload.state != UploadStates.CREATED:
+            raise CompletionError(
+                f'Upload is in state {upload.state}, not CREATED')
+        ResumableUpload(upload).complete_upload(progress)
+        if upload.state != UploadStates.UPLOADED:
+            raise CompletionError('Upload is incomplete')
+    except CompletionError as e:
+        log.warning('Failed to complete upload %s: %s', job.upload_id, e)
+        job.state = CompletionStates.FAILED
+        job.error = str(e)
+    except Exception:
+        log.exception('Failed to complete upload %s', job.upload_id)
+        job.state = CompletionStates.FAILED
+        job.error = 'Internal error'
+    else:
+        job.state = CompletionStates.DONE
+        job.progress = 100
+    job.save()
+    return True
+
+
+def run_completion_in_thread(job_id: int):
+    try:
+        run_completion(CompletionJob.objects.get(id=job_id))
+    finally:
+        connections.close_all()
+
+
+def run_queued_completions() -> int:
+    """Run all QUEUED (and abandoned) jobs. Returns the number run"""
+    ran = 0
+    for job in CompletionJob.objects.filter(claimable()).order_by('created'):
+        if run_completion(job):
+            ran += 1
+    return ran
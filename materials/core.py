@@ -1,9 +1,12 @@
 from collections import OrderedDict
-from typing import List
+from typing import Callable, List, Optional
 
 from django.conf import settings
+from django.utils.module_loading import import_string
 
 materials: 'OrderedDict[str, Material]' = OrderedDict()
+# The settings.MATERIALS that materials was populated from
+_loaded_from = None
 
 
 class Material:
@@ -12,25 +15,41 @@ class Material:
     name: str
     extensions: List[str]
     validators: List[str]
+    max_size: Optional[int]
 
     def __init__(self, material_dict):
         self.id = material_dict['id']
         self.name = material_dict['name']
         self.extensions = material_dict['extensions']
         self.validators = material_dict['validators']
+        self.max_size = material_dict.get('max_size')
+        self._validators: Optional[List[Callable]] = None
+
+    def get_validators(self) -> List[Callable]:
+        """The validator functions, imported from validators"""
+        if self._validators is None:
+            self._validators = [import_string(path)
+                                for path in self.validators]
+        return self._validators
 
 
 def load_materials():
     """Populate materials"""
-    global materials
+    global _loaded_from
+    materials.clear()
     for material_dict in settings.MATERIALS:
         material = Material(material_dict)
         materials[material.id] = material
+    _loaded_from = settings.MATERIALS
 
 
 def get_material(material_id: str) -> Material:
     """Retreive a Material by ID.
 
     materials is a common name, this getter will avoid needing to import it.
+    They're populated again if settings.MATERIALS has been replaced (e.g.
+    overridden, in tests).
     """
+    if settings.MATERIALS is not _loaded_from:
+        load_materials()
     return materials[material_id]
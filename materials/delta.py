@@ -0,0 +1,94 @@
+"""Delta re-uploads: Chunks that are unchanged from the previous upload of
+a material are copied from its file, rather than sent again.
+
+Enabled by settings.MATERIALS_DELTA_UPLOADS. The client sends the
+checksums of all of its chunks, before uploading any of them.
+"""
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+
+from materials.models import Upload
+from materials.upload import (
+    ChunkCorrupted, ResumableRequest, ResumableUpload)
+
+
+def get_previous_upload(upload: Upload) -> Optional[Upload]:
+    """The last completed upload of the event's material, with the
+    checksums of its chunks
+    """
+    return Upload.objects.select_related('event', 'blob').filter(
+        event_id=upload.event_id, material_id=upload.material_id,
+        uploaded__isnull=False, purged__isnull=True,
+        chunk_digests__isnull=False,
+    ).exclude(id=upload.id).order_by('-uploaded').first()
+
+
+def locate_chunks(upload: Upload) -> Dict[str, Tuple[int, int]]:
+    """The offset and size of each of an upload's chunks, by checksum"""
+    located: Dict[str, Tuple[int, int]] = {}
+    offset = 0
+    for size, digest in upload.chunk_digests:
+        located.setdefault(digest, (offset, size))
+        offset += size
+    return located
+
+
+def get_reuse_limit() -> int:
+    """settings.MATERIALS_REUSE_LIMIT: Bytes copied per reuse request. The
+    client asks again, for the rest
+    """
+    return getattr(settings, 'MATERIALS_REUSE_LIMIT', 64 * 1024 * 1024)
+
+
+def reuse_chunks(resumable_upload: ResumableUpload, chunk_size: int,
+                 digests: List[str]) -> Tuple[int, int]:
+    """Copy chunks that match the client's checksums (digests, one per
+    chunk) from the previous upload, as if they had been received.
+
+    At least one chunk, and otherwise up to get_reuse_limit() bytes, is
+    copied. Returns the number of chunks reused, and the number remaining
+    to reuse.
+    """
+    upload = resumable_upload.upload
+    if len(digests) != max(upload.size // chunk_size, 1):
+        raise PermissionDenied('Expected a checksum for every chunk')
+    previous = get_previous_upload(upload)
+    if not previous:
+        return 0, 0
+    located = locate_chunks(previous)
+    received = resumable_upload.chunks.digests()
+    limit = get_reuse_limit()
+    reused = remaining = copied = 0
+    for chunk_number, digest in enumerate(digests, 1):
+        r_req = ResumableRequest(
+            chunk_number=chunk_number,
+            chunk_size=chunk_size,
+            total_size=upload.size,
+            total_chunks=len(digests),
+            id=str(upload.id),
+            filename=upload.filename,
+            relative_path=upload.filename,
+            chunk_sha256=digest.lower(),
+        )
+        resumable_upload.validate_request(r_req)
+        location = located.get(r_req.chunk_sha256 or '')
+        if received.get(chunk_number) == r_req.chunk_sha256 or not location:
+            # Already received, or must be sent
+            continue
+        start, size = location
+        if size != r_req.expected_size(chunk_number):
+            continue
+        if reused and (remaining or copied + size > limit):
+            # For the next request
+            remaining += 1
+            continue
+        try:
+            resumable_upload.reuse_chunk(r_req, previous, start)
+        except (ChunkCorrupted, OSError):
+            # The previous file has gone, or doesn't match its checksums
+            break
+        reused += 1
+        copied += size
+    return reused, remaining
@@ -0,0 +1,140 @@
+import mimetypes
+import re
+from typing import Iterator, Optional, Tuple
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http.response import (
+    FileResponse, HttpResponse, HttpResponseBase, StreamingHttpResponse)
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+from materials.models import Upload
+from materials.storage import get_storage
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single byte Range header, into inclusive (start, end).
+
+    Returns None for headers we don't support (which may be ignored), and
+    raises ValueError for unsatisfiable ranges.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    start, end = match.groups()
+    if not start:
+        if not end:
+            return None
+        # Suffix range: the last n bytes
+        length = int(end)
+        if not length:
+            raise ValueError('Empty suffix range')
+        return max(size - length, 0), size - 1
+    first = int(start)
+    last = int(end) if end else size - 1
+    if first >= size or last < first:
+        raise ValueError('Unsatisfiable range')
+    return first, min(last, size - 1)
+
+
+def read_range(f, start: int, length: int) -> Iterator[bytes]:
+    try:
+        f.seek(start)
+        while length:
+            block = f.read(min(length, 1024*1024))
+            if not block:
+                return
+            length -= len(block)
+            yield block
+    finally:
+        f.close()
+
+
+def get_offload() -> Optional[str]:
+    """settings.MATERIALS_DOWNLOAD_OFFLOAD: 'x-accel-redirect', 'x-sendfile'
+    or None (serve downloads from Django)
+    """
+    return getattr(settings, 'MATERIALS_DOWNLOAD_OFFLOAD', None)
+
+
+def offload_response(upload: Upload, offload: str) -> HttpResponse:
+    """Have the front-end web server send the file (and handle Ranges)"""
+    response = HttpResponse()
+    # The front-end web server sets the Content-Type
+    del response['Content-Type']
+    name = upload.storage_path
+    if offload == 'x-accel-redirect':
+        prefix = getattr(settings, 'MATERIALS_DOWNLOAD_ACCEL_PREFIX',
+                         '/protected-materials/')
+        response['X-Accel-Redirect'] = prefix + quote(name)
+    elif offload == 'x-sendfile':
+        response['X-Sendfile'] = get_storage().path(name)
+    else:
+        raise ImproperlyConfigured(
+            f'Unknown MATERIALS_DOWNLOAD_OFFLOAD: {offload}')
+    return response
+
+
+def serve_upload(request, upload: Upload) -> HttpResponseBase:
+    """Download an UPLOADED upload, supporting conditional & Range requests.
+
+    sha256 is the strong ETag.
+    """
+    etag = quote_etag(upload.sha256)
+    conditional = get_conditional_response(
+        request, etag=etag, last_modified=upload.uploaded.timestamp())
+    if conditional is not None:
+        conditional['ETag'] = etag
+        return conditional
+
+    offload = get_offload()
+    response: HttpResponseBase
+    if offload:
+        response = offload_response(upload, offload)
+    else:
+        response = file_response(request, upload, etag)
+
+    response['ETag'] = etag
+    if 'Content-Disposition' not in response:
+        response['Content-Disposition'] = (
+            f"attachment; filename*=UTF-8''{quote(upload.filename)}")
+    return response
+
+
+def file_response(request, upload: Upload, etag: str) -> HttpResponseBase:
+    """Stream the file from storage"""
+    response: HttpResponseBase
+    storage = get_storage()
+    size = upload.size
+    content_type = (mimetypes.guess_type(upload.filename)[0]
+                    or 'application/octet-stream')
+
+    byte_range = None
+    if 'HTTP_RANGE' in request.META and request.META.get(
+            'HTTP_IF_RANGE', etag) == etag:
+        try:
+            byte_range = parse_range(request.META['HTTP_RANGE'], size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    f = storage.open(upload.storage_path, 'rb')
+    if byte_range is None:
+        response = FileResponse(f, as_attachment=True,
+                                filename=upload.filename,
+                                content_type=content_type)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(
+            read_range(f, start, length), status=206,
+            content_type=content_type)
+        response['Content-Length'] = str(length)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,143 @@
+"""The list of events, a page at a time.
+
+Pages follow a cursor (the title and id of the last event on the previous
+page), rather than an offset, so that the database seeks straight to them
+in the (title, id) index, however far into a large schedule they are.
+"""
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as Base64Error
+from hashlib import sha256
+from typing import Dict, Optional, Tuple
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.db.models import Count, Q
+from django.db.models.functions import Lower
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from materials import get_event_model
+from materials.models import Upload
+
+VERSION_CACHE_KEY = 'materials:event-list-version'
+
+
+def get_page_size() -> int:
+    return getattr(settings, 'MATERIALS_EVENT_LIST_PAGE_SIZE', 100)
+
+
+def get_event_list_cache_timeout() -> int:
+    return getattr(settings, 'MATERIALS_EVENT_LIST_CACHE_TIMEOUT', 300)
+
+
+def encode_cursor(event) -> str:
+    data = json.dumps([event.title, event.pk]).encode('utf-8')
+    return urlsafe_b64encode(data).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """The title and id of the event a page follows"""
+    try:
+        title, pk = json.loads(urlsafe_b64decode(cursor.encode('ascii')))
+    except (Base64Error, UnicodeError, ValueError, TypeError):
+        raise PermissionDenied('Invalid cursor')
+    if not isinstance(title, str) or not isinstance(pk, int):
+        raise PermissionDenied('Invalid cursor')
+    return title, pk
+
+
+def prefix_range(prefix: str) -> Tuple[str, str]:
+    """Bounds of the strings that start with prefix.
+
+    A range, unlike LIKE, can be looked up in a plain index.
+    """
+    return prefix, prefix + '\U0010ffff'
+
+
+def search_events(queryset, search: str):
+    """Events whose title or slug starts with search, ignoring case"""
+    start, end = prefix_range(search.lower())
+    return queryset.alias(
+        title_lower=Lower('title'), slug_lower=Lower('slug'),
+    ).filter(
+        Q(title_lower__gte=start, title_lower__lt=end,
+          title_lower__startswith=start)
+        | Q(slug_lower__gte=start, slug_lower__lt=end,
+            slug_lower__startswith=start))
+
+
+def get_upload_counts(event_ids) -> Dict[int, Dict[str, int]]:
+    """The number of materials uploaded, and uploads in progress, by
+    event. In one query.
+    """
+    counts = Upload.objects.filter(
+        event_id__in=event_ids, deleted__isnull=True,
+    ).values('event_id').annotate(
+        materials_uploaded=Count('material_id', distinct=True,
+                                 filter=Q(uploaded__isnull=False)),
+        uploads_in_progress=Count('id', filter=Q(uploaded__isnull=True)),
+    ).order_by()
+    return {row.pop('event_id'): row for row in counts}
+
+
+def get_event_list_context(search: str = '', cursor: Optional[str] = None):
+    """A page of events, by title, with their upload counts.
+
+    In a fixed number of queries, however large the page.
+    """
+    events = get_event_model().objects.only('id', 'title', 'slug').order_by(
+        'title', 'id')
+    if search:
+        events = search_events(events, search)
+    if cursor:
+        title, pk = decode_cursor(cursor)
+        events = events.filter(Q(title__gt=title) | Q(title=title, id__gt=pk))
+
+    page_size = get_page_size()
+    # One more, to know whether there's a next page
+    page = list(events[:page_size + 1])
+    next_cursor = None
+    if len(page) > page_size:
+        page = page[:page_size]
+        next_cursor = encode_cursor(page[-1])
+
+    counts = get_upload_counts([event.pk for event in page])
+    for event in page:
+        event.upload_counts = counts.get(event.pk, {})
+
+    return {
+        'events': page,
+        'search': search,
+        'next_cursor': next_cursor,
+        'material_count': len(settings.MATERIALS),
+    }
+
+
+def get_event_list_cache_key(search: str, cursor: Optional[str]) -> str:
+    """Cached pages are replaced, when the version changes"""
+    version = cache.get(VERSION_CACHE_KEY)
+    if version is None:
+        version = uuid4().hex
+        cache.set(VERSION_CACHE_KEY, version, None)
+    # Hashed, as the search and cursor come from the query string
+    page = sha256(f'{search}\n{cursor or ""}'.encode('utf-8')).hexdigest()
+    return f'materials:event-list:{version}:{page}'
+
+
+def render_event_list(search: str = '', cursor: Optional[str] = None) -> str:
+    """A rendered page of events, cached"""
+    key = get_event_list_cache_key(search, cursor)
+    rendered = cache.get(key)
+    if rendered is None:
+        rendered = render_to_string('materials/event_list_page.html',
+                                    get_event_list_context(search, cursor))
+        cache.set(key, rendered, get_event_list_cache_timeout())
+    return mark_safe(rendered)
+
+
+def invalidate_event_list():
+    """Events or uploads changed, so every cached page may be stale"""
+    cache.set(VERSION_CACHE_KEY, uuid4().hex, None)
@@ -0,0 +1,198 @@
+"""Archives of the current uploads of events, for the video and archive
+teams.
+
+Archives are streamed as they're written: entries are stored without
+compression (the materials are already compressed), and read from storage a
+block at a time, so memory use doesn't grow with the archive, and no
+temporary archive file is written.
+"""
+import tarfile
+import zipfile
+from datetime import datetime, timezone
+from hashlib import sha256
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+from django.http.response import HttpResponseBase, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+from materials.download import read_range
+from materials.models import Upload
+from materials.storage import get_storage
+
+EXPORT_FORMATS = {
+    'zip': 'application/zip',
+    'tar': 'application/x-tar',
+}
+CHECKSUMS_NAME = 'SHA256SUMS'
+# Used for SHA256SUMS, when there are no uploads to date it from
+EPOCH = datetime(1980, 1, 1, tzinfo=timezone.utc)
+
+
+class StreamBuffer:
+    """A write-only file, holding what's written until it's taken"""
+
+    def __init__(self) -> None:
+        self.buffer: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self.buffer.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data = b''.join(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def current_uploads(events: Optional[Iterable] = None) -> List[Upload]:
+    """The latest completed upload of each material, of events (or every
+    event), by event slug and material
+    """
+    uploads = Upload.objects.select_related('event', 'blob').filter(
+        uploaded__isnull=False, deleted__isnull=True).order_by('-uploaded')
+    if events is not None:
+        uploads = uploads.filter(event__in=events)
+    current: Dict[Tuple[int, str], Upload] = {}
+    for upload in uploads:
+        current.setdefault((upload.event_id, upload.material_id), upload)
+    return sorted(current.values(),
+                  key=lambda upload: (upload.event.slug, upload.material_id))
+
+
+def export_name(upload: Upload) -> str:
+    """The upload's name in the archive"""
+    extension = upload.filename.rsplit('.', 1)[-1]
+    return f'{upload.event.slug}/{upload.material_id}.{extension}'
+
+
+def render_checksums(uploads: List[Upload]) -> bytes:
+    """SHA256SUMS, as read by sha256sum --check"""
+    return ''.join(f'{upload.sha256}  {export_name(upload)}\n'
+                   for upload in uploads).encode('utf-8')
+
+
+def last_modified(uploads: List[Upload]) -> datetime:
+    return max((upload.uploaded for upload in uploads), default=EPOCH)
+
+
+def export_etag(uploads: List[Upload], format: str) -> str:
+    """A weak ETag, that changes when any upload in the archive does"""
+    hasher = sha256(format.encode('ascii'))
+    for upload in uploads:
+        hasher.update(f'\n{export_name(upload)} {upload.sha256}'.encode())
+    return 'W/' + quote_etag(hasher.hexdigest())
+
+
+def read_upload(upload: Upload) -> Iterator[bytes]:
+    return read_range(get_storage().open(upload.storage_path, 'rb'), 0,
+                      upload.size)
+
+
+def zip_info(name: str, modified: datetime, size: int) -> zipfile.ZipInfo:
+    info = zipfile.ZipInfo(
+        name, date_time=modified.astimezone(timezone.utc).timetuple()[:6])
+    info.compress_type = zipfile.ZIP_STORED
+    # Known up front, so ZIP64 headers are written when needed
+    info.file_size = size
+    return info
+
+
+def stream_zip(uploads: List[Upload]) -> Iterator[bytes]:
+    """A ZIP of uploads, and their SHA256SUMS.
+
+    ZipFile can't seek in the StreamBuffer, so it follows each entry with
+    its CRC and size (a data descriptor).
+    """
+    buffer = StreamBuffer()
+    archive = zipfile.ZipFile(buffer, 'w')
+    checksums = render_checksums(uploads)
+    archive.writestr(
+        zip_info(CHECKSUMS_NAME, last_modified(uploads), len(checksums)),
+        checksums)
+    yield buffer.take()
+    for upload in uploads:
+        info = zip_info(export_name(upload), upload.uploaded, upload.size)
+        with archive.open(info, 'w') as entry:
+            for block in read_upload(upload):
+                entry.write(block)
+                yield buffer.take()
+    # The central directory
+    archive.close()
+    yield buffer.take()
+
+
+def tar_header(name: str, modified: datetime, size: int) -> bytes:
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = int(modified.timestamp())
+    info.mode = 0o644
+    # pax headers hold sizes over 8 GiB, and long names
+    return info.tobuf(tarfile.PAX_FORMAT)
+
+
+def tar_padding(size: int) -> bytes:
+    """NULs, to fill the last block of a member of size bytes"""
+    return tarfile.NUL * (-size % tarfile.BLOCKSIZE)
+
+
+def stream_tar(uploads: List[Upload]) -> Iterator[bytes]:
+    """A tar of uploads, and their SHA256SUMS.
+
+    Written a header at a time, as TarFile.addfile() copies a whole member
+    before we could send any of it.
+    """
+    checksums = render_checksums(uploads)
+    data = (tar_header(CHECKSUMS_NAME, last_modified(uploads),
+                       len(checksums))
+            + checksums + tar_padding(len(checksums)))
+    written = len(data)
+    yield data
+    for upload in uploads:
+        header = tar_header(export_name(upload), upload.uploaded,
+                            upload.size)
+        written += len(header)
+        yield header
+        for block in read_upload(upload):
+            written += len(block)
+            yield block
+        padding = tar_padding(upload.size)
+        written += len(padding)
+        yield padding
+    # End of archive, padded to a whole record
+    written += 2 * tarfile.BLOCKSIZE
+    yield (tarfile.NUL * (2 * tarfile.BLOCKSIZE)
+           + tarfile.NUL * (-written % tarfile.RECORDSIZE))
+
+
+def stream_export(uploads: List[Upload], format: str) -> Iterator[bytes]:
+    if format == 'tar':
+        return stream_tar(uploads)
+    return stream_zip(uploads)
+
+
+def export_response(request, uploads: List[Upload], format: str,
+                    name: str) -> HttpResponseBase:
+    """Stream an archive of uploads, revalidated by ETag.
+
+    Not Last-Modified, as deleting an upload can make an archive older.
+    """
+    etag = export_etag(uploads, format)
+    conditional = get_conditional_response(request, etag=etag)
+    if conditional is not None:
+        conditional['ETag'] = etag
+        return conditional
+
+    response = StreamingHttpResponse(stream_export(uploads, format),
+                                     content_type=EXPORT_FORMATS[format])
+    response['ETag'] = etag
+    response['Content-Disposition'] = (
+        f"attachment; filename*=UTF-8''{quote(name)}.{format}")
+    return response
@@ -0,0 +1,208 @@
+import hashlib
+from typing import List, Optional
+
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import (
+    FileUploadHandler, StopFutureHandlers)
+
+from materials.hashing import get_running_hash
+from materials.validators import HEAD_SIZE
+
+
+class StreamedChunk(UploadedFile):
+    """A chunk that ChunkUploadHandler has already written into place.
+
+    If it was the next chunk to be hashed, when it started arriving, hasher
+    is a copy of the running hash that it was fed into.
+    If the client sent a checksum, sha256 is the chunk's own digest.
+    """
+
+    def __init__(self, writer, running, hasher, sha256=None, **kwargs):
+        super().__init__(**kwargs)
+        self.writer = writer
+        self.running = running
+        self.hasher = hasher
+        self.sha256 = sha256
+
+    def discard(self):
+        """Delete the chunk, unless it was committed"""
+        self.writer.abort()
+
+
+class ChunkUploadHandler(FileUploadHandler):
+    """Stream a chunk from the request body straight into its place.
+
+    Skips spooling the request to a temporary file, and then copying it
+    into temp storage.
+    """
+
+    def __init__(self, request, resumable_upload, r_req):
+        super().__init__(request)
+        self.resumable_upload = resumable_upload
+        self.r_req = r_req
+        self.writer = None
+        self.streamed = None
+        self.chunk_hasher = None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        if self.streamed or self.writer:
+            # save_chunk will reject multiple files
+            return
+        self.writer = self.resumable_upload.chunks.open_writer(self.r_req)
+        if not self.writer:
+            return
+        if self.r_req.chunk_sha256:
+            self.chunk_hasher = hashlib.sha256()
+
+        upload_id = self.resumable_upload.upload.id
+        self.running = get_running_hash(upload_id)
+        self.hasher = None
+        with self.running.lock:
+            if self.running.next_chunk == self.r_req.chunk_number:
+                self.hasher = self.running.hasher.copy()
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.writer:
+            return raw_data
+        if start == 0 and self.r_req.chunk_number == 1:
+            # Reject the wrong type of file, before receiving any more of it
+            try:
+                self.resumable_upload.validate_head(raw_data[:HEAD_SIZE])
+            except ValidationError:
+                self.writer.abort()
+                self.writer = None
+                raise
+        self.writer.write(raw_data)
+        if self.hasher:
+            self.hasher.update(raw_data)
+        if self.chunk_hasher:
+            self.chunk_hasher.update(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if not self.writer:
+            return None
+        self.writer.close()
+        self.streamed = StreamedChunk(
+            writer=self.writer, running=self.running, hasher=self.hasher,
+            sha256=(self.chunk_hasher.hexdigest() if self.chunk_hasher
+                    else None),
+            name=self.file_name, content_type=self.content_type,
+            size=file_size, charset=self.charset,
+            content_type_extra=self.content_type_extra)
+        self.writer = None
+        return self.streamed
+
+    def upload_interrupted(self):
+        self.abort()
+
+    def abort(self):
+        """Discard whatever was written, unless it was saved.
+
+        Django only calls upload_interrupted() for StopUpload, so callers
+        abort in a finally block, e.g. when the client disconnects.
+        """
+        if self.writer:
+            self.writer.abort()
+            self.writer = None
+        if self.streamed:
+            self.streamed.discard()
+
+
+class ChecksumUploadHandler(FileUploadHandler):
+    """Hash a file as it's received, for verification once it's complete.
+
+    Passes the data on to the following handlers.
+    """
+
+    def __init__(self, request, algorithm: str):
+        super().__init__(request)
+        self.hasher = hashlib.new(algorithm)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hasher.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+    def digest(self) -> bytes:
+        return self.hasher.digest()
+
+
+def is_raw_chunk(request) -> bool:
+    """Is the chunk the whole request body (resumable.js method: 'octet')?
+
+    Otherwise, it's a file in a multipart body.
+    """
+    return request.content_type not in (
+        'multipart/form-data', 'application/x-www-form-urlencoded')
+
+
+class RawChunkReceiver:
+    """Feeds a raw chunk body through upload handlers, as MultiPartParser
+    does for a file in a multipart body.
+
+    The body can be fed in as it arrives, from a WSGI stream or ASGI
+    messages.
+    """
+
+    def __init__(self, handlers: List[FileUploadHandler], META,
+                 content_length: int, filename: str):
+        self.handlers = handlers
+        self.META = META
+        self.content_length = content_length
+        self.filename = filename
+        self.size = 0
+
+    def start(self):
+        for handler in self.handlers:
+            handler.handle_raw_input(None, self.META, self.content_length,
+                                     None, None)
+        for i, handler in enumerate(self.handlers):
+            try:
+                handler.new_file('file', self.filename,
+                                 'application/octet-stream',
+                                 self.content_length)
+            except StopFutureHandlers:
+                self.handlers = self.handlers[:i + 1]
+                break
+
+    def receive(self, data: bytes):
+        start = self.size
+        self.size += len(data)
+        for handler in self.handlers:
+            # Handlers consume the data (returning None), or pass it on
+            remaining = handler.receive_data_chunk(data, start)
+            if remaining is None:
+                break
+            data = remaining
+
+    def complete(self) -> Optional[UploadedFile]:
+        for handler in self.handlers:
+            chunk_f = handler.file_complete(self.size)
+            if chunk_f:
+                return chunk_f
+        return None
+
+    def abort(self):
+        for handler in self.handlers:
+            handler.upload_interrupted()
+
+
+def receive_raw_chunk(request, filename: str) -> Optional[UploadedFile]:
+    """Receive a raw chunk body, through the request's upload handlers"""
+    receiver = RawChunkReceiver(
+        request.upload_handlers, request.META,
+        int(request.META.get('CONTENT_LENGTH') or 0), filename)
+    receiver.start()
+    try:
+        for data in iter(lambda: request.read(64 * 1024), b''):
+            receiver.receive(data)
+    except BaseException:
+        receiver.abort()
+        raise
+    return receiver.complete()
@@ -0,0 +1,99 @@
+from datetime import datetime
+from hashlib import sha256
+from threading import Lock
+from time import monotonic
+from typing import Dict, Iterable, Optional, Tuple
+
+# Seconds after which a process forgets an upload's running hash, if it
+# hasn't touched it. Its chunks may have gone to other processes, or the
+# upload been completed or abandoned by one
+IDLE_TIMEOUT = 6 * 60 * 60
+# Seconds between checks for idle running hashes
+PRUNE_INTERVAL = 60
+
+# A received chunk's size, client's checksum, and when it was received
+ChunkIdentity = Tuple[int, Optional[str], datetime]
+
+
+class RunningHash:
+    """SHA-256 of the leading contiguous chunks of an upload.
+
+    hashlib state can't be serialized, so this lives in the process that
+    received the chunks. Whatever it hasn't seen is caught up from temp
+    storage on completion. Chunks may be replaced by other processes, so
+    it's only used if it hashed the chunks that were last received.
+    """
+    next_chunk: int  # The next chunk number to be hashed
+    size: int  # Bytes hashed so far
+    # Later chunks this process received, out of order
+    waiting: Dict[int, ChunkIdentity]
+    hashed: Dict[int, ChunkIdentity]  # The chunks hashed, by number
+
+    def __init__(self):
+        self.hasher = sha256()
+        self.next_chunk = 1
+        self.size = 0
+        self.waiting = {}
+        self.hashed = {}
+        self.lock = Lock()
+        self.touched = monotonic()
+
+    def update(self, blocks: Iterable[bytes], identity: ChunkIdentity):
+        """Hash the next chunk"""
+        for block in blocks:
+            self.size += len(block)
+            self.hasher.update(block)
+        self.hashed[self.next_chunk] = identity
+        self.next_chunk += 1
+
+    def adopt(self, hasher, identity: ChunkIdentity):
+        """Take over a copy of our hasher, that the next chunk was fed into"""
+        self.hasher = hasher
+        self.size += identity[0]
+        self.hashed[self.next_chunk] = identity
+        self.next_chunk += 1
+
+    def matches(self, received: Dict[int, ChunkIdentity]) -> bool:
+        """Whether the chunks we hashed are those that were last received
+        (by any process)
+        """
+        return all(received.get(chunk) == identity
+                   for chunk, identity in self.hashed.items())
+
+    def hexdigest(self) -> str:
+        return self.hasher.hexdigest()
+
+
+_running_hashes: Dict[int, RunningHash] = {}
+_running_hashes_lock = Lock()
+_last_pruned = monotonic()
+
+
+def get_running_hash(upload_id: int) -> RunningHash:
+    """Retrieve (or start) the running hash for an upload"""
+    with _running_hashes_lock:
+        prune_running_hashes()
+        running = _running_hashes.setdefault(upload_id, RunningHash())
+        running.touched = monotonic()
+        return running
+
+
+def prune_running_hashes():
+    """Forget running hashes that have been idle for IDLE_TIMEOUT.
+
+    Called with _running_hashes_lock held.
+    """
+    global _last_pruned
+    now = monotonic()
+    if now - _last_pruned < PRUNE_INTERVAL:
+        return
+    _last_pruned = now
+    for upload_id, running in list(_running_hashes.items()):
+        if now - running.touched > IDLE_TIMEOUT:
+            del _running_hashes[upload_id]
+
+
+def discard_running_hash(upload_id: int):
+    """Forget the running hash for an upload"""
+    with _running_hashes_lock:
+        _running_hashes.pop(upload_id, None)
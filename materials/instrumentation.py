@@ -0,0 +1,44 @@
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Iterator, Optional
+
+from django.dispatch import Signal
+
+from materials.models import Upload
+
+# Sent after each timed phase of the upload lifecycle, with the arguments:
+# phase: str, seconds: float, size: int (bytes processed), upload: Upload
+phase_timed = Signal()
+
+# Phases:
+# chunk_exists: A resumable.js chunk test
+# save_chunk: A chunk request, including receiving its body
+# complete.hash: Hashing chunks that weren't hashed as they arrived
+# complete.assemble: Assembling the chunks into storage
+# complete.cleanup: Deleting the chunks from temp storage
+PHASES = (
+    'chunk_exists', 'save_chunk',
+    'complete.hash', 'complete.assemble', 'complete.cleanup',
+)
+
+
+class Timing:
+    """A timed phase. Set failed, if it ends in an error response"""
+    failed = False
+
+
+@contextmanager
+def timed(phase: str, upload: Optional[Upload] = None,
+          size: int = 0) -> Iterator[Timing]:
+    """Time a phase, sending phase_timed if it completes successfully.
+
+    Neither its time nor its bytes are recorded if it raises, or fails.
+    """
+    timing = Timing()
+    start = perf_counter()
+    yield timing
+    if timing.failed:
+        return
+    phase_timed.send(sender=Upload, phase=phase,
+                     seconds=perf_counter() - start, size=size,
+                     upload=upload)
@@ -0,0 +1,91 @@
+import csv
+import json
+from io import StringIO
+from itertools import product
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.runner import DiscoverRunner
+
+from materials.benchmark import (
+    BACKENDS, BenchmarkError, UploadBenchmark, parse_size)
+
+
+def size_list(value):
+    return [parse_size(size) for size in value.split(',')]
+
+
+class Command(BaseCommand):
+    help = ('Benchmark uploads (create, chunks, complete) in a test '
+            'database, across file sizes, chunk sizes and storage backends')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=size_list, default='1M,16M',
+                            help='File sizes, e.g. 1M,16M,256M')
+        parser.add_argument('--chunk-sizes', type=size_list, default='1M',
+                            help='Chunk sizes, e.g. 256K,1M,8M')
+        parser.add_argument('--backends', default=','.join(BACKENDS),
+                            help='Storage backends: '
+                                 + ', '.join(BACKENDS))
+        parser.add_argument('--format', choices=('json', 'csv'),
+                            default='json')
+        parser.add_argument('--output', help='File to write results to. '
+                                             'Default: stdout')
+
+    def handle(self, *args, **options):
+        backends = options['backends'].split(',')
+        for backend in backends:
+            if backend not in BACKENDS:
+                raise CommandError(f'Unknown backend: {backend}')
+
+        # Smallest first, as peak RSS is a high-water mark
+        matrix = sorted(
+            product(options['sizes'], options['chunk_sizes'], backends))
+
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        runner.setup_test_environment()
+        old_config = runner.setup_databases()
+        try:
+            results = []
+            for size, chunk_size, backend in matrix:
+                if options['verbosity'] > 1:
+                    self.stderr.write(
+                        f'Benchmarking {backend}: {size} bytes in '
+                        f'{chunk_size} byte chunks')
+                try:
+                    result = UploadBenchmark(backend, size, chunk_size).run()
+                except BenchmarkError as e:
+                    raise CommandError(e)
+                results.append(result.as_dict())
+        finally:
+            runner.teardown_databases(old_config)
+            runner.teardown_test_environment()
+
+        output = format_results(results, options['format'])
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output, ending='')
+
+
+def format_results(results, format):
+    if format == 'json':
+        return json.dumps(results, indent=2) + '\n'
+
+    rows = [flatten(result) for result in results]
+    f = StringIO()
+    writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+    writer.writeheader()
+    writer.writerows(rows)
+    return f.getvalue()
+
+
+def flatten(result, prefix=''):
+    """Flatten nested dicts into a single CSV row"""
+    row = {}
+    for key, value in result.items():
+        if isinstance(value, dict):
+            row.update(flatten(value, f'{prefix}{key}_'))
+        else:
+            row[prefix + key] = value
+    return row
@@ -0,0 +1,59 @@
+from datetime import timedelta
+from typing import Dict
+
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+from django.utils import timezone
+
+from materials.cleanup import (
+    expire_uploads, in_batches, purge_upload, purgeable_uploads,
+    stale_uploads)
+
+
+class Command(BaseCommand):
+    help = 'Delete chunks of abandoned uploads, and purge deleted uploads'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--stale-hours', type=float, default=48,
+            help='Abandon CREATED uploads that have received nothing for '
+                 'this long')
+        parser.add_argument(
+            '--purge-days', type=float,
+            help='Purge the files of uploads deleted this long ago. '
+                 'Default: Never')
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Report what would be reclaimed, but don't "
+                                 "delete anything")
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        dry_run = options['dry_run']
+        batch_size = options['batch_size']
+
+        cutoff = now - timedelta(hours=options['stale_hours'])
+        expired, expired_bytes = 0, 0
+        for batch in in_batches(stale_uploads(cutoff), batch_size):
+            expired_bytes += expire_uploads(batch, dry_run)
+            expired += len(batch)
+        self.report(options, 'Abandoned', expired, expired_bytes)
+
+        if options['purge_days'] is not None:
+            cutoff = now - timedelta(days=options['purge_days'])
+            purged, purged_bytes = 0, 0
+            released: Dict[int, int] = {}
+            for batch in in_batches(purgeable_uploads(cutoff), batch_size):
+                for upload in batch:
+                    purged_bytes += purge_upload(upload, dry_run, released)
+                    purged += 1
+            self.report(options, 'Purged', purged, purged_bytes)
+
+    def report(self, options, action, uploads, size):
+        if options['verbosity'] == 0:
+            return
+        if options['dry_run']:
+            action = f'Would have {action.lower()}'
+        self.stdout.write(
+            f'{action} {uploads} uploads, reclaiming {size} bytes '
+            f'({filesizeformat(size)})')
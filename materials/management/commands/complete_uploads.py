@@ -0,0 +1,26 @@
+from time import sleep
+
+from django.core.management.base import BaseCommand
+
+from materials.completion import run_queued_completions
+
+
+class Command(BaseCommand):
+    help = ('Complete queued uploads (MATERIALS_COMPLETION_WORKERS = 0), '
+            'and those abandoned by crashed workers')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wait', action='store_true',
+                            help='Keep running, waiting for more uploads')
+        parser.add_argument('--interval', type=float, default=2,
+                            help='Seconds between checks, with --wait')
+
+    def handle(self, *args, **options):
+        while True:
+            ran = run_queued_completions()
+            if ran and options['verbosity'] > 0:
+                self.stdout.write(f'Completed {ran} uploads')
+            if not options['wait']:
+                break
+            if not ran:
+                sleep(options['interval'])
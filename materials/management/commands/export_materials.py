@@ -0,0 +1,51 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from materials import get_event_model
+from materials.export import EXPORT_FORMATS, current_uploads, stream_export
+
+
+class Command(BaseCommand):
+    help = ("Write an archive of events' current uploads, with a "
+            "SHA256SUMS manifest")
+
+    def add_arguments(self, parser):
+        parser.add_argument('output',
+                            help='The archive to write, or - for stdout')
+        parser.add_argument('--event', action='append', dest='events',
+                            metavar='SLUG',
+                            help='Export this event (repeatable). '
+                                 'Default: Every event')
+        parser.add_argument('--format', choices=sorted(EXPORT_FORMATS),
+                            help='Default: From the output extension, or '
+                                 'zip')
+
+    def handle(self, *args, **options):
+        output = options['output']
+        format = options['format']
+        if not format:
+            format = 'tar' if output.endswith('.tar') else 'zip'
+
+        events = None
+        if options['events']:
+            events = list(get_event_model().objects.filter(
+                slug__in=options['events']))
+            missing = set(options['events']) - {event.slug
+                                                for event in events}
+            if missing:
+                raise CommandError(
+                    f'No such events: {", ".join(sorted(missing))}')
+        uploads = current_uploads(events)
+
+        if output == '-':
+            self.write(sys.stdout.buffer, uploads, format)
+        else:
+            with open(output, 'wb') as f:
+                self.write(f, uploads, format)
+        if options['verbosity'] > 0 and output != '-':
+            self.stdout.write(f'Exported {len(uploads)} uploads to {output}')
+
+    def write(self, f, uploads, format):
+        for data in stream_export(uploads, format):
+            f.write(data)
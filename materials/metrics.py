@@ -0,0 +1,133 @@
+from threading import Lock
+from typing import Dict, List
+
+from django.conf import settings
+from django.db.models import Count, Q, Sum
+
+from materials.instrumentation import PHASES
+from materials.models import Chunk, Upload, UploadStates
+
+# Seconds
+BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300,
+)
+
+
+def metrics_enabled() -> bool:
+    """settings.MATERIALS_METRICS: Record phase timings, and serve them
+    (in Prometheus text format) at /metrics
+    """
+    return getattr(settings, 'MATERIALS_METRICS', False)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts: List[int] = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class PhaseMetrics:
+    """Timings of upload phases, in this process.
+
+    Each process (worker) keeps its own, so scrape them all.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.clear()
+
+    def clear(self):
+        self.seconds: Dict[str, Histogram] = {}
+        self.bytes: Dict[str, int] = {}
+
+    def record(self, phase: str, seconds: float, size: int):
+        with self.lock:
+            if phase not in self.seconds:
+                self.seconds[phase] = Histogram()
+                self.bytes[phase] = 0
+            self.seconds[phase].observe(seconds)
+            self.bytes[phase] += size
+
+
+phase_metrics = PhaseMetrics()
+
+
+def record_phase(sender, phase, seconds, size, **kwargs):
+    """phase_timed receiver"""
+    if metrics_enabled():
+        phase_metrics.record(phase, seconds, size)
+
+
+def upload_state_counts() -> Dict[str, int]:
+    """Number of (non-deleted) uploads in each state"""
+    counts = Upload.objects.aggregate(
+        created=Count('id', filter=Q(uploaded__isnull=True,
+                                     deleted__isnull=True)),
+        uploaded=Count('id', filter=Q(uploaded__isnull=False,
+                                      deleted__isnull=True)),
+    )
+    return {
+        UploadStates.CREATED: counts['created'],
+        UploadStates.UPLOADED: counts['uploaded'],
+    }
+
+
+def temp_storage_bytes() -> int:
+    """Bytes of received chunks, held in temp storage"""
+    return Chunk.objects.aggregate(size=Sum('size'))['size'] or 0
+
+
+def render_metrics() -> str:
+    """All metrics, in Prometheus text exposition format"""
+    lines = [
+        '# HELP materials_phase_seconds Duration of upload phases',
+        '# TYPE materials_phase_seconds histogram',
+    ]
+    with phase_metrics.lock:
+        phases = sorted(phase_metrics.seconds,
+                        key=lambda phase: (phase not in PHASES, phase))
+        for phase in phases:
+            histogram = phase_metrics.seconds[phase]
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                lines.append(f'materials_phase_seconds_bucket'
+                             f'{{phase="{phase}",le="{bound}"}} {count}')
+            lines += [
+                f'materials_phase_seconds_bucket'
+                f'{{phase="{phase}",le="+Inf"}} {histogram.count}',
+                f'materials_phase_seconds_sum{{phase="{phase}"}} '
+                f'{histogram.sum}',
+                f'materials_phase_seconds_count{{phase="{phase}"}} '
+                f'{histogram.count}',
+            ]
+        lines += [
+            '# HELP materials_phase_bytes_total Bytes processed by upload '
+            'phases. rate() for bytes/sec',
+            '# TYPE materials_phase_bytes_total counter',
+        ]
+        for phase in phases:
+            lines.append(f'materials_phase_bytes_total{{phase="{phase}"}} '
+                         f'{phase_metrics.bytes[phase]}')
+
+    lines += [
+        '# HELP materials_uploads Uploads (not deleted) by state',
+        '# TYPE materials_uploads gauge',
+    ]
+    for state, count in upload_state_counts().items():
+        lines.append(f'materials_uploads{{state="{state}"}} {count}')
+
+    lines += [
+        '# HELP materials_temp_storage_bytes Bytes of received chunks in '
+        'temp storage',
+        '# TYPE materials_temp_storage_bytes gauge',
+        f'materials_temp_storage_bytes {temp_storage_bytes()}',
+    ]
+    return '\n'.join(lines) + '\n'
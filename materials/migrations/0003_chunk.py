@@ -0,0 +1,28 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materials', '0002_completionjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Chunk',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('size', models.PositiveIntegerField()),
+                ('received', models.DateTimeField(auto_now=True)),
+                ('upload', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='materials.upload')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='chunk',
+            constraint=models.UniqueConstraint(fields=('upload', 'number'), name='unique_upload_chunk'),
+        ),
+    ]
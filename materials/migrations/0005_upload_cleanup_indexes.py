@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materials', '0004_blob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='upload',
+            index=models.Index(condition=models.Q(('deleted__isnull', True), ('uploaded__isnull', True)), fields=['created'], name='upload_incomplete_created'),
+        ),
+        migrations.AddIndex(
+            model_name='upload',
+            index=models.Index(condition=models.Q(('deleted__isnull', False)), fields=['deleted'], name='upload_deleted'),
+        ),
+    ]
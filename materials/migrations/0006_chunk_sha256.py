@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materials', '0005_upload_cleanup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chunk',
+            name='sha256',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 13:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materials', '0006_chunk_sha256'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='upload',
+            name='chunk_digests',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.25 on 2026-10-18 13:16
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.MATERIALS_EVENT_MODEL),
+        ('materials', '0007_upload_chunk_digests'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='upload',
+            index=models.Index(fields=['event', '-created'], name='upload_event_created'),
+        ),
+        migrations.AddIndex(
+            model_name='upload',
+            index=models.Index(condition=models.Q(('deleted__isnull', True)), fields=['event', 'material_id'], name='upload_live_material'),
+        ),
+        migrations.AddIndex(
+            model_name='upload',
+            index=models.Index(condition=models.Q(('uploaded__isnull', False)), fields=['event', 'material_id', '-uploaded'], name='upload_material_uploaded'),
+        ),
+        # Covered by upload_event_created, so dropped once it's in place
+        migrations.AlterField(
+            model_name='upload',
+            name='event',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.RESTRICT, to=settings.MATERIALS_EVENT_MODEL),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 13:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materials', '0008_upload_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='upload',
+            name='fingerprint',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
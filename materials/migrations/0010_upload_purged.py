@@ -0,0 +1,26 @@
+# Generated by Django 3.2.25 on 2026-10-18 13:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materials', '0009_upload_fingerprint'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='upload',
+            name='upload_deleted',
+        ),
+        migrations.AddField(
+            model_name='upload',
+            name='purged',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='upload',
+            index=models.Index(condition=models.Q(('deleted__isnull', False), ('purged__isnull', True)), fields=['deleted'], name='upload_deleted'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.25 on 2026-10-18 13:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materials', '0010_upload_purged'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='blob',
+            name='size',
+            field=models.BigIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='chunk',
+            name='size',
+            field=models.PositiveBigIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='upload',
+            name='size',
+            field=models.BigIntegerField(),
+        ),
+    ]
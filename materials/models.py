@@ -1,6 +1,10 @@
+from typing import Optional
+
 from django.db.models import (
-    CASCADE, RESTRICT, CharField, DateTimeField, ForeignKey, IntegerField,
-    Model, TextChoices, TextField)
+    CASCADE, PROTECT, RESTRICT, BigIntegerField, CharField, DateTimeField,
+    ForeignKey, Index, JSONField, Model, PositiveBigIntegerField,
+    PositiveIntegerField, PositiveSmallIntegerField, Q, TextChoices,
+    TextField, UniqueConstraint)
 from django.contrib.auth import get_user_model
 from django.utils.translation import gettext_lazy as _
 
@@ -14,19 +18,62 @@ class UploadStates(TextChoices):
     DELETED = 'DELETED', _('Deleted')
 
 
+class Blob(Model):
+    """Content-addressed material, shared by identical Uploads"""
+    id: int
+    sha256: CharField = CharField(max_length=64, unique=True)
+    name: CharField = CharField(max_length=255)  # In storage
+    size: BigIntegerField = BigIntegerField()
+    references: PositiveIntegerField = PositiveIntegerField(default=0)
+    created: DateTimeField = DateTimeField(auto_now_add=True)
+
+
 class Upload(Model):
     id: int
-    event: ForeignKey = ForeignKey(get_event_model(), on_delete=RESTRICT)
+    # Indexed by upload_event_created
+    event: ForeignKey = ForeignKey(get_event_model(), on_delete=RESTRICT,
+                                   db_index=False)
+    event_id: int
     material_id: CharField = CharField(max_length=32)
     filename: CharField = CharField(max_length=128)
     sha256: CharField = CharField(max_length=64, blank=True, null=True)
-    size: IntegerField = IntegerField()
+    size: BigIntegerField = BigIntegerField()  # Materials can exceed 2 GiB
     uploader: ForeignKey = ForeignKey(get_user_model(), on_delete=RESTRICT,
                                       blank=True, null=True)  # FIXME: auth
     created: DateTimeField = DateTimeField(auto_now_add=True)
     updated: DateTimeField = DateTimeField(auto_now=True)
     uploaded: DateTimeField = DateTimeField(blank=True, null=True)
     deleted: DateTimeField = DateTimeField(blank=True, null=True)
+    # When its file (or chunks) were deleted, long after the upload was
+    purged: DateTimeField = DateTimeField(blank=True, null=True)
+    blob: ForeignKey = ForeignKey(Blob, on_delete=PROTECT,
+                                  blank=True, null=True)
+    blob_id: Optional[int]
+    # [size, sha256] of each chunk, for delta re-uploads to reuse
+    chunk_digests: JSONField = JSONField(blank=True, null=True)
+    # The client's sha256 of its first chunk, to only resume the same file
+    fingerprint: CharField = CharField(max_length=64, blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # An event's uploads, newest first, for its summary
+            Index(fields=['event', '-created'], name='upload_event_created'),
+            # The current uploads of an event's material, for superseding
+            # and resuming them, and counting them in the event list
+            Index(fields=['event', 'material_id'],
+                  name='upload_live_material',
+                  condition=Q(deleted__isnull=True)),
+            # The latest completed upload of a material, for delta
+            # re-uploads and exports
+            Index(fields=['event', 'material_id', '-uploaded'],
+                  name='upload_material_uploaded',
+                  condition=Q(uploaded__isnull=False)),
+            # For finding abandoned, and long-deleted (unpurged) uploads
+            Index(fields=['created'], name='upload_incomplete_created',
+                  condition=Q(uploaded__isnull=True, deleted__isnull=True)),
+            Index(fields=['deleted'], name='upload_deleted',
+                  condition=Q(deleted__isnull=False, purged__isnull=True)),
+        ]
 
     @property
     def state(self) -> str:
@@ -42,10 +89,29 @@ class Upload(Model):
 
     @property
     def storage_path(self) -> str:
+        if self.blob_id:
+            return self.blob.name
         extension = self.filename.rsplit('.', 1)[-1]
         return f'{self.event.slug}-{self.material_id}-{self.id}.{extension}'
 
 
+class Chunk(Model):
+    """A chunk of an Upload, received into temp storage"""
+    upload: ForeignKey = ForeignKey(Upload, on_delete=CASCADE,
+                                    related_name='chunks')
+    number: PositiveIntegerField = PositiveIntegerField()  # 1-indexed
+    size: PositiveBigIntegerField = PositiveBigIntegerField()
+    # The client's checksum, verified on receipt
+    sha256: CharField = CharField(max_length=64, blank=True, null=True)
+    received: DateTimeField = DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=['upload', 'number'],
+                             name='unique_upload_chunk'),
+        ]
+
+
 class Review(Model):
     class Actions(TextChoices):
         ACCEPT = 'A', _('Accept')
@@ -53,8 +119,35 @@ class Review(Model):
         REJECT = 'R', _('Reject')
 
     upload: ForeignKey = ForeignKey(Upload, on_delete=CASCADE)
+    upload_id: int
     action: CharField = CharField(max_length=1, choices=Actions.choices)
     comment: TextField = TextField(blank=True)
     reviewer: ForeignKey = ForeignKey(get_user_model(), on_delete=RESTRICT)
     created: DateTimeField = DateTimeField(auto_now_add=True)
     updated: DateTimeField = DateTimeField(auto_now=True)
+
+
+class CompletionStates(TextChoices):
+    QUEUED = 'QUEUED', _('Queued')
+    RUNNING = 'RUNNING', _('Running')
+    DONE = 'DONE', _('Done')
+    FAILED = 'FAILED', _('Failed')
+
+
+class CompletionJob(Model):
+    """Assembly of an Upload's chunks, possibly in the background"""
+    id: int
+    upload: ForeignKey = ForeignKey(Upload, on_delete=CASCADE)
+    upload_id: int
+    state: CharField = CharField(max_length=8,
+                                 choices=CompletionStates.choices,
+                                 default=CompletionStates.QUEUED)
+    progress: PositiveSmallIntegerField = PositiveSmallIntegerField(
+        default=0)  # Percentage of chunks assembled
+    error: TextField = TextField(blank=True)
+    created: DateTimeField = DateTimeField(auto_now_add=True)
+    updated: DateTimeField = DateTimeField(auto_now=True)
+
+    @property
+    def finished(self) -> bool:
+        return self.state in (CompletionStates.DONE, CompletionStates.FAILED)
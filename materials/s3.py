@@ -0,0 +1,66 @@
+"""Storage for S3-compatible object stores, that assembles uploads without
+downloading their chunks.
+
+Requires django-storages and boto3. Configure with the usual AWS_* settings
+and:
+
+    MATERIALS_STORAGE = 'materials.s3.S3ComposingStorage'
+    MATERIALS_TEMP_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
+"""
+from typing import Iterable, List
+
+from storages.backends.s3boto3 import S3Boto3Storage  # type: ignore
+from storages.utils import clean_name  # type: ignore
+
+from materials.storage import ComposingStorage
+
+# S3's limits on multipart uploads. Every part but the last must be at
+# least MIN_PART_SIZE
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+
+
+class S3ComposingStorage(ComposingStorage, S3Boto3Storage):
+    """Assembles uploads as S3 multipart uploads, with each chunk in temp
+    storage copied into a part by the server (UploadPartCopy).
+    """
+
+    def can_compose(self, temp_storage, sizes: List[int]) -> bool:
+        if not isinstance(temp_storage, S3Boto3Storage):
+            return False
+        if temp_storage.endpoint_url != self.endpoint_url:
+            return False
+        return (0 < len(sizes) <= MAX_PARTS
+                and all(size >= MIN_PART_SIZE for size in sizes[:-1]))
+
+    def compose(self, temp_storage, chunk_paths: Iterable[str],
+                name: str) -> str:
+        name = self.get_available_name(name)
+        key = self._normalize_name(clean_name(name))
+        client = self.connection.meta.client
+        multipart = client.create_multipart_upload(
+            Bucket=self.bucket_name, Key=key,
+            **self._get_write_parameters(name))
+        upload_id = multipart['UploadId']
+        parts = []
+        try:
+            for number, path in enumerate(chunk_paths, 1):
+                source = {
+                    'Bucket': temp_storage.bucket_name,
+                    'Key': temp_storage._normalize_name(clean_name(path)),
+                }
+                part = client.upload_part_copy(
+                    Bucket=self.bucket_name, Key=key, UploadId=upload_id,
+                    PartNumber=number, CopySource=source)
+                parts.append({
+                    'PartNumber': number,
+                    'ETag': part['CopyPartResult']['ETag'],
+                })
+            client.complete_multipart_upload(
+                Bucket=self.bucket_name, Key=key, UploadId=upload_id,
+                MultipartUpload={'Parts': parts})
+        except BaseException:
+            client.abort_multipart_upload(
+                Bucket=self.bucket_name, Key=key, UploadId=upload_id)
+            raise
+        return name
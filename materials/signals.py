@@ -0,0 +1,40 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from materials import get_event_model
+from materials.blobs import release_blob
+from materials.event_list import invalidate_event_list
+from materials.instrumentation import phase_timed
+from materials.metrics import record_phase
+from materials.models import Review, Upload
+from materials.summary import invalidate_event_summary
+from materials.upload import invalidate_active_upload
+
+
+@receiver(post_save, sender=Upload)
+@receiver(post_delete, sender=Upload)
+def upload_changed(sender, instance, **kwargs):
+    invalidate_event_summary(instance.event_id)
+    invalidate_active_upload(instance.id)
+    invalidate_event_list()
+
+
+@receiver(post_save, sender=get_event_model())
+@receiver(post_delete, sender=get_event_model())
+def event_changed(sender, instance, **kwargs):
+    invalidate_event_list()
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def review_changed(sender, instance, **kwargs):
+    invalidate_event_summary(instance.upload.event_id)
+
+
+@receiver(post_delete, sender=Upload)
+def upload_deleted(sender, instance, **kwargs):
+    if instance.blob_id:
+        release_blob(instance.blob_id)
+
+
+phase_timed.connect(record_phase)
@@ -1,5 +1,37 @@
+import errno
+import os
+from secrets import token_hex
+from shutil import copyfileobj
+from tempfile import TemporaryFile
+from typing import Iterable, List, Optional
+
 from django.conf import settings
-from django.core.files.storage import get_storage_class
+from django.core.files.storage import FileSystemStorage, get_storage_class
+
+# Errors that mean a kernel-side copy isn't available for these files
+COPY_FALLBACK_ERRNOS = {
+    errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.EXDEV, errno.EBADF,
+    errno.ENOTSUP,
+}
+
+
+class ComposingStorage:
+    """Capability interface, for storage backends that can assemble a file
+    from objects in temp storage themselves, without the data passing
+    through us (e.g. object storage multipart uploads or composition).
+    """
+
+    def can_compose(self, temp_storage, sizes: List[int]) -> bool:
+        """Can chunks of sizes, in temp_storage, be composed?"""
+        raise NotImplementedError()
+
+    def compose(self, temp_storage, chunk_paths: Iterable[str],
+                name: str) -> str:
+        """Assemble chunks from temp_storage into name.
+
+        Returns the name the file was saved as.
+        """
+        raise NotImplementedError()
 
 
 def get_storage():
@@ -16,3 +48,145 @@ def get_chunk_path(upload, chunk):
     """Temporary chunk filename"""
     return (f'{upload.event.slug}-{upload.material_id}-{upload.id}-'
             f'{chunk:03}.part')
+
+
+def get_partial_path(upload):
+    """Temporary filename for an upload assembled in place"""
+    return f'{upload.event.slug}-{upload.material_id}-{upload.id}.partial'
+
+
+def assemble_chunks(chunk_paths: Iterable[str], name: str,
+                    sizes: Optional[List[int]] = None) -> str:
+    """Concatenate chunks from temp storage into name, in storage.
+
+    Given the chunks' sizes, storage may compose them itself.
+    Returns the name the file was saved as.
+    """
+    temp_storage = get_temp_storage()
+    storage = get_storage()
+    if (sizes is not None and isinstance(storage, ComposingStorage)
+            and storage.can_compose(temp_storage, sizes)):
+        return storage.compose(temp_storage, chunk_paths, name)
+    if (isinstance(storage, FileSystemStorage)
+            and isinstance(temp_storage, FileSystemStorage)):
+        return assemble_local_chunks(temp_storage, storage, chunk_paths, name)
+
+    with TemporaryFile() as temp_f:
+        for path in chunk_paths:
+            with temp_storage.open(path, 'rb') as chunk_f:
+                copyfileobj(chunk_f, temp_f, 1024*1024)
+        temp_f.seek(0)
+        return storage.save(name, temp_f)
+
+
+def assemble_local_chunks(temp_storage: FileSystemStorage,
+                          storage: FileSystemStorage,
+                          chunk_paths: Iterable[str], name: str) -> str:
+    """Concatenate chunks between filesystem storages, in the kernel.
+
+    The file is assembled alongside its final location, and renamed into
+    place, so it never appears partially written.
+    """
+    name, target = prepare_local_target(storage, name)
+    directory = os.path.dirname(target)
+    partial = os.path.join(
+        directory, f'.{os.path.basename(target)}.{token_hex(4)}.partial')
+    out_fd = os.open(partial, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        try:
+            for path in chunk_paths:
+                in_fd = os.open(temp_storage.path(path), os.O_RDONLY)
+                try:
+                    copy_fd(in_fd, out_fd, os.fstat(in_fd).st_size)
+                finally:
+                    os.close(in_fd)
+        finally:
+            os.close(out_fd)
+        if storage.file_permissions_mode is not None:
+            os.chmod(partial, storage.file_permissions_mode)
+        os.rename(partial, target)
+    except BaseException:
+        os.unlink(partial)
+        raise
+    return name
+
+
+def move_temp_file(temp_name: str, name: str) -> str:
+    """Move a complete file from temp storage into storage.
+
+    Returns the name the file was saved as.
+    """
+    temp_storage = get_temp_storage()
+    storage = get_storage()
+    if (isinstance(storage, FileSystemStorage)
+            and isinstance(temp_storage, FileSystemStorage)):
+        name, target = prepare_local_target(storage, name)
+        try:
+            os.rename(temp_storage.path(temp_name), target)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+        else:
+            if storage.file_permissions_mode is not None:
+                os.chmod(target, storage.file_permissions_mode)
+            return name
+
+    name = assemble_chunks([temp_name], name)
+    temp_storage.delete(temp_name)
+    return name
+
+
+def prepare_local_target(storage: FileSystemStorage, name: str):
+    """Find an available name in storage, and create its directory.
+
+    Returns the name and its filesystem path.
+    """
+    name = storage.get_available_name(name)
+    target = storage.path(name)
+    directory = os.path.dirname(target)
+    os.makedirs(directory, exist_ok=True)
+    if storage.directory_permissions_mode is not None:
+        os.chmod(directory, storage.directory_permissions_mode)
+    return name, target
+
+
+def _copy_file_range(in_fd: int, out_fd: int, offset: int, count: int) -> int:
+    return os.copy_file_range(  # type: ignore[attr-defined]
+        in_fd, out_fd, count, offset_src=offset)
+
+
+def _sendfile(in_fd: int, out_fd: int, offset: int, count: int) -> int:
+    return os.sendfile(out_fd, in_fd, offset, count)
+
+
+def _read_write(in_fd: int, out_fd: int, offset: int, count: int) -> int:
+    block = os.pread(in_fd, min(count, 1024*1024), offset)
+    view = memoryview(block)
+    while view:
+        view = view[os.write(out_fd, view):]
+    return len(block)
+
+
+def copy_fd(in_fd: int, out_fd: int, count: int) -> int:
+    """Append count bytes from in_fd to out_fd.
+
+    Prefers copy_file_range (which can reflink, or copy without leaving the
+    kernel), then sendfile, before falling back to copying through userspace.
+    Returns the number of bytes copied.
+    """
+    offset = 0
+    for copy in (_copy_file_range, _sendfile, _read_write):
+        try:
+            while offset < count:
+                copied = copy(in_fd, out_fd, offset, count - offset)
+                if not copied:
+                    return offset
+                offset += copied
+            return offset
+        except AttributeError:
+            # Not available on this platform / Python
+            continue
+        except OSError as e:
+            if copy is _read_write or e.errno not in COPY_FALLBACK_ERRNOS:
+                raise
+    return offset
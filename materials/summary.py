@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from materials.models import Upload
+
+
+def get_summary_cache_key(event_id: int) -> str:
+    return f'materials:event-summary:{event_id}'
+
+
+def get_summary_cache_timeout() -> int:
+    return getattr(settings, 'MATERIALS_SUMMARY_CACHE_TIMEOUT', 300)
+
+
+def get_summary_context(event):
+    """An event's current uploads, by material, and its deleted uploads.
+
+    In a fixed number of queries, however many materials are configured.
+    """
+    current = {}
+    deleted_uploads = []
+    for upload in Upload.objects.filter(event=event).order_by(
+            '-created').prefetch_related('review_set'):
+        if upload.deleted:
+            deleted_uploads.append(upload)
+        else:
+            current.setdefault(upload.material_id, upload)
+
+    current_uploads = []
+    for mat_set in settings.MATERIALS:
+        material = mat_set.copy()
+        material['upload'] = current.get(material['id'])
+        material['reviews'] = []
+        if material['upload']:
+            material['reviews'] = material['upload'].review_set.all()
+        current_uploads.append(material)
+
+    return {
+        'event': event,
+        'current_uploads': current_uploads,
+        'deleted_uploads': deleted_uploads,
+    }
+
+
+def render_event_summary(event) -> str:
+    """The rendered uploads and reviews of an event, cached"""
+    key = get_summary_cache_key(event.pk)
+    summary = cache.get(key)
+    if summary is None:
+        summary = render_to_string('materials/event_summary.html',
+                                   get_summary_context(event))
+        cache.set(key, summary, get_summary_cache_timeout())
+    return mark_safe(summary)
+
+
+def invalidate_event_summary(event_id: int):
+    cache.delete(get_summary_cache_key(event_id))
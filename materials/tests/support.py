@@ -1,10 +1,14 @@
 from io import BytesIO, StringIO
+from tempfile import TemporaryDirectory
 from typing import Dict
 
-from django.test import TestCase, override_settings
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.core.files import File
 from django.core.files.storage import Storage
 
+from materials import hashing
+
 
 class InMemoryStorage(Storage):
     """An in-memory Django storage engine, for use in tests"""
@@ -28,6 +32,7 @@ class InMemoryStorage(Storage):
 
     def _save(self, name, content):
         self._files[name] = content.read()
+        return name
 
     def delete(self, name):
         del self._files[name]
@@ -39,9 +44,62 @@ class InMemoryStorage(Storage):
         return len(self._files[name])
 
 
+# Our test uploads aren't real PDFs or videos, so skip magic_bytes
+TEST_MATERIALS = (
+    {
+        'id': 'slides',
+        'name': 'Slides',
+        'extensions': ['pdf', 'odp', 'zip'],
+        'validators': [
+            'materials.validators.filename',
+            'materials.validators.size',
+        ],
+    }, {
+        'id': 'video',
+        'name': 'Video',
+        'extensions': ['mp4', 'webm'],
+        'validators': [
+            'materials.validators.filename',
+            'materials.validators.size',
+        ],
+    },
+)
+
+
 @override_settings(
+    MATERIALS=TEST_MATERIALS,
     MATERIALS_STORAGE='materials.tests.support.InMemoryStorage',
     MATERIALS_TEMP_STORAGE='materials.tests.support.InMemoryStorage')
 class MockStorageTestCase(TestCase):
     def setUp(self):
         InMemoryStorage.wipe()
+        hashing._running_hashes.clear()
+        cache.clear()
+
+
+class FileSystemStorageMixin:
+    """Store materials in a temporary MEDIA_ROOT"""
+    def setUp(self):
+        super().setUp()
+        hashing._running_hashes.clear()
+        cache.clear()
+        media_root = TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.media_root = media_root.name
+        settings = override_settings(
+            MATERIALS=TEST_MATERIALS,
+            MEDIA_ROOT=self.media_root,
+            MATERIALS_STORAGE='django.core.files.storage.FileSystemStorage',
+            MATERIALS_TEMP_STORAGE=(
+                'django.core.files.storage.FileSystemStorage'))
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+
+class FileSystemStorageTestCase(FileSystemStorageMixin, TestCase):
+    pass
+
+
+class FileSystemStorageTransactionTestCase(FileSystemStorageMixin,
+                                           TransactionTestCase):
+    """For code that uses the database from other threads"""
@@ -0,0 +1,112 @@
+import os
+from io import BytesIO
+from tempfile import TemporaryDirectory
+
+from django.test import Client, override_settings
+
+from materials import get_event_model
+from materials.admission import Busy, admitted
+from materials.models import CompletionJob, CompletionStates, Upload
+from materials.tests.support import MockStorageTestCase
+from materials.tests.test_resumable_uploads import make_args
+
+LIMITS = {
+    'chunk': {'global': 2, 'per_event': 1},
+    'complete': {'global': 1},
+}
+
+
+class AdmissionTestCase(MockStorageTestCase):
+    def setUp(self):
+        super().setUp()
+        lock_dir = TemporaryDirectory()
+        self.addCleanup(lock_dir.cleanup)
+        self.lock_dir = lock_dir.name
+        settings = override_settings(MATERIALS_CONCURRENCY=LIMITS,
+                                     MATERIALS_CONCURRENCY_WAIT=0,
+                                     MATERIALS_RETRY_AFTER=3,
+                                     MATERIALS_LOCK_DIR=self.lock_dir)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+
+class AdmittedTestCase(AdmissionTestCase):
+    def test_unlimited(self):
+        with admitted('other', 1, wait=0):
+            with admitted('other', 1, wait=0):
+                pass
+        self.assertEqual(os.listdir(self.lock_dir), [])
+
+    def test_per_event(self):
+        with admitted('chunk', 1, wait=0):
+            with self.assertRaises(Busy) as cm:
+                with admitted('chunk', 1, wait=0):
+                    pass
+            self.assertEqual(cm.exception.retry_after, 3)
+            with admitted('chunk', 2, wait=0):
+                pass
+
+    def test_global(self):
+        with admitted('chunk', 1, wait=0), admitted('chunk', 2, wait=0):
+            with self.assertRaises(Busy):
+                with admitted('chunk', 3, wait=0):
+                    pass
+
+    def test_released(self):
+        with admitted('complete', 1, wait=0):
+            pass
+        with admitted('complete', 1, wait=0):
+            pass
+
+    def test_released_on_error(self):
+        with self.assertRaises(ValueError):
+            with admitted('complete', 1, wait=0):
+                raise ValueError()
+        with admitted('complete', 1, wait=0):
+            pass
+
+
+class AdmissionViewTestCase(AdmissionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.event = get_event_model().objects.create(
+            title='test', slug='test')
+        self.upload = Upload.objects.create(
+            event=self.event, material_id='slides', filename='test.pdf',
+            size=1024)
+        self.client = Client()
+
+    def post_chunk(self):
+        return self.client.post(
+            '/events/test/upload/slides?'
+            + make_args(resumableIdentifier=self.upload.id),
+            {'file': BytesIO(b'\xde\xad\xbe\xef' * 256)})
+
+    def complete(self):
+        return self.client.post('/events/test/upload/slides',
+                                {'action': 'complete',
+                                 'identifier': self.upload.id})
+
+    def test_chunk_busy(self):
+        with admitted('chunk', self.event.id, wait=0):
+            r = self.post_chunk()
+        self.assertEqual(r.status_code, 503)
+        self.assertEqual(r['Retry-After'], '3')
+        r = self.post_chunk()
+        self.assertEqual(r.status_code, 201)
+
+    def test_complete_busy(self):
+        self.post_chunk()
+        with admitted('complete', self.event.id, wait=0):
+            r = self.complete()
+        self.assertEqual(r.status_code, 503)
+        self.assertEqual(r['Retry-After'], '3')
+        self.assertEqual(r.json()['state'], 'CREATED')
+        job = CompletionJob.objects.get()
+        self.assertEqual(job.state, CompletionStates.QUEUED)
+
+        # Retrying runs the queued job
+        r = self.complete()
+        self.assertEqual(r.status_code, 201)
+        self.assertEqual(r.json()['job'], job.id)
+        self.assertEqual(r.json()['state'], 'UPLOADED')
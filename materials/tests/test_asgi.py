@@ -0,0 +1,209 @@
+import asyncio
+import os
+from tempfile import TemporaryDirectory
+from threading import Event
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.core.exceptions import PermissionDenied
+from django.test import Client, override_settings
+
+from materials import get_event_model
+from materials.asgi import StreamingChunkMiddleware, in_db_thread, in_thread
+from materials.models import Chunk, Upload
+from materials.storage import get_chunk_path
+from materials.upload import ResumableUpload
+from materials.tests.support import (
+    FileSystemStorageTestCase, FileSystemStorageTransactionTestCase)
+from materials.tests.test_resumable_uploads import make_args
+
+DATA = b'\xde\xad\xbe\xef' * 64
+CSRF_TOKEN = 'a' * 32
+
+
+async def django_application(scope, receive, send):
+    await send({'type': 'http.response.start', 'status': 418,
+                'headers': []})
+    await send({'type': 'http.response.body', 'body': b'django'})
+
+
+class StreamingChunkMiddlewareTestCase(FileSystemStorageTransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        event = get_event_model().objects.create(title='test', slug='test')
+        self.upload = Upload.objects.create(
+            event=event, material_id='slides', filename='test.pdf',
+            size=1024)
+        self.middleware = StreamingChunkMiddleware(django_application)
+
+    def request(self, method, path, query_string='', body=(), headers=()):
+        """Make a request through the middleware.
+
+        body is sent as a series of messages.
+        """
+        scope = self.scope(method, path, query_string, headers)
+        messages = [{'type': 'http.request', 'body': part, 'more_body': True}
+                    for part in body]
+        messages.append({'type': 'http.request', 'body': b''})
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        async_to_sync(self.middleware)(scope, receive, send)
+        start, body = sent
+        return start['status'], dict(start['headers']), body['body']
+
+    def scope(self, method, path, query_string='', headers=()):
+        return {
+            'type': 'http',
+            'method': method,
+            'path': path,
+            'query_string': query_string.encode('ascii'),
+            'headers': [(name.encode('ascii'), value.encode('ascii'))
+                        for name, value in headers],
+            'server': ('testserver', 80),
+            'client': ('127.0.0.1', 12345),
+        }
+
+    def chunk_args(self, chunk=1):
+        return make_args(resumableIdentifier=self.upload.id,
+                         resumableChunkSize=256,
+                         resumableTotalChunks=4,
+                         resumableChunkNumber=chunk)
+
+    def chunk_headers(self, csrf=True):
+        headers = [('content-type', 'application/octet-stream'),
+                   ('content-length', str(len(DATA))),
+                   ('cookie', 'csrftoken=' + CSRF_TOKEN)]
+        if csrf:
+            headers.append(('x-csrftoken', CSRF_TOKEN))
+        return headers
+
+    def post_chunk(self, chunk=1, csrf=True):
+        return self.request(
+            'POST', '/events/test/upload/slides', self.chunk_args(chunk),
+            body=[DATA[:100], DATA[100:]], headers=self.chunk_headers(csrf))
+
+    def test_post_chunk(self):
+        status, headers, body = self.post_chunk()
+        self.assertEqual(status, 201)
+        chunk = Chunk.objects.get()
+        self.assertEqual(chunk.size, 256)
+        path = os.path.join(self.media_root, get_chunk_path(self.upload, 1))
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), DATA)
+
+    def test_get_chunk(self):
+        status, headers, body = self.request(
+            'GET', '/events/test/upload/slides', self.chunk_args())
+        self.assertEqual(status, 204)
+        self.post_chunk()
+        status, headers, body = self.request(
+            'GET', '/events/test/upload/slides', self.chunk_args())
+        self.assertEqual(status, 200)
+
+    def test_post_chunk_superseded(self):
+        self.upload.deleted = self.upload.created
+        self.upload.save()
+        status, headers, body = self.post_chunk()
+        self.assertEqual(status, 403)
+        self.assertFalse(Chunk.objects.exists())
+
+    def test_post_chunk_requires_csrf(self):
+        status, headers, body = self.post_chunk(csrf=False)
+        self.assertEqual(status, 403)
+        self.assertFalse(Chunk.objects.exists())
+
+    def test_post_chunk_releases_slot(self):
+        lock_dir = TemporaryDirectory()
+        self.addCleanup(lock_dir.cleanup)
+        settings = override_settings(
+            MATERIALS_CONCURRENCY={'chunk': {'global': 1}},
+            MATERIALS_CONCURRENCY_WAIT=0, MATERIALS_LOCK_DIR=lock_dir.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        with mock.patch.object(ResumableUpload, 'get_upload_handler',
+                               side_effect=PermissionDenied('No')):
+            status, headers, body = self.post_chunk()
+        self.assertEqual(status, 403)
+        status, headers, body = self.post_chunk()
+        self.assertEqual(status, 201)
+
+    def test_post_chunk_cancelled_while_queueing(self):
+        queueing, admit = Event(), Event()
+
+        def enter_slot():
+            queueing.set()
+            admit.wait(5)
+
+        admission = mock.MagicMock()
+        admission.__enter__.side_effect = enter_slot
+        scope = self.scope('POST', '/events/test/upload/slides',
+                           self.chunk_args(), self.chunk_headers())
+
+        async def cancel():
+            task = asyncio.ensure_future(self.middleware(scope, None, None))
+            await in_thread(queueing.wait)(5)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            # The thread still gets its slot, which is then released
+            self.assertFalse(admission.__exit__.called)
+            admit.set()
+            for _ in range(100):
+                if admission.__exit__.called:
+                    break
+                await asyncio.sleep(0.01)
+
+        with mock.patch('materials.asgi.admitted', return_value=admission):
+            async_to_sync(cancel)()
+        admission.__exit__.assert_called_once_with(None, None, None)
+        self.assertFalse(Chunk.objects.exists())
+
+    def test_closes_old_connections(self):
+        with mock.patch('materials.asgi.close_old_connections') as close:
+            during = async_to_sync(in_db_thread(lambda: close.call_count))()
+        # Before and after
+        self.assertEqual((during, close.call_count), (1, 2))
+
+    def test_passed_through(self):
+        status, headers, body = self.request('GET', '/events/test/')
+        self.assertEqual((status, body), (418, b'django'))
+        # Multipart chunks are left to Django
+        status, headers, body = self.request(
+            'POST', '/events/test/upload/slides', self.chunk_args(),
+            headers=[('content-type', 'multipart/form-data; boundary=x')])
+        self.assertEqual(status, 418)
+
+
+class RawChunkTestCase(FileSystemStorageTestCase):
+    """resumable.js method: 'octet', under WSGI"""
+    def setUp(self):
+        super().setUp()
+        event = get_event_model().objects.create(title='test', slug='test')
+        self.upload = Upload.objects.create(
+            event=event, material_id='slides', filename='test.pdf',
+            size=1024)
+
+    def test_upload(self):
+        c = Client()
+        for i in range(4):
+            r = c.post('/events/test/upload/slides?' + make_args(
+                           resumableIdentifier=self.upload.id,
+                           resumableChunkSize=256,
+                           resumableTotalChunks=4,
+                           resumableChunkNumber=i + 1),
+                       data=DATA,
+                       content_type='application/octet-stream')
+            self.assertEqual(r.status_code, 201)
+        r = c.post('/events/test/upload/slides',
+                   {'action': 'complete', 'identifier': self.upload.id})
+        self.assertEqual(r.json()['state'], 'UPLOADED')
+        self.upload.refresh_from_db()
+        with open(os.path.join(self.media_root, self.upload.storage_path),
+                  'rb') as f:
+            self.assertEqual(f.read(), DATA * 4)
@@ -0,0 +1,53 @@
+import csv
+import json
+from io import StringIO
+
+from django.test import TestCase, override_settings
+
+from materials.benchmark import UploadBenchmark, parse_size
+from materials.management.commands.benchmark_uploads import format_results
+from materials.tests.support import TEST_MATERIALS
+
+
+class ParseSizeTestCase(TestCase):
+    def test_bytes(self):
+        self.assertEqual(parse_size('512'), 512)
+
+    def test_suffixes(self):
+        self.assertEqual(parse_size('64K'), 64 * 1024)
+        self.assertEqual(parse_size('1.5m'), 1536 * 1024)
+        self.assertEqual(parse_size('1GB'), 1024 ** 3)
+
+
+class UploadBenchmarkTestCase(TestCase):
+    def test_memory(self):
+        result = UploadBenchmark('memory', 4096, 1024).run()
+        self.assertEqual(result.chunks, 4)
+        self.assertEqual(len(result.sha256), 64)
+        self.assertEqual(
+            set(result.seconds),
+            {'create', 'chunk_exists', 'save_chunk', 'complete', 'total'})
+        self.assertGreater(result.queries['save_chunk'], 0)
+        self.assertGreater(result.throughput, 0)
+        self.assertGreater(result.peak_rss, 0)
+
+    def test_filesystem_uneven(self):
+        # The last chunk takes the remainder
+        result = UploadBenchmark('filesystem', 2500, 1024).run()
+        self.assertEqual(result.chunks, 2)
+
+    def test_larger_than_materials(self):
+        # The configured materials' max_size doesn't limit the benchmark
+        capped = [dict(material, max_size=1024)
+                  for material in TEST_MATERIALS]
+        with override_settings(MATERIALS=capped):
+            result = UploadBenchmark('memory', 4096, 1024).run()
+        self.assertEqual(result.chunks, 4)
+
+    def test_formats(self):
+        results = [UploadBenchmark('memory', 1024, 1024).run().as_dict()]
+        self.assertEqual(json.loads(format_results(results, 'json')),
+                         results)
+        rows = list(csv.DictReader(StringIO(format_results(results, 'csv'))))
+        self.assertEqual(rows[0]['backend'], 'memory')
+        self.assertIn('seconds_save_chunk', rows[0])
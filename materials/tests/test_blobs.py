@@ -0,0 +1,73 @@
+import os
+from io import BytesIO
+from unittest import mock
+
+from django.test import Client, override_settings
+
+from materials import get_event_model
+from materials.blobs import get_blob_path
+from materials.chunks import ChunkFiles
+from materials.models import Blob, Upload
+from materials.storage import get_storage
+from materials.tests.support import FileSystemStorageTestCase
+from materials.tests.test_resumable_uploads import make_args
+
+SHA256 = '326e228882b798cecdd5fb44fddc9a7f843014a517611a71bcc6b3c838cf9e7f'
+
+
+@override_settings(MATERIALS_CONTENT_ADDRESSED_STORAGE=True)
+class ContentAddressedTestCase(FileSystemStorageTestCase):
+    def setUp(self):
+        super().setUp()
+        get_event_model().objects.create(title='test', slug='test')
+        self.blob_path = os.path.join(self.media_root, get_blob_path(SHA256))
+
+    def upload(self, material='slides', content=b'\xde\xad\xbe\xef' * 256):
+        c = Client()
+        target = f'/events/test/upload/{material}'
+        filename = 'test.mp4' if material == 'video' else 'test.pdf'
+        r = c.post(target, {'action': 'create', 'filename': filename,
+                            'size': len(content)})
+        identifier = r.json()['identifier']
+        r = c.post(target + '?' + make_args(
+                       resumableIdentifier=identifier,
+                       resumableTotalSize=len(content)),
+                   {'file': BytesIO(content)})
+        self.assertEqual(r.status_code, 201)
+        r = c.post(target, {'action': 'complete', 'identifier': identifier})
+        self.assertEqual(r.status_code, 201)
+        return Upload.objects.get(id=identifier)
+
+    def test_upload(self):
+        upload = self.upload()
+        self.assertEqual(upload.storage_path, get_blob_path(SHA256))
+        with get_storage().open(upload.storage_path) as f:
+            self.assertEqual(f.read(), b'\xde\xad\xbe\xef' * 256)
+        self.assertEqual(upload.blob.references, 1)
+
+    def test_duplicate(self):
+        first = self.upload()
+        with mock.patch.object(ChunkFiles, 'assemble') as assemble:
+            second = self.upload(material='video')
+        assemble.assert_not_called()
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertEqual(Blob.objects.get().references, 2)
+        self.assertEqual(os.listdir(os.path.dirname(self.blob_path)),
+                         [SHA256])
+
+    def test_distinct(self):
+        self.upload()
+        self.upload(material='video', content=b'\x00' * 1024)
+        self.assertEqual(Blob.objects.count(), 2)
+
+    def test_release(self):
+        first = self.upload()
+        second = self.upload()
+        first.delete()
+        self.assertEqual(Blob.objects.get().references, 1)
+        self.assertTrue(os.path.exists(self.blob_path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(os.path.exists(self.blob_path))
@@ -0,0 +1,84 @@
+import os
+from hashlib import sha256
+from io import BytesIO
+
+from django.test import Client
+
+from materials import get_event_model
+from materials.models import Chunk, Upload
+from materials.tests.support import (
+    FileSystemStorageTestCase, MockStorageTestCase)
+from materials.tests.test_resumable_uploads import make_args
+
+DATA = b'\xde\xad\xbe\xef' * 256
+DIGEST = sha256(DATA).hexdigest()
+
+
+class ChunkChecksumMixin:
+    def setUp(self):
+        super().setUp()
+        event = get_event_model().objects.create(title='test', slug='test')
+        self.upload = Upload.objects.create(
+            event=event, material_id='slides', filename='test.pdf',
+            size=1024)
+
+    def args(self, digest=None):
+        args = {'resumableIdentifier': self.upload.id}
+        if digest:
+            args['resumableChunkSha256'] = digest
+        return make_args(**args)
+
+    def post_chunk(self, digest=None):
+        return Client().post(
+            '/events/test/upload/slides?' + self.args(digest),
+            {'file': BytesIO(DATA)})
+
+    def test_verified(self):
+        r = self.post_chunk(DIGEST)
+        self.assertEqual(r.status_code, 201)
+        self.assertEqual(Chunk.objects.get().sha256, DIGEST)
+
+    def test_corrupted(self):
+        r = self.post_chunk(sha256(b'other').hexdigest())
+        self.assertEqual(r.status_code, 422)
+        self.assertFalse(Chunk.objects.exists())
+
+
+class ChunkChecksumTestCase(ChunkChecksumMixin, MockStorageTestCase):
+    def test_optional(self):
+        r = self.post_chunk()
+        self.assertEqual(r.status_code, 201)
+        self.assertIsNone(Chunk.objects.get().sha256)
+
+    def test_invalid(self):
+        r = self.post_chunk('not-a-digest')
+        self.assertEqual(r.status_code, 403)
+
+    def test_upper_case(self):
+        r = self.post_chunk(DIGEST.upper())
+        self.assertEqual(r.status_code, 201)
+        self.assertEqual(Chunk.objects.get().sha256, DIGEST)
+
+    def chunk_exists(self, digest):
+        r = Client().get('/events/test/upload/slides?' + self.args(digest))
+        return r.status_code == 200
+
+    def test_chunk_exists(self):
+        self.post_chunk(DIGEST)
+        self.assertTrue(self.chunk_exists(DIGEST))
+        self.assertTrue(self.chunk_exists(None))
+        self.assertFalse(self.chunk_exists(sha256(b'other').hexdigest()))
+
+    def test_chunk_exists_unverified(self):
+        # Received without a checksum, so it's sent again
+        self.post_chunk()
+        self.assertTrue(self.chunk_exists(None))
+        self.assertFalse(self.chunk_exists(DIGEST))
+
+
+class StreamedChunkChecksumTestCase(ChunkChecksumMixin,
+                                    FileSystemStorageTestCase):
+    def test_corrupted(self):
+        super().test_corrupted()
+        # Nothing left behind
+        self.assertEqual(os.listdir(self.media_root), [])
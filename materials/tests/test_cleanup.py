@@ -0,0 +1,151 @@
+from datetime import timedelta
+from io import BytesIO, StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.utils import timezone
+
+from materials import get_event_model
+from materials.models import Blob, Chunk, Review, Upload
+from materials.storage import get_chunk_path, get_storage, get_temp_storage
+from materials.summary import get_summary_cache_key, render_event_summary
+from materials.tests.support import MockStorageTestCase
+from materials.upload import get_active_upload, get_upload_cache_key
+
+
+class CleanupTestCase(MockStorageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.event = get_event_model().objects.create(
+            title='test', slug='test')
+        self.long_ago = timezone.now() - timedelta(days=30)
+
+    def create_upload(self, chunks=0, **kwargs):
+        upload = Upload.objects.create(
+            event=self.event, material_id='slides', filename='test.pdf',
+            size=1024, **kwargs)
+        for chunk in range(1, chunks + 1):
+            get_temp_storage().save(get_chunk_path(upload, chunk),
+                                    BytesIO(b'\x00' * 256))
+            Chunk.objects.create(upload=upload, number=chunk, size=256)
+        return upload
+
+    def age(self, upload):
+        Upload.objects.filter(id=upload.id).update(created=self.long_ago)
+        Chunk.objects.filter(upload=upload).update(received=self.long_ago)
+
+    def cleanup(self, *args):
+        out = StringIO()
+        call_command('cleanup_uploads', *args, stdout=out)
+        return out.getvalue()
+
+    def test_stale(self):
+        stale = self.create_upload(chunks=2)
+        self.age(stale)
+        fresh = self.create_upload(chunks=1)
+        out = self.cleanup()
+        self.assertIn('Abandoned 1 uploads, reclaiming 512 bytes', out)
+        stale.refresh_from_db()
+        self.assertIsNotNone(stale.deleted)
+        self.assertFalse(Chunk.objects.filter(upload=stale).exists())
+        self.assertFalse(
+            get_temp_storage().exists(get_chunk_path(stale, 1)))
+        self.assertTrue(get_temp_storage().exists(get_chunk_path(fresh, 1)))
+
+    def test_stale_invalidates_caches(self):
+        stale = self.create_upload(chunks=1)
+        self.age(stale)
+        render_event_summary(self.event)
+        get_active_upload(stale.id, 'test', 'slides')
+        self.cleanup()
+        # Expired by a bulk update, which sends no signals
+        self.assertIsNone(cache.get(get_summary_cache_key(self.event.id)))
+        self.assertIsNone(cache.get(get_upload_cache_key(stale.id)))
+        with self.assertRaises(PermissionDenied):
+            get_active_upload(stale.id, 'test', 'slides')
+
+    def test_recently_active(self):
+        upload = self.create_upload(chunks=2)
+        self.age(upload)
+        Chunk.objects.filter(upload=upload, number=2).update(
+            received=timezone.now())
+        out = self.cleanup()
+        self.assertIn('Abandoned 0 uploads', out)
+
+    def test_dry_run(self):
+        upload = self.create_upload(chunks=2)
+        self.age(upload)
+        out = self.cleanup('--dry-run', '--batch-size', '1')
+        self.assertIn('Would have abandoned 1 uploads, reclaiming 512 bytes',
+                      out)
+        upload.refresh_from_db()
+        self.assertIsNone(upload.deleted)
+        self.assertEqual(Chunk.objects.filter(upload=upload).count(), 2)
+
+    def test_purge(self):
+        deleted = self.create_upload(uploaded=self.long_ago,
+                                     deleted=self.long_ago)
+        get_storage().save(deleted.storage_path,
+                           ContentFile(b'\x00' * 1024))
+        recent = self.create_upload(uploaded=self.long_ago,
+                                    deleted=timezone.now())
+        reviewer = get_user_model().objects.create(username='reviewer')
+        Review.objects.create(upload=deleted, reviewer=reviewer,
+                              action=Review.Actions.ACCEPT)
+        out = self.cleanup('--purge-days', '7')
+        self.assertIn('Purged 1 uploads, reclaiming 1024 bytes', out)
+        self.assertFalse(get_storage().exists(deleted.storage_path))
+        # The upload, and its history, are kept
+        deleted.refresh_from_db()
+        self.assertIsNotNone(deleted.purged)
+        self.assertTrue(Review.objects.filter(upload=deleted).exists())
+        recent.refresh_from_db()
+        self.assertIsNone(recent.purged)
+
+        out = self.cleanup('--purge-days', '7')
+        self.assertIn('Purged 0 uploads', out)
+
+    def add_blob(self, references):
+        get_storage().save('blob.pdf', ContentFile(b'\x00' * 1024))
+        return Blob.objects.create(sha256='0' * 64, name='blob.pdf',
+                                   size=1024, references=references)
+
+    def test_purge_shared_blob(self):
+        blob = self.add_blob(references=2)
+        uploads = [self.create_upload(uploaded=self.long_ago,
+                                      deleted=self.long_ago, blob=blob)
+                   for i in range(2)]
+        # Its file is only reclaimed once
+        out = self.cleanup('--purge-days', '7', '--dry-run')
+        self.assertIn('Would have purged 2 uploads, reclaiming 1024 bytes',
+                      out)
+        with self.captureOnCommitCallbacks(execute=True):
+            out = self.cleanup('--purge-days', '7')
+        self.assertIn('Purged 2 uploads, reclaiming 1024 bytes', out)
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(get_storage().exists('blob.pdf'))
+        for upload in uploads:
+            upload.refresh_from_db()
+            self.assertIsNone(upload.blob_id)
+
+    def test_purge_referenced_blob(self):
+        blob = self.add_blob(references=2)
+        self.create_upload(uploaded=self.long_ago, deleted=self.long_ago,
+                           blob=blob)
+        self.create_upload(uploaded=self.long_ago, blob=blob)
+        out = self.cleanup('--purge-days', '7', '--dry-run')
+        self.assertIn('reclaiming 0 bytes', out)
+        out = self.cleanup('--purge-days', '7')
+        self.assertIn('Purged 1 uploads, reclaiming 0 bytes', out)
+        blob.refresh_from_db()
+        self.assertEqual(blob.references, 1)
+        self.assertTrue(get_storage().exists('blob.pdf'))
+
+    def test_no_purge_by_default(self):
+        self.create_upload(uploaded=self.long_ago, deleted=self.long_ago)
+        out = self.cleanup()
+        self.assertNotIn('Purged', out)
+        self.assertFalse(Upload.objects.filter(purged__isnull=False).exists())
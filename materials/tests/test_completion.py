@@ -0,0 +1,100 @@
+from datetime import timedelta
+from io import BytesIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from materials import get_event_model
+from materials.completion import submit_completion
+from materials.models import CompletionJob, CompletionStates, Upload
+from materials.tests.support import MockStorageTestCase
+from materials.tests.test_resumable_uploads import make_args
+
+
+@override_settings(MATERIALS_COMPLETION_WORKERS=0)
+class QueuedCompletionTestCase(MockStorageTestCase):
+    def setUp(self):
+        super().setUp()
+        event = get_event_model().objects.create(title='test', slug='test')
+        self.upload = Upload.objects.create(
+            event=event, material_id='slides', filename='test.pdf',
+            size=1024)
+        self.client = Client()
+
+    def post_chunk(self):
+        r = self.client.post(
+            '/events/test/upload/slides?'
+            + make_args(resumableIdentifier=self.upload.id),
+            {'file': BytesIO(b'\xde\xad\xbe\xef' * 256)})
+        self.assertEqual(r.status_code, 201)
+
+    def complete(self):
+        r = self.client.post('/events/test/upload/slides',
+                             {'action': 'complete',
+                              'identifier': self.upload.id})
+        self.assertEqual(r.status_code, 202)
+        self.assertEqual(r.json()['state'], 'CREATED')
+        return r.json()
+
+    def test_queued(self):
+        self.post_chunk()
+        result = self.complete()
+        r = self.client.get(result['status_url'])
+        self.assertEqual(r.json()['job_state'], 'QUEUED')
+
+        # Completing again doesn't queue another job
+        self.assertEqual(self.complete()['job'], result['job'])
+
+        call_command('complete_uploads', verbosity=0)
+        r = self.client.get(result['status_url'])
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json(), {
+            'job': result['job'],
+            'job_state': 'DONE',
+            'progress': 100,
+            'error': '',
+            'state': 'UPLOADED',
+            'sha256': (
+                '326e228882b798cecdd5fb44fddc9a7f'
+                '843014a517611a71bcc6b3c838cf9e7f'),
+        })
+
+    def test_incomplete(self):
+        result = self.complete()
+        call_command('complete_uploads', verbosity=0)
+        job = CompletionJob.objects.get(id=result['job'])
+        self.assertEqual(job.state, CompletionStates.FAILED)
+        self.assertEqual(job.error, 'Upload is incomplete')
+
+    def test_status_wrong_material(self):
+        result = self.complete()
+        r = self.client.get(result['status_url'].replace('slides', 'video'))
+        self.assertEqual(r.status_code, 404)
+
+    def test_abandoned(self):
+        self.post_chunk()
+        result = self.complete()
+        # Its worker died
+        CompletionJob.objects.filter(id=result['job']).update(
+            state=CompletionStates.RUNNING,
+            updated=timezone.now() - timedelta(minutes=5))
+        call_command('complete_uploads', verbosity=0)
+        job = CompletionJob.objects.get(id=result['job'])
+        self.assertEqual(job.state, CompletionStates.RUNNING)
+
+        with override_settings(MATERIALS_COMPLETION_TIMEOUT=60):
+            call_command('complete_uploads', verbosity=0)
+        job.refresh_from_db()
+        self.assertEqual(job.state, CompletionStates.DONE)
+
+    @override_settings(MATERIALS_COMPLETION_WORKERS=1)
+    def test_resubmitted(self):
+        with mock.patch('materials.completion.get_executor') as executor:
+            with self.captureOnCommitCallbacks(execute=True):
+                job = submit_completion(self.upload)
+            # Its pool was lost, e.g. with its process
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(submit_completion(self.upload), job)
+        self.assertEqual(executor.return_value.submit.call_count, 2)
@@ -0,0 +1,184 @@
+from hashlib import sha256
+from io import BytesIO
+from tempfile import TemporaryDirectory
+
+from django.core.files.base import ContentFile
+from django.test import Client, override_settings
+
+from materials import get_event_model
+from materials.admission import admitted
+from materials.models import Upload
+from materials.storage import get_storage
+from materials.tests.support import (
+    FileSystemStorageTestCase, MockStorageTestCase)
+from materials.tests.test_resumable_uploads import make_args
+
+CHUNK_SIZE = 256
+# Four distinct chunks
+OLD = b''.join(bytes((b + i) % 256 for b in range(CHUNK_SIZE))
+               for i in range(4))
+NEW = OLD[:512] + b'\x00' * 256 + OLD[768:]
+
+
+def split(data):
+    return [data[i:i + CHUNK_SIZE] for i in range(0, len(data), CHUNK_SIZE)]
+
+
+def digests(data):
+    return ','.join(sha256(chunk).hexdigest() for chunk in split(data))
+
+
+class DeltaUploadMixin:
+    def setUp(self):
+        super().setUp()
+        settings = override_settings(MATERIALS_DELTA_UPLOADS=True)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        get_event_model().objects.create(title='test', slug='test')
+        self.client = Client()
+        self.target = '/events/test/upload/slides'
+
+    def create(self, data):
+        r = self.client.post(self.target, {
+            'action': 'create', 'filename': 'test.pdf', 'size': len(data)})
+        return r.json()['identifier']
+
+    def post_chunks(self, identifier, data, chunks, checksums=True):
+        for i in chunks:
+            chunk = split(data)[i - 1]
+            args = {}
+            if checksums:
+                args['resumableChunkSha256'] = sha256(chunk).hexdigest()
+            r = self.client.post(self.target + '?' + make_args(
+                                     resumableIdentifier=identifier,
+                                     resumableChunkNumber=i,
+                                     resumableChunkSize=CHUNK_SIZE,
+                                     resumableTotalChunks=4,
+                                     **args),
+                                 {'file': BytesIO(chunk)})
+            self.assertEqual(r.status_code, 201)
+
+    def complete(self, identifier):
+        r = self.client.post(self.target, {
+            'action': 'complete', 'identifier': identifier})
+        self.assertEqual(r.json()['state'], 'UPLOADED')
+        return Upload.objects.get(id=identifier)
+
+    def reuse(self, identifier, data):
+        return self.client.post(self.target, {
+            'action': 'reuse', 'identifier': identifier,
+            'chunk_size': CHUNK_SIZE, 'digests': digests(data)})
+
+    def upload_old(self, checksums=True):
+        identifier = self.create(OLD)
+        self.post_chunks(identifier, OLD, range(1, 5), checksums)
+        return self.complete(identifier)
+
+    def test_delta(self):
+        old = self.upload_old()
+        self.assertEqual(old.chunk_digests,
+                         [[CHUNK_SIZE, digest]
+                          for digest in digests(OLD).split(',')])
+
+        identifier = self.create(NEW)
+        r = self.reuse(identifier, NEW)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json()['reused'], 3)
+        self.assertEqual(r.json()['remaining'], 0)
+        self.assertEqual(r.json()['chunks'], [[1, 2], [4, 4]])
+        self.post_chunks(identifier, NEW, [3])
+        new = self.complete(identifier)
+        self.assertEqual(new.sha256, sha256(NEW).hexdigest())
+        with get_storage().open(new.storage_path) as f:
+            self.assertEqual(f.read(), NEW)
+
+
+class DeltaUploadTestCase(DeltaUploadMixin, MockStorageTestCase):
+    def test_replaces_mismatched_chunk(self):
+        self.upload_old()
+        identifier = self.create(NEW)
+        # Chunk 1 was received, but isn't what the client has now
+        self.post_chunks(identifier, NEW[512:] + NEW[:512], [1])
+        r = self.reuse(identifier, NEW)
+        self.assertEqual(r.json()['reused'], 3)
+        self.assertEqual(r.json()['digests'],
+                         {str(i): sha256(split(NEW)[i - 1]).hexdigest()
+                          for i in (1, 2, 4)})
+        self.post_chunks(identifier, NEW, [3])
+        new = self.complete(identifier)
+        with get_storage().open(new.storage_path) as f:
+            self.assertEqual(f.read(), NEW)
+
+    def test_busy(self):
+        self.upload_old()
+        identifier = self.create(NEW)
+        with TemporaryDirectory() as lock_dir, override_settings(
+                MATERIALS_CONCURRENCY={'chunk': {'per_event': 1}},
+                MATERIALS_CONCURRENCY_WAIT=0, MATERIALS_RETRY_AFTER=3,
+                MATERIALS_LOCK_DIR=lock_dir):
+            upload = Upload.objects.get(id=identifier)
+            with admitted('chunk', upload.event_id, wait=0):
+                r = self.reuse(identifier, NEW)
+            self.assertEqual(r.status_code, 503)
+            self.assertEqual(r['Retry-After'], '3')
+            self.assertFalse(upload.chunks.exists())
+
+            r = self.reuse(identifier, NEW)
+            self.assertEqual(r.json()['reused'], 3)
+
+    def test_limited(self):
+        self.upload_old()
+        identifier = self.create(NEW)
+        with override_settings(MATERIALS_REUSE_LIMIT=CHUNK_SIZE * 2):
+            r = self.reuse(identifier, NEW)
+            self.assertEqual((r.json()['reused'], r.json()['remaining']),
+                             (2, 1))
+            self.assertEqual(r.json()['chunks'], [[1, 2]])
+            r = self.reuse(identifier, NEW)
+            self.assertEqual((r.json()['reused'], r.json()['remaining']),
+                             (1, 0))
+            self.assertEqual(r.json()['chunks'], [[1, 2], [4, 4]])
+
+    @override_settings(MATERIALS_REUSE_LIMIT=1)
+    def test_limited_to_a_chunk(self):
+        self.upload_old()
+        identifier = self.create(NEW)
+        r = self.reuse(identifier, NEW)
+        self.assertEqual((r.json()['reused'], r.json()['remaining']), (1, 2))
+
+    def test_no_checksums(self):
+        old = self.upload_old(checksums=False)
+        self.assertIsNone(old.chunk_digests)
+        r = self.reuse(self.create(NEW), NEW)
+        self.assertEqual(r.json()['reused'], 0)
+
+    def test_changed(self):
+        old = self.upload_old()
+        storage = get_storage()
+        storage.delete(old.storage_path)
+        storage.save(old.storage_path,
+                     ContentFile(OLD[:256] + b'\x01' * 768))
+        r = self.reuse(self.create(NEW), NEW)
+        # Chunk 1 still matches, but 2 doesn't, so we stop there
+        self.assertEqual(r.json()['reused'], 1)
+
+    def test_wrong_number_of_checksums(self):
+        self.upload_old()
+        r = self.reuse(self.create(NEW[:512]), NEW)
+        self.assertEqual(r.status_code, 403)
+
+    @override_settings(MATERIALS_DELTA_UPLOADS=False)
+    def test_disabled(self):
+        r = self.reuse(self.create(NEW), NEW)
+        self.assertEqual(r.status_code, 404)
+
+
+class FileSystemDeltaUploadTestCase(DeltaUploadMixin,
+                                    FileSystemStorageTestCase):
+    pass
+
+
+@override_settings(MATERIALS_PREALLOCATE_UPLOADS=True)
+class PreallocatedDeltaUploadTestCase(DeltaUploadMixin,
+                                      FileSystemStorageTestCase):
+    pass
@@ -0,0 +1,114 @@
+from hashlib import sha256
+
+from django.core.files.base import ContentFile
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from materials import get_event_model
+from materials.download import parse_range
+from materials.models import Upload
+from materials.storage import get_storage
+from materials.tests.support import MockStorageTestCase
+
+
+class ParseRangeTestCase(MockStorageTestCase):
+    def test_range(self):
+        self.assertEqual(parse_range('bytes=0-9', 100), (0, 9))
+
+    def test_open_ended(self):
+        self.assertEqual(parse_range('bytes=90-', 100), (90, 99))
+
+    def test_suffix(self):
+        self.assertEqual(parse_range('bytes=-10', 100), (90, 99))
+
+    def test_past_end(self):
+        self.assertEqual(parse_range('bytes=90-200', 100), (90, 99))
+
+    def test_unsatisfiable(self):
+        with self.assertRaises(ValueError):
+            parse_range('bytes=100-', 100)
+
+    def test_unsupported(self):
+        self.assertIsNone(parse_range('bytes=0-1,5-6', 100))
+
+
+class DownloadTestCase(MockStorageTestCase):
+    content = bytes(range(256)) * 4
+
+    def setUp(self):
+        super().setUp()
+        self.event = get_event_model().objects.create(
+            title='test', slug='test')
+        self.upload = Upload.objects.create(
+            event=self.event, material_id='slides', filename='test.pdf',
+            size=len(self.content),
+            sha256=sha256(self.content).hexdigest(),
+            uploaded=timezone.now())
+        get_storage().save(self.upload.storage_path,
+                           ContentFile(self.content))
+        self.url = f'/events/test/download/{self.upload.id}'
+        self.etag = f'"{self.upload.sha256}"'
+
+    def test_download(self):
+        r = Client().get(self.url)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(b''.join(r.streaming_content), self.content)
+        self.assertEqual(r['ETag'], self.etag)
+        self.assertEqual(r['Accept-Ranges'], 'bytes')
+        self.assertEqual(r['Content-Type'], 'application/pdf')
+        self.assertIn('attachment', r['Content-Disposition'])
+
+    def test_range(self):
+        r = Client().get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(r.status_code, 206)
+        self.assertEqual(b''.join(r.streaming_content), self.content[10:20])
+        self.assertEqual(r['Content-Range'], 'bytes 10-19/1024')
+        self.assertEqual(r['Content-Length'], '10')
+
+    def test_suffix_range(self):
+        r = Client().get(self.url, HTTP_RANGE='bytes=-24')
+        self.assertEqual(r.status_code, 206)
+        self.assertEqual(b''.join(r.streaming_content), self.content[-24:])
+        self.assertEqual(r['Content-Range'], 'bytes 1000-1023/1024')
+
+    def test_unsatisfiable_range(self):
+        r = Client().get(self.url, HTTP_RANGE='bytes=2000-')
+        self.assertEqual(r.status_code, 416)
+        self.assertEqual(r['Content-Range'], 'bytes */1024')
+
+    def test_if_range_mismatch(self):
+        r = Client().get(self.url, HTTP_RANGE='bytes=10-19',
+                         HTTP_IF_RANGE='"stale"')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(b''.join(r.streaming_content), self.content)
+
+    def test_if_range_match(self):
+        r = Client().get(self.url, HTTP_RANGE='bytes=10-19',
+                         HTTP_IF_RANGE=self.etag)
+        self.assertEqual(r.status_code, 206)
+
+    def test_not_modified(self):
+        r = Client().get(self.url, HTTP_IF_NONE_MATCH=self.etag)
+        self.assertEqual(r.status_code, 304)
+        self.assertEqual(r['ETag'], self.etag)
+
+    def test_incomplete(self):
+        self.upload.uploaded = None
+        self.upload.save()
+        r = Client().get(self.url)
+        self.assertEqual(r.status_code, 404)
+
+    def test_wrong_event(self):
+        get_event_model().objects.create(title='other', slug='other')
+        r = Client().get(f'/events/other/download/{self.upload.id}')
+        self.assertEqual(r.status_code, 404)
+
+    @override_settings(MATERIALS_DOWNLOAD_OFFLOAD='x-accel-redirect',
+                       MATERIALS_DOWNLOAD_ACCEL_PREFIX='/internal/')
+    def test_x_accel_redirect(self):
+        r = Client().get(self.url)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r['X-Accel-Redirect'],
+                         '/internal/' + self.upload.storage_path)
+        self.assertEqual(r['ETag'], self.etag)
+        self.assertEqual(r.content, b'')
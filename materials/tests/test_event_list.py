@@ -0,0 +1,103 @@
+from django.core.cache import cache
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from materials import get_event_model
+from materials.event_list import get_event_list_context
+from materials.models import Upload
+from materials.tests.support import TEST_MATERIALS, MockStorageTestCase
+
+
+@override_settings(MATERIALS=TEST_MATERIALS,
+                   MATERIALS_EVENT_LIST_PAGE_SIZE=2)
+class EventListTestCase(MockStorageTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        Event = get_event_model()
+        for slug, title in (('keynote', 'Keynote'), ('b', 'Beta'),
+                            ('a2', 'Alpha'), ('a1', 'Alpha'),
+                            ('closing', 'Closing')):
+            Event.objects.create(slug=slug, title=title)
+        event = Event.objects.get(slug='b')
+        now = timezone.now()
+        Upload.objects.create(event=event, material_id='slides',
+                              filename='a.pdf', size=1, uploaded=now)
+        Upload.objects.create(event=event, material_id='slides',
+                              filename='b.pdf', size=1, uploaded=now)
+        Upload.objects.create(event=event, material_id='video',
+                              filename='a.mp4', size=1)
+        Upload.objects.create(event=event, material_id='video',
+                              filename='b.mp4', size=1, deleted=now)
+
+    def slugs(self, context):
+        return [event.slug for event in context['events']]
+
+    def test_pages(self):
+        slugs = []
+        cursor = None
+        while True:
+            context = get_event_list_context(cursor=cursor)
+            slugs.extend(self.slugs(context))
+            cursor = context['next_cursor']
+            if not cursor:
+                break
+        # By title, then id
+        self.assertEqual(slugs, ['a2', 'a1', 'b', 'closing', 'keynote'])
+
+    def test_upload_counts(self):
+        context = get_event_list_context(search='beta')
+        self.assertEqual(context['events'][0].upload_counts, {
+            'materials_uploaded': 1, 'uploads_in_progress': 1})
+
+    def test_queries(self):
+        # Events, and their upload counts
+        with self.assertNumQueries(2):
+            get_event_list_context()
+
+    def test_search(self):
+        self.assertEqual(self.slugs(get_event_list_context(search='ALP')),
+                         ['a2', 'a1'])
+        # Slugs too, but only prefixes
+        self.assertEqual(self.slugs(get_event_list_context(search='clo')),
+                         ['closing'])
+        self.assertEqual(self.slugs(get_event_list_context(search='note')),
+                         [])
+
+    def test_search_slug_case(self):
+        get_event_model().objects.create(slug='FOSDEM-Opening',
+                                         title='Welcome')
+        self.assertEqual(
+            self.slugs(get_event_list_context(search='fosdem-o')),
+            ['FOSDEM-Opening'])
+
+    def test_invalid_cursor(self):
+        r = Client().get('/events/?after=nonsense')
+        self.assertEqual(r.status_code, 403)
+
+    def test_view(self):
+        c = Client()
+        r = c.get('/events/')
+        self.assertContains(r, 'Alpha', count=2)
+        self.assertContains(r, 'Next page')
+        r = c.get('/events/?q=b')
+        self.assertContains(r, 'Beta')
+        self.assertContains(r, '1/2 uploaded, 1 in progress')
+        self.assertNotContains(r, 'Next page')
+        with self.assertNumQueries(0):
+            c.get('/events/?q=b')
+
+    def test_event_invalidates(self):
+        c = Client()
+        c.get('/events/')
+        get_event_model().objects.create(slug='a0', title='Aardvark')
+        self.assertContains(c.get('/events/'), 'Aardvark')
+
+    def test_upload_invalidates(self):
+        c = Client()
+        c.get('/events/?q=b')
+        Upload.objects.create(
+            event=get_event_model().objects.get(slug='b'),
+            material_id='video', filename='c.mp4', size=1,
+            uploaded=timezone.now())
+        self.assertContains(c.get('/events/?q=b'), '2/2 uploaded')
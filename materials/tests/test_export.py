@@ -0,0 +1,123 @@
+import os
+import tarfile
+import zipfile
+from datetime import timedelta
+from hashlib import sha256
+from io import BytesIO
+from tempfile import TemporaryDirectory
+
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.test import Client
+from django.utils import timezone
+
+from materials import get_event_model
+from materials.export import current_uploads
+from materials.models import Upload
+from materials.storage import get_storage
+from materials.tests.support import MockStorageTestCase
+
+SLIDES = bytes(range(256)) * 4
+VIDEO = b'\x00\x01' * 3000
+
+
+class ExportTestCase(MockStorageTestCase):
+    def setUp(self):
+        super().setUp()
+        Event = get_event_model()
+        self.event = Event.objects.create(title='test', slug='test')
+        self.other = Event.objects.create(title='other', slug='other')
+        self.add_upload(self.event, 'slides', 'old.pdf', b'old',
+                        timezone.now() - timedelta(hours=1))
+        self.add_upload(self.event, 'slides', 'test.pdf', SLIDES)
+        self.add_upload(self.event, 'video', 'test.mp4', VIDEO)
+        self.add_upload(self.other, 'slides', 'other.pdf', SLIDES)
+        # Neither deleted nor incomplete uploads are current
+        self.add_upload(self.other, 'video', 'gone.mp4', VIDEO,
+                        deleted=timezone.now())
+        self.add_upload(self.other, 'video', 'partial.mp4', VIDEO,
+                        uploaded=None)
+
+    def add_upload(self, event, material_id, filename, content,
+                   uploaded=-1, deleted=None):
+        if uploaded == -1:
+            uploaded = timezone.now()
+        upload = Upload.objects.create(
+            event=event, material_id=material_id, filename=filename,
+            size=len(content), sha256=sha256(content).hexdigest(),
+            uploaded=uploaded, deleted=deleted)
+        get_storage().save(upload.storage_path, ContentFile(content))
+        return upload
+
+    def checksums(self, *entries):
+        return ''.join(f'{sha256(content).hexdigest()}  {name}\n'
+                       for name, content in entries).encode()
+
+    def test_current_uploads(self):
+        self.assertEqual(
+            [upload.filename for upload in current_uploads()],
+            ['other.pdf', 'test.pdf', 'test.mp4'])
+
+    def test_zip(self):
+        r = Client().get('/events/test/export.zip')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r['Content-Type'], 'application/zip')
+        self.assertIn('test-materials.zip', r['Content-Disposition'])
+        archive = zipfile.ZipFile(BytesIO(b''.join(r.streaming_content)))
+        self.assertEqual(archive.namelist(),
+                         ['SHA256SUMS', 'test/slides.pdf', 'test/video.mp4'])
+        self.assertEqual({info.compress_type for info in archive.infolist()},
+                         {zipfile.ZIP_STORED})
+        self.assertEqual(archive.read('test/slides.pdf'), SLIDES)
+        self.assertEqual(archive.read('test/video.mp4'), VIDEO)
+        self.assertEqual(
+            archive.read('SHA256SUMS'),
+            self.checksums(('test/slides.pdf', SLIDES),
+                           ('test/video.mp4', VIDEO)))
+
+    def test_tar(self):
+        r = Client().get('/events/export.tar')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r['Content-Type'], 'application/x-tar')
+        content = b''.join(r.streaming_content)
+        self.assertEqual(len(content) % tarfile.RECORDSIZE, 0)
+        archive = tarfile.open(fileobj=BytesIO(content))
+        self.assertEqual(
+            archive.getnames(),
+            ['SHA256SUMS', 'other/slides.pdf', 'test/slides.pdf',
+             'test/video.mp4'])
+        self.assertEqual(archive.extractfile('test/video.mp4').read(), VIDEO)
+        self.assertEqual(
+            archive.extractfile('SHA256SUMS').read(),
+            self.checksums(('other/slides.pdf', SLIDES),
+                           ('test/slides.pdf', SLIDES),
+                           ('test/video.mp4', VIDEO)))
+
+    def test_etag(self):
+        c = Client()
+        etag = c.get('/events/test/export.zip')['ETag']
+        r = c.get('/events/test/export.zip', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(r.status_code, 304)
+        # Another format is another archive
+        self.assertNotEqual(c.get('/events/test/export.tar')['ETag'], etag)
+
+        self.add_upload(self.event, 'slides', 'new.pdf', b'new')
+        r = c.get('/events/test/export.zip', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(r.status_code, 200)
+
+    def test_unknown_format(self):
+        r = Client().get('/events/test/export.rar')
+        self.assertEqual(r.status_code, 404)
+
+    def test_command(self):
+        with TemporaryDirectory() as tmpdir:
+            output = os.path.join(tmpdir, 'other.tar')
+            call_command('export_materials', output, event=['other'],
+                         verbosity=0)
+            with tarfile.open(output) as archive:
+                self.assertEqual(archive.getnames(),
+                                 ['SHA256SUMS', 'other/slides.pdf'])
+
+    def test_command_unknown_event(self):
+        with self.assertRaises(CommandError):
+            call_command('export_materials', '-', event=['missing'])
@@ -0,0 +1,94 @@
+from io import BytesIO
+
+from django.test import Client, override_settings
+
+from materials import get_event_model
+from materials.instrumentation import phase_timed
+from materials.metrics import phase_metrics
+from materials.models import Chunk, Upload
+from materials.tests.support import MockStorageTestCase
+from materials.tests.test_resumable_uploads import make_args
+
+
+class PhaseTimedTestCase(MockStorageTestCase):
+    def setUp(self):
+        super().setUp()
+        event = get_event_model().objects.create(title='test', slug='test')
+        self.upload = Upload.objects.create(
+            event=event, material_id='slides', filename='test.pdf',
+            size=1024)
+        self.phases = []
+        phase_timed.connect(self.receiver)
+        self.addCleanup(phase_timed.disconnect, self.receiver)
+
+    def receiver(self, sender, phase, seconds, size, upload, **kwargs):
+        self.phases.append((phase, size, upload.id))
+
+    def test_lifecycle(self):
+        c = Client()
+        url = ('/events/test/upload/slides?'
+               + make_args(resumableIdentifier=self.upload.id))
+        c.get(url)
+        c.post(url, {'file': BytesIO(b'\xde\xad\xbe\xef' * 256)})
+        c.post('/events/test/upload/slides',
+               {'action': 'complete', 'identifier': self.upload.id})
+        self.assertEqual(self.phases, [
+            ('chunk_exists', 0, self.upload.id),
+            ('save_chunk', 1024, self.upload.id),
+            # Hashed as it arrived
+            ('complete.hash', 0, self.upload.id),
+            ('complete.assemble', 1024, self.upload.id),
+            ('complete.cleanup', 1024, self.upload.id),
+        ])
+
+    def test_failures(self):
+        c = Client()
+        url = ('/events/test/upload/slides?'
+               + make_args(resumableIdentifier=self.upload.id))
+        r = c.post(url, {'file': BytesIO(b'\x00' * 1024),
+                         'other': BytesIO(b'\x00' * 1024)})
+        self.assertEqual(r.status_code, 403)
+        r = c.post(url + '&resumableChunkSha256=' + '0' * 64,
+                   {'file': BytesIO(b'\x00' * 1024)})
+        self.assertEqual(r.status_code, 422)
+        r = c.put(url)
+        self.assertEqual(r.status_code, 405)
+        self.assertEqual(self.phases, [])
+
+
+class MetricsViewTestCase(MockStorageTestCase):
+    def setUp(self):
+        super().setUp()
+        phase_metrics.clear()
+        self.addCleanup(phase_metrics.clear)
+        event = get_event_model().objects.create(title='test', slug='test')
+        self.upload = Upload.objects.create(
+            event=event, material_id='slides', filename='test.pdf',
+            size=1024)
+
+    def test_disabled(self):
+        r = Client().get('/events/metrics')
+        self.assertEqual(r.status_code, 404)
+
+    @override_settings(MATERIALS_METRICS=True)
+    def test_metrics(self):
+        Chunk.objects.create(upload=self.upload, number=1, size=512)
+        phase_timed.send(sender=Upload, phase='save_chunk', seconds=0.02,
+                         size=512, upload=self.upload)
+        r = Client().get('/events/metrics')
+        self.assertEqual(r.status_code, 200)
+        self.assertTrue(r['Content-Type'].startswith('text/plain'))
+        lines = r.content.decode().splitlines()
+        self.assertIn(
+            'materials_phase_seconds_bucket{phase="save_chunk",le="0.01"} 0',
+            lines)
+        self.assertIn(
+            'materials_phase_seconds_bucket{phase="save_chunk",le="0.025"} 1',
+            lines)
+        self.assertIn('materials_phase_seconds_count{phase="save_chunk"} 1',
+                      lines)
+        self.assertIn('materials_phase_bytes_total{phase="save_chunk"} 512',
+                      lines)
+        self.assertIn('materials_uploads{state="CREATED"} 1', lines)
+        self.assertIn('materials_uploads{state="UPLOADED"} 0', lines)
+        self.assertIn('materials_temp_storage_bytes 512', lines)
@@ -0,0 +1,195 @@
+"""Query counts and plans, of each view and upload operation.
+
+Counts are fixed, however many events and uploads there are, so an N+1
+query shows up as a failure. Every query is EXPLAINed, and must find its
+rows through an index, rather than scanning a whole table.
+"""
+import re
+from datetime import timedelta
+from hashlib import sha256
+from io import BytesIO
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from materials import get_event_model
+from materials.cleanup import purgeable_uploads, stale_uploads
+from materials.delta import get_previous_upload
+from materials.models import Review, Upload
+from materials.storage import get_storage
+from materials.tests.support import MockStorageTestCase
+from materials.tests.test_resumable_uploads import make_args
+
+FULL_SCANS = {
+    # SCAN without an index. Older SQLite says SCAN TABLE
+    'sqlite': re.compile(r'\bSCAN (?:TABLE )?(\w+)(?! USING)(?:\s|$)'),
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+}
+CONTENT = b'\x00' * 1024
+
+
+class QueriesTestCase(MockStorageTestCase):
+    def setUp(self):
+        super().setUp()
+        if connection.vendor not in FULL_SCANS:
+            self.skipTest(f'No plans for {connection.vendor}')
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                # Our tables are tiny, so scanning them would be cheapest
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+        Event = get_event_model()
+        reviewer = get_user_model().objects.create(username='reviewer')
+        now = timezone.now()
+        for i in range(5):
+            event = Event.objects.create(title=f'Event {i}', slug=f'e{i}')
+            for material_id, extension in (('slides', 'pdf'),
+                                           ('video', 'mp4')):
+                old = self.add_upload(event, material_id,
+                                      f'old.{extension}',
+                                      deleted=now - timedelta(days=1))
+                upload = self.add_upload(event, material_id,
+                                         f'test.{extension}')
+                for upload_ in (old, upload):
+                    Review.objects.create(upload=upload_, reviewer=reviewer,
+                                          action=Review.Actions.ACCEPT)
+        self.event = Event.objects.get(slug='e2')
+        self.upload = Upload.objects.get(
+            event=self.event, material_id='slides', deleted__isnull=True)
+        self.client = Client()
+
+    def add_upload(self, event, material_id, filename, deleted=None):
+        upload = Upload.objects.create(
+            event=event, material_id=material_id, filename=filename,
+            size=len(CONTENT), sha256=sha256(CONTENT).hexdigest(),
+            uploaded=timezone.now(), deleted=deleted,
+            chunk_digests=[[len(CONTENT), sha256(CONTENT).hexdigest()]])
+        get_storage().save(upload.storage_path, ContentFile(CONTENT))
+        return upload
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                return '\n'.join(row[-1] for row in cursor.fetchall())
+            cursor.execute(f'EXPLAIN {sql}')
+            return '\n'.join(row[0] for row in cursor.fetchall())
+
+    def assertQueries(self, num):
+        """Expect num queries, none of which scan a whole table"""
+        return AssertQueries(self, num)
+
+    def assertIndexed(self, queries):
+        for query in queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT'):
+                continue
+            plan = self.explain(sql)
+            scanned = FULL_SCANS[connection.vendor].findall(plan)
+            self.assertEqual(scanned, [],
+                             f'Full table scan:\n{sql}\n{plan}')
+
+    def test_event_list(self):
+        with self.assertQueries(2):
+            r = self.client.get('/events/')
+        self.assertContains(r, 'Event 4')
+
+    def test_event_list_search(self):
+        with self.assertQueries(2):
+            r = self.client.get('/events/?q=e3')
+        self.assertContains(r, 'Event 3')
+
+    def test_event_detail(self):
+        # Event, Uploads, Reviews
+        with self.assertQueries(3):
+            self.client.get('/events/e2/')
+
+    def test_download(self):
+        with self.assertQueries(2):
+            r = self.client.get(f'/events/e2/download/{self.upload.id}')
+        self.assertEqual(r.status_code, 200)
+
+    def test_export(self):
+        with self.assertQueries(2):
+            r = self.client.get('/events/e2/export.zip')
+        b''.join(r.streaming_content)
+
+    def test_create_upload(self):
+        # Event, superseded upload, and its deletion, then the new upload
+        with self.assertQueries(4):
+            r = self.client.post('/events/e2/upload/slides', {
+                'action': 'create', 'filename': 'new.pdf', 'size': 1024})
+        self.assertEqual(r.status_code, 201)
+
+    def test_resume_upload(self):
+        fingerprint = sha256(CONTENT).hexdigest()
+        identifier = self.client.post('/events/e2/upload/slides', {
+            'action': 'create', 'filename': 'new.pdf', 'size': 1024,
+            'fingerprint': fingerprint,
+        }).json()['identifier']
+        with self.assertQueries(2):
+            r = self.client.post('/events/e2/upload/slides', {
+                'action': 'create', 'filename': 'new.pdf', 'size': 1024,
+                'resume': '1', 'fingerprint': fingerprint})
+        self.assertEqual(r.json()['identifier'], identifier)
+
+    def test_chunk_status(self):
+        identifier = self.client.post('/events/e2/upload/slides', {
+            'action': 'create', 'filename': 'new.pdf', 'size': 1024,
+        }).json()['identifier']
+        with self.assertQueries(3):
+            self.client.get(
+                f'/events/e2/upload/slides/{identifier}/chunks')
+
+    def test_chunk(self):
+        identifier = self.client.post('/events/e2/upload/slides', {
+            'action': 'create', 'filename': 'new.pdf', 'size': 1024,
+        }).json()['identifier']
+        target = '/events/e2/upload/slides?' + make_args(
+            resumableIdentifier=identifier, resumableChunkNumber=1,
+            resumableChunkSize=1024, resumableTotalSize=1024,
+            resumableTotalChunks=1)
+        # The (uncached) upload, and replacing the chunk's manifest entry
+        with self.assertQueries(5):
+            r = self.client.post(target, {'file': BytesIO(CONTENT)})
+        self.assertEqual(r.status_code, 201)
+        with self.assertQueries(1):
+            self.client.get(target)
+
+    def test_previous_upload(self):
+        upload = Upload.objects.create(event=self.event,
+                                       material_id='slides',
+                                       filename='new.pdf', size=1024)
+        with self.assertQueries(1):
+            self.assertEqual(get_previous_upload(upload), self.upload)
+
+    def test_cleanup(self):
+        cutoff = timezone.now()
+        with self.assertQueries(2):
+            list(stale_uploads(cutoff))
+            list(purgeable_uploads(cutoff))
+
+
+class AssertQueries(CaptureQueriesContext):
+    def __init__(self, test_case, num):
+        super().__init__(connection)
+        self.test_case = test_case
+        self.num = num
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        super().__exit__(exc_type, exc_value, traceback)
+        if exc_type is not None:
+            return
+        executed = len(self)
+        self.test_case.assertEqual(
+            executed, self.num,
+            '%d queries executed, %d expected\nCaptured queries were:\n%s' % (
+                executed, self.num,
+                '\n'.join(f'{i}. {query["sql"]}'
+                          for i, query in enumerate(self.captured_queries,
+                                                    start=1))))
+        self.test_case.assertIndexed(self.captured_queries)
@@ -1,12 +1,29 @@
+import os
+from hashlib import sha256
 from io import BytesIO
+from unittest import mock
 from urllib.parse import urlencode
 
-from django.test import Client
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
 
-from materials import get_event_model
-from materials.models import Upload
-from materials.tests.support import MockStorageTestCase
-from materials.storage import get_chunk_path, get_temp_storage
+from materials import get_event_model, hashing
+from materials.chunks import PreallocatedFile
+from materials.hashing import RunningHash, get_running_hash
+from materials.models import Chunk, Upload
+from materials.tests.support import (
+    FileSystemStorageTestCase, MockStorageTestCase)
+from materials.storage import (
+    get_chunk_path, get_partial_path, get_storage, get_temp_storage)
+
+CSRF_TOKEN = 'a' * 64
+DIGEST = sha256(b'test').hexdigest()
+
+
+def without_savepoints(queries):
+    return [query for query in queries
+            if 'SAVEPOINT' not in query['sql']]
 
 
 def make_args(**override):
@@ -51,7 +68,8 @@ class SingleChunkTestCase(MockStorageTestCase):
 class ChunkTestCase(MockStorageTestCase):
     def setUp(self):
         super().setUp()
-        self.event = get_event_model().objects.create(title='test', slug='test')
+        self.event = get_event_model().objects.create(
+            title='test', slug='test')
         self.upload = Upload.objects.create(
             event=self.event, material_id='slides', filename='test.pdf',
             size=1024)
@@ -75,6 +93,7 @@ class ChunkTestCase(MockStorageTestCase):
         get_temp_storage().save(
             get_chunk_path(self.upload, 1),
             BytesIO(b'\xde\xad\xbe\xef' * 256))
+        Chunk.objects.create(upload=self.upload, number=1, size=1024)
         c = Client()
         r = c.get('/events/test/upload/slides?' + self.args)
         self.assertEqual(r.status_code, 200)
@@ -83,6 +102,7 @@ class ChunkTestCase(MockStorageTestCase):
         get_temp_storage().save(
             get_chunk_path(self.upload, 1),
             BytesIO(b'\xde\xad\xbe\xef' * 255))
+        Chunk.objects.create(upload=self.upload, number=1, size=1020)
         c = Client()
         r = c.get('/events/test/upload/slides?' + self.args)
         self.assertEqual(r.status_code, 204)
@@ -114,3 +134,330 @@ class ChunkTestCase(MockStorageTestCase):
                    {'file': BytesIO(b'\xde\xad\xbe\xef' * 256)})
         self.assertEqual(r.status_code, 201)
         self.complete()
+
+    def test_upload_out_of_order(self):
+        c = Client()
+        for i in (2, 4, 1, 3):
+            args = make_args(resumableIdentifier=self.upload.id,
+                             resumableChunkSize=256,
+                             resumableTotalChunks=4,
+                             resumableChunkNumber=i)
+            r = c.post('/events/test/upload/slides?' + args,
+                       {'file': BytesIO(b'\xde\xad\xbe\xef' * 64)})
+            self.assertEqual(r.status_code, 201)
+        running = get_running_hash(self.upload.id)
+        self.assertEqual(running.next_chunk, 5)
+        self.assertEqual(running.size, 1024)
+        self.complete()
+
+    def test_get_unrecorded(self):
+        get_temp_storage().save(
+            get_chunk_path(self.upload, 1),
+            BytesIO(b'\xde\xad\xbe\xef' * 256))
+        c = Client()
+        r = c.get('/events/test/upload/slides?' + self.args)
+        self.assertEqual(r.status_code, 204)
+
+    def test_complete_with_gap(self):
+        c = Client()
+        for i in (1, 2, 4):
+            args = make_args(resumableIdentifier=self.upload.id,
+                             resumableChunkSize=256,
+                             resumableTotalChunks=4,
+                             resumableChunkNumber=i)
+            r = c.post('/events/test/upload/slides?' + args,
+                       {'file': BytesIO(b'\xde\xad\xbe\xef' * 64)})
+            self.assertEqual(r.status_code, 201)
+        r = c.post('/events/test/upload/slides',
+                   {'action': 'complete', 'identifier': self.upload.id})
+        self.assertEqual(r.json()['state'], 'CREATED')
+        # For the uploader to show
+        self.assertEqual(r.json()['job_state'], 'FAILED')
+        self.assertEqual(r.json()['error'], 'Upload is incomplete')
+        # The received chunks are kept, for the gap to be filled
+        self.assertEqual(
+            sorted(self.upload.chunks.values_list('number', flat=True)),
+            [1, 2, 4])
+
+    def test_upload_replacement_hashed_chunk(self):
+        c = Client()
+        for data in (b'\x00' * 1024, b'\xde\xad\xbe\xef' * 256):
+            r = c.post('/events/test/upload/slides?' + self.args,
+                       {'file': BytesIO(data)})
+            self.assertEqual(r.status_code, 201)
+        self.complete()
+
+
+class FileSystemChunkTestCase(FileSystemStorageTestCase):
+    def setUp(self):
+        super().setUp()
+        event = get_event_model().objects.create(title='test', slug='test')
+        self.upload = Upload.objects.create(
+            event=event, material_id='slides', filename='test.pdf',
+            size=1024)
+
+    def post_chunk(self, client, chunk, **kwargs):
+        args = make_args(resumableIdentifier=self.upload.id,
+                         resumableChunkSize=256,
+                         resumableTotalChunks=4,
+                         resumableChunkNumber=chunk)
+        return client.post('/events/test/upload/slides?' + args,
+                           {'file': BytesIO(b'\xde\xad\xbe\xef' * 64)},
+                           **kwargs)
+
+    def test_upload_multi_chunk(self):
+        c = Client()
+        for i in range(4):
+            r = self.post_chunk(c, i + 1)
+            self.assertEqual(r.status_code, 201)
+        r = c.post('/events/test/upload/slides',
+                   {'action': 'complete', 'identifier': self.upload.id})
+        self.assertEqual(r.status_code, 201)
+        self.assertEqual(r.json()['state'], 'UPLOADED')
+        self.upload.refresh_from_db()
+        with get_storage().open(self.upload.storage_path) as f:
+            self.assertEqual(f.read(), b'\xde\xad\xbe\xef' * 256)
+        self.assertEqual(os.listdir(self.media_root),
+                         [self.upload.storage_path])
+
+    def test_upload_streamed(self):
+        c = Client()
+        with mock.patch.object(RunningHash, 'update', autospec=True,
+                               side_effect=RunningHash.update) as update:
+            for i in (2, 1):
+                r = self.post_chunk(c, i)
+                self.assertEqual(r.status_code, 201)
+        # Chunk 1 was hashed as it streamed in, and 2 read back after it
+        self.assertEqual(update.call_count, 1)
+        self.assertEqual(get_running_hash(self.upload.id).size, 512)
+        self.assertEqual(
+            sorted(os.listdir(self.media_root)),
+            [get_chunk_path(self.upload, 1), get_chunk_path(self.upload, 2)])
+
+    def test_stale_running_hash(self):
+        c = Client()
+        for i in (1, 2):
+            self.post_chunk(c, i)
+        # Another process replaced chunk 2, with the same size
+        stale = get_running_hash(self.upload.id)
+        args = make_args(resumableIdentifier=self.upload.id,
+                         resumableChunkSize=256, resumableTotalChunks=4,
+                         resumableChunkNumber=2)
+        c.post('/events/test/upload/slides?' + args,
+               {'file': BytesIO(b'\x00' * 256)})
+        hashing._running_hashes[self.upload.id] = stale
+        for i in (3, 4):
+            self.post_chunk(c, i)
+        r = c.post('/events/test/upload/slides',
+                   {'action': 'complete', 'identifier': self.upload.id})
+        content = (b'\xde\xad\xbe\xef' * 64 + b'\x00' * 256
+                   + b'\xde\xad\xbe\xef' * 128)
+        self.assertEqual(r.json()['sha256'], sha256(content).hexdigest())
+        self.assertNotIn(self.upload.id, hashing._running_hashes)
+
+    def test_idle_running_hash(self):
+        self.post_chunk(Client(), 1)
+        running = get_running_hash(self.upload.id)
+        running.touched -= hashing.IDLE_TIMEOUT + 1
+        with mock.patch.object(hashing, '_last_pruned',
+                               hashing._last_pruned - hashing.PRUNE_INTERVAL):
+            get_running_hash(0)
+        self.assertNotIn(self.upload.id, hashing._running_hashes)
+        hashing.discard_running_hash(0)
+
+    def test_upload_queries(self):
+        c = Client()
+        with CaptureQueriesContext(connection) as queries:
+            self.post_chunk(c, 1)
+        # The Upload (and its Event), and recording the chunk
+        self.assertEqual(len(without_savepoints(queries)), 2)
+        with CaptureQueriesContext(connection) as queries:
+            for i in (2, 3):
+                self.post_chunk(c, i)
+        # Re-reading the cached Upload's state, and recording the chunks
+        self.assertEqual(len(without_savepoints(queries)), 4)
+
+    def test_upload_superseded(self):
+        c = Client()
+        self.post_chunk(c, 1)
+        self.upload.deleted = self.upload.created
+        self.upload.save()
+        r = self.post_chunk(c, 2)
+        self.assertEqual(r.status_code, 403)
+
+    def test_upload_superseded_elsewhere(self):
+        c = Client()
+        self.post_chunk(c, 1)
+        # By another process, whose cache invalidation doesn't reach ours
+        Upload.objects.filter(id=self.upload.id).update(
+            deleted=self.upload.created)
+        r = self.post_chunk(c, 2)
+        self.assertEqual(r.status_code, 403)
+        self.assertFalse(self.upload.chunks.filter(number=2).exists())
+
+    def test_upload_wrong_material(self):
+        args = make_args(resumableIdentifier=self.upload.id)
+        r = Client().post('/events/test/upload/video?' + args,
+                          {'file': BytesIO(b'\xde\xad\xbe\xef' * 256)})
+        self.assertEqual(r.status_code, 404)
+
+    def test_upload_requires_csrf(self):
+        r = self.post_chunk(Client(enforce_csrf_checks=True), 1)
+        self.assertEqual(r.status_code, 403)
+        self.assertFalse(self.upload.chunks.exists())
+
+    def test_upload_csrf_header(self):
+        c = Client(enforce_csrf_checks=True)
+        c.cookies['csrftoken'] = CSRF_TOKEN
+        r = self.post_chunk(c, 1, HTTP_X_CSRFTOKEN='a' * 32 + 'b' * 32)
+        self.assertEqual(r.status_code, 403)
+        # Rejected before the body was streamed to disk
+        self.assertEqual(os.listdir(self.media_root), [])
+        self.assertFalse(self.upload.chunks.exists())
+
+        r = self.post_chunk(c, 1, HTTP_X_CSRFTOKEN=CSRF_TOKEN)
+        self.assertEqual(r.status_code, 201)
+
+
+@override_settings(MATERIALS_PREALLOCATE_UPLOADS=True)
+class PreallocatedChunkTestCase(FileSystemStorageTestCase):
+    def setUp(self):
+        super().setUp()
+        get_event_model().objects.create(title='test', slug='test')
+        self.client = Client()
+        r = self.client.post(
+            '/events/test/upload/slides',
+            {'action': 'create', 'filename': 'test.pdf', 'size': 1000})
+        self.identifier = r.json()['identifier']
+        self.data = bytes(range(250)) * 4
+
+    def post_chunk(self, chunk, data=None):
+        offset = (chunk - 1) * 256
+        if data is None:
+            data = self.data[offset:offset + 256 if chunk < 3 else None]
+        args = make_args(resumableIdentifier=self.identifier,
+                         resumableChunkSize=256,
+                         resumableTotalSize=1000,
+                         resumableTotalChunks=3,
+                         resumableChunkNumber=chunk)
+        return self.client.post('/events/test/upload/slides?' + args,
+                                {'file': BytesIO(data)})
+
+    def test_preallocated(self):
+        upload = Upload.objects.get(id=self.identifier)
+        partial = os.path.join(self.media_root, get_partial_path(upload))
+        self.assertEqual(os.path.getsize(partial), 1000)
+
+    def test_upload_out_of_order(self):
+        for chunk in (3, 1, 2):
+            self.assertEqual(self.post_chunk(chunk).status_code, 201)
+        args = make_args(resumableIdentifier=self.identifier,
+                         resumableChunkSize=256,
+                         resumableTotalSize=1000,
+                         resumableTotalChunks=3,
+                         resumableChunkNumber=2)
+        r = self.client.get('/events/test/upload/slides?' + args)
+        self.assertEqual(r.status_code, 200)
+
+        r = self.client.post('/events/test/upload/slides',
+                             {'action': 'complete',
+                              'identifier': self.identifier})
+        self.assertEqual(r.status_code, 201)
+        self.assertEqual(r.json()['sha256'], sha256(self.data).hexdigest())
+        upload = Upload.objects.get(id=self.identifier)
+        self.assertFalse(upload.chunks.exists())
+        with get_storage().open(upload.storage_path) as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(os.listdir(self.media_root), [upload.storage_path])
+
+    def test_read_before_first_chunk(self):
+        self.assertEqual(self.post_chunk(2).status_code, 201)
+        chunks = PreallocatedFile(Upload.objects.get(id=self.identifier))
+        self.assertEqual(b''.join(chunks.read(2, chunk_size=256)),
+                         self.data[256:512])
+
+    def test_upload_wrong_chunk_size(self):
+        r = self.post_chunk(1, data=b'\x00' * 255)
+        self.assertEqual(r.status_code, 403)
+
+    def test_rejected_resend(self):
+        self.assertEqual(self.post_chunk(1).status_code, 201)
+        self.client = Client(enforce_csrf_checks=True)
+        self.client.cookies['csrftoken'] = CSRF_TOKEN
+        r = self.post_chunk(1, data=b'\x00' * 256)
+        self.assertEqual(r.status_code, 403)
+        # The chunk received before is intact
+        upload = Upload.objects.get(id=self.identifier)
+        self.assertTrue(upload.chunks.filter(number=1).exists())
+        partial = os.path.join(self.media_root, get_partial_path(upload))
+        with open(partial, 'rb') as f:
+            self.assertEqual(f.read(256), self.data[:256])
+
+
+class ChunkStatusTestCase(MockStorageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.event = get_event_model().objects.create(
+            title='test', slug='test')
+        self.upload = Upload.objects.create(
+            event=self.event, material_id='slides', filename='test.pdf',
+            size=1000)
+        for number in (1, 2, 3, 5, 7):
+            Chunk.objects.create(upload=self.upload, number=number, size=100,
+                                 sha256=DIGEST if number == 1 else None)
+        self.url = f'/events/test/upload/slides/{self.upload.id}/chunks'
+
+    def test_ranges(self):
+        c = Client()
+        # Event, Upload, and its manifest
+        with self.assertNumQueries(3):
+            r = c.get(self.url)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json(), {
+            'identifier': self.upload.id,
+            'chunks': [[1, 3], [5, 5], [7, 7]],
+            'digests': {'1': DIGEST},
+        })
+
+    def test_chunk_size(self):
+        Chunk.objects.filter(number=2).update(size=99)
+        c = Client()
+        r = c.get(self.url + '?chunk_size=100')
+        self.assertEqual(r.json()['chunks'], [[1, 1], [3, 3], [5, 5], [7, 7]])
+
+    def test_uploaded(self):
+        self.upload.uploaded = self.upload.created
+        self.upload.save()
+        r = Client().get(self.url)
+        self.assertEqual(r.status_code, 403)
+
+    def create(self, filename='test.pdf', **kwargs):
+        return Client().post('/events/test/upload/slides', {
+            'action': 'create', 'filename': filename, 'size': 1000,
+            'resume': '1', **kwargs})
+
+    def test_create_resume(self):
+        self.upload.fingerprint = DIGEST
+        self.upload.save()
+        r = self.create(fingerprint=DIGEST)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json()['identifier'], self.upload.id)
+
+        r = self.create('other.pdf', fingerprint=DIGEST)
+        self.assertEqual(r.status_code, 201)
+        self.assertNotEqual(r.json()['identifier'], self.upload.id)
+
+    def test_create_resume_other_file(self):
+        self.upload.fingerprint = DIGEST
+        self.upload.save()
+        # Same name and size, but not the same content
+        r = self.create(fingerprint='0' * 64)
+        self.assertEqual(r.status_code, 201)
+        self.assertEqual(Upload.objects.get(id=r.json()['identifier'])
+                         .fingerprint, '0' * 64)
+        # Or unknown content
+        self.assertEqual(self.create().status_code, 201)
+
+    def test_create_invalid_fingerprint(self):
+        r = self.create(fingerprint='not a checksum')
+        self.assertEqual(r.status_code, 403)
@@ -0,0 +1,83 @@
+from io import BytesIO
+from unittest import mock, skipUnless
+
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+
+from materials import get_event_model, hashing
+from materials.models import Upload
+from materials.storage import get_storage, get_temp_storage
+from materials.tests.support import TEST_MATERIALS
+from materials.tests.test_resumable_uploads import make_args
+
+try:
+    import boto3  # type: ignore
+    from moto import mock_aws  # type: ignore
+    from materials.s3 import MIN_PART_SIZE
+    s3_available = True
+except ImportError:
+    s3_available = False
+
+
+@skipUnless(s3_available, 'Requires moto and django-storages')
+@override_settings(
+    MATERIALS=TEST_MATERIALS,
+    MATERIALS_STORAGE='materials.s3.S3ComposingStorage',
+    MATERIALS_TEMP_STORAGE='storages.backends.s3boto3.S3Boto3Storage',
+    AWS_STORAGE_BUCKET_NAME='materials',
+    AWS_S3_REGION_NAME='us-east-1',
+    AWS_S3_ACCESS_KEY_ID='testing',
+    AWS_S3_SECRET_ACCESS_KEY='testing')
+class S3ComposingStorageTestCase(TestCase):
+    def setUp(self):
+        hashing._running_hashes.clear()
+        cache.clear()
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        boto3.client('s3', region_name='us-east-1').create_bucket(
+            Bucket='materials')
+        get_event_model().objects.create(title='test', slug='test')
+
+    def upload(self, data, chunk_size):
+        c = Client()
+        target = '/events/test/upload/slides'
+        r = c.post(target, {'action': 'create', 'filename': 'test.pdf',
+                            'size': len(data)})
+        identifier = r.json()['identifier']
+        chunks = max(len(data) // chunk_size, 1)
+        for chunk in range(chunks):
+            start = chunk * chunk_size
+            end = start + chunk_size if chunk < chunks - 1 else None
+            r = c.post(target + '?' + make_args(
+                           resumableIdentifier=identifier,
+                           resumableChunkNumber=chunk + 1,
+                           resumableChunkSize=chunk_size,
+                           resumableTotalSize=len(data),
+                           resumableTotalChunks=chunks),
+                       {'file': BytesIO(data[start:end])})
+            self.assertEqual(r.status_code, 201)
+        r = c.post(target, {'action': 'complete', 'identifier': identifier})
+        self.assertEqual(r.json()['state'], 'UPLOADED')
+        return Upload.objects.get(id=identifier)
+
+    def assertStored(self, upload, data):
+        with get_storage().open(upload.storage_path) as f:
+            self.assertEqual(f.read(), data)
+        # The chunks are cleaned up, from the shared bucket
+        self.assertEqual(get_temp_storage().listdir('')[1],
+                         [upload.storage_path])
+
+    def test_compose(self):
+        data = b'\xde\xad\xbe\xef' * (MIN_PART_SIZE // 4) + b'tail'
+        with mock.patch('materials.storage.TemporaryFile') as temp_f:
+            upload = self.upload(data, MIN_PART_SIZE)
+        # Nothing was downloaded to assemble it
+        temp_f.assert_not_called()
+        self.assertStored(upload, data)
+
+    def test_small_chunks(self):
+        # Too small to be parts, so assembled by copying
+        data = b'\xde\xad\xbe\xef' * 1024
+        upload = self.upload(data, 1024)
+        self.assertStored(upload, data)
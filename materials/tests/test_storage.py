@@ -0,0 +1,68 @@
+import errno
+import os
+from io import BytesIO
+from unittest import mock
+
+from materials import storage
+from materials.storage import (
+    assemble_chunks, copy_fd, get_storage, get_temp_storage)
+from materials.tests.support import (
+    FileSystemStorageTestCase, MockStorageTestCase)
+
+
+class AssembleTestCase(MockStorageTestCase):
+    def test_assemble_streaming(self):
+        temp_storage = get_temp_storage()
+        temp_storage.save('a.part', BytesIO(b'foo'))
+        temp_storage.save('b.part', BytesIO(b'bar'))
+        name = assemble_chunks(['a.part', 'b.part'], 'out.bin')
+        with get_storage().open(name) as f:
+            self.assertEqual(f.read(), b'foobar')
+
+
+class LocalAssembleTestCase(FileSystemStorageTestCase):
+    def setUp(self):
+        super().setUp()
+        temp_storage = get_temp_storage()
+        temp_storage.save('a.part', BytesIO(b'foo' * 1000))
+        temp_storage.save('b.part', BytesIO(b'bar'))
+
+    def assertAssembled(self, name):
+        with get_storage().open(name) as f:
+            self.assertEqual(f.read(), b'foo' * 1000 + b'bar')
+        self.assertEqual(
+            [f for f in os.listdir(self.media_root) if f.endswith('.partial')],
+            [])
+
+    def test_assemble_local(self):
+        self.assertAssembled(assemble_chunks(['a.part', 'b.part'], 'out.bin'))
+
+    def test_assemble_local_existing(self):
+        get_storage().save('out.bin', BytesIO(b'old'))
+        name = assemble_chunks(['a.part', 'b.part'], 'out.bin')
+        self.assertNotEqual(name, 'out.bin')
+        self.assertAssembled(name)
+
+    def test_assemble_local_fallback(self):
+        unsupported = OSError(errno.EXDEV, 'Cross-device link')
+        with mock.patch.object(storage, '_copy_file_range',
+                               side_effect=unsupported), \
+                mock.patch.object(storage, '_sendfile',
+                                  side_effect=unsupported):
+            self.assertAssembled(
+                assemble_chunks(['a.part', 'b.part'], 'out.bin'))
+
+    def test_assemble_local_cleanup(self):
+        with mock.patch.object(storage, 'copy_fd', side_effect=OSError()):
+            with self.assertRaises(OSError):
+                assemble_chunks(['a.part', 'b.part'], 'out.bin')
+        self.assertEqual(sorted(os.listdir(self.media_root)),
+                         ['a.part', 'b.part'])
+
+    def test_copy_fd_short(self):
+        in_fd = os.open(os.path.join(self.media_root, 'b.part'), os.O_RDONLY)
+        self.addCleanup(os.close, in_fd)
+        out_fd = os.open(os.path.join(self.media_root, 'c.part'),
+                         os.O_WRONLY | os.O_CREAT)
+        self.addCleanup(os.close, out_fd)
+        self.assertEqual(copy_fd(in_fd, out_fd, 10), 3)
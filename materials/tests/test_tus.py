@@ -0,0 +1,184 @@
+import os
+from base64 import b64encode
+from hashlib import sha1, sha256
+
+from django.test import Client, override_settings
+
+from materials import get_event_model
+from materials.models import Chunk, Upload
+from materials.storage import get_storage
+from materials.tests.support import (
+    FileSystemStorageTestCase, MockStorageTestCase)
+from materials.tus import parse_metadata, received_offset
+
+DATA = bytes(range(250)) * 4
+TUS = {'HTTP_TUS_RESUMABLE': '1.0.0'}
+
+
+def b64(value):
+    return b64encode(value).decode('ascii')
+
+
+class TusTestMixin:
+    def setUp(self):
+        super().setUp()
+        get_event_model().objects.create(title='test', slug='test')
+        self.client = Client()
+
+    def create(self, filename='test.pdf', size=len(DATA)):
+        return self.client.post(
+            '/events/test/tus/slides', HTTP_UPLOAD_LENGTH=str(size),
+            HTTP_UPLOAD_METADATA=f'filename {b64(filename.encode())},is_new',
+            **TUS)
+
+    def patch(self, url, offset, data, **headers):
+        return self.client.patch(
+            url, data, content_type='application/offset+octet-stream',
+            HTTP_UPLOAD_OFFSET=str(offset), **TUS, **headers)
+
+    def upload(self):
+        url = self.create()['Location']
+        for offset in range(0, len(DATA), 300):
+            r = self.patch(url, offset, DATA[offset:offset + 300])
+            self.assertEqual(r.status_code, 204)
+            self.assertEqual(r['Upload-Offset'],
+                             str(min(offset + 300, len(DATA))))
+        return Upload.objects.get()
+
+    def test_upload(self):
+        upload = self.upload()
+        self.assertEqual(upload.state, 'UPLOADED')
+        self.assertEqual(upload.sha256, sha256(DATA).hexdigest())
+        with get_storage().open(upload.storage_path) as f:
+            self.assertEqual(f.read(), DATA)
+        self.assertFalse(Chunk.objects.exists())
+
+
+class TusTestCase(TusTestMixin, MockStorageTestCase):
+    def test_options(self):
+        r = self.client.options('/events/test/tus/slides')
+        self.assertEqual(r.status_code, 204)
+        self.assertEqual(r['Tus-Version'], '1.0.0')
+        self.assertEqual(r['Tus-Extension'], 'creation,checksum')
+        self.assertIn('sha256', r['Tus-Checksum-Algorithm'])
+
+    def test_create(self):
+        r = self.create()
+        self.assertEqual(r.status_code, 201)
+        self.assertEqual(r['Tus-Resumable'], '1.0.0')
+        upload = Upload.objects.get()
+        self.assertEqual((upload.filename, upload.size), ('test.pdf', 1000))
+        self.assertEqual(
+            r['Location'],
+            f'http://testserver/events/test/tus/slides/{upload.id}')
+
+    def test_create_invalid(self):
+        r = self.create(filename='test.exe')
+        self.assertEqual(r.status_code, 400)
+        self.assertEqual(r.content, b'Slides must be one of: pdf, odp, zip')
+        self.assertFalse(Upload.objects.exists())
+
+    def test_version_required(self):
+        r = self.client.post('/events/test/tus/slides',
+                             HTTP_UPLOAD_LENGTH='1000')
+        self.assertEqual(r.status_code, 412)
+        self.assertEqual(r['Tus-Version'], '1.0.0')
+
+    def test_head(self):
+        url = self.create()['Location']
+        self.patch(url, 0, DATA[:300])
+        r = self.client.head(url, **TUS)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r['Upload-Offset'], '300')
+        self.assertEqual(r['Upload-Length'], '1000')
+        self.assertEqual(r['Cache-Control'], 'no-store')
+
+    def test_head_superseded(self):
+        url = self.create()['Location']
+        self.create()
+        r = self.client.head(url, **TUS)
+        self.assertEqual(r.status_code, 410)
+
+    def test_offset_mismatch(self):
+        url = self.create()['Location']
+        self.patch(url, 0, DATA[:300])
+        r = self.patch(url, 0, DATA[:300])
+        self.assertEqual(r.status_code, 409)
+        r = self.patch(url, 600, DATA[600:])
+        self.assertEqual(r.status_code, 409)
+
+    def test_too_long(self):
+        url = self.create()['Location']
+        r = self.patch(url, 0, DATA + b'\x00')
+        self.assertEqual(r.status_code, 413)
+        self.assertFalse(Chunk.objects.exists())
+
+    def test_length_required(self):
+        url = self.create()['Location']
+        headers = {'CONTENT_TYPE': 'application/offset+octet-stream',
+                   'HTTP_UPLOAD_OFFSET': '0', **TUS}
+        r = self.client.generic('PATCH', url, **headers)
+        self.assertEqual(r.status_code, 411)
+        # An empty PATCH is fine
+        r = self.client.generic('PATCH', url, CONTENT_LENGTH='0', **headers)
+        self.assertEqual(r.status_code, 204)
+        self.assertEqual(r['Upload-Offset'], '0')
+
+    def test_content_type(self):
+        url = self.create()['Location']
+        r = self.client.patch(url, DATA, content_type='text/plain',
+                              HTTP_UPLOAD_OFFSET='0', **TUS)
+        self.assertEqual(r.status_code, 415)
+
+    def test_checksum(self):
+        url = self.create()['Location']
+        r = self.patch(url, 0, DATA[:300],
+                       HTTP_UPLOAD_CHECKSUM=f'sha1 {b64(sha1(DATA).digest())}')
+        self.assertEqual(r.status_code, 460)
+        self.assertFalse(Chunk.objects.exists())
+        r = self.patch(
+            url, 0, DATA[:300],
+            HTTP_UPLOAD_CHECKSUM=f'sha1 {b64(sha1(DATA[:300]).digest())}')
+        self.assertEqual(r.status_code, 204)
+
+    def test_checksum_sha256(self):
+        url = self.create()['Location']
+        r = self.patch(
+            url, 0, DATA[:300],
+            HTTP_UPLOAD_CHECKSUM=f'sha256 {b64(sha256(DATA).digest())}')
+        self.assertEqual(r.status_code, 460)
+        r = self.patch(
+            url, 0, DATA[:300],
+            HTTP_UPLOAD_CHECKSUM=f'sha256 {b64(sha256(DATA[:300]).digest())}')
+        self.assertEqual(r.status_code, 204)
+        self.assertEqual(Chunk.objects.get().sha256,
+                         sha256(DATA[:300]).hexdigest())
+
+    def test_checksum_unsupported(self):
+        url = self.create()['Location']
+        r = self.patch(url, 0, DATA, HTTP_UPLOAD_CHECKSUM='crc32 AAAA')
+        self.assertEqual(r.status_code, 400)
+
+    def test_parse_metadata(self):
+        self.assertEqual(
+            parse_metadata(f'filename {b64(b"t.pdf")}, empty'),
+            {'filename': 't.pdf', 'empty': ''})
+
+    def test_received_offset(self):
+        self.assertEqual(received_offset({}), (1, 0))
+        self.assertEqual(received_offset({1: 300, 2: 300, 4: 100}), (3, 600))
+
+
+class FileSystemTusTestCase(TusTestMixin, FileSystemStorageTestCase):
+    def test_checksum_streamed(self):
+        url = self.create()['Location']
+        r = self.patch(url, 0, DATA,
+                       HTTP_UPLOAD_CHECKSUM=f'sha1 {b64(sha1(b"").digest())}')
+        self.assertEqual(r.status_code, 460)
+        # Nothing left behind
+        self.assertEqual(os.listdir(self.media_root), [])
+
+
+@override_settings(MATERIALS_PREALLOCATE_UPLOADS=True)
+class PreallocatedTusTestCase(TusTestMixin, FileSystemStorageTestCase):
+    pass
@@ -0,0 +1,135 @@
+import os
+from io import BytesIO
+
+from django.core.exceptions import ValidationError
+from django.test import Client, override_settings
+
+from materials import get_event_model
+from materials.core import get_material
+from materials.models import Chunk, Upload
+from materials.tests.support import (
+    FileSystemStorageTestCase, MockStorageTestCase)
+from materials.tests.test_resumable_uploads import make_args
+from materials.validators import filename, magic_bytes, size
+
+STRICT_MATERIALS = (
+    {
+        'id': 'slides',
+        'name': 'Slides',
+        'extensions': ['pdf', 'zip'],
+        'max_size': 4096,
+        'validators': [
+            'materials.validators.filename',
+            'materials.validators.size',
+            'materials.validators.magic_bytes',
+        ],
+    },
+)
+
+PDF = b'%PDF-1.7\n' + b'\x00' * 1015
+
+
+@override_settings(MATERIALS=STRICT_MATERIALS)
+class ValidatorTestCase(MockStorageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.material = get_material('slides')
+
+    def upload(self, name='test.pdf', upload_size=1024):
+        return Upload(material_id='slides', filename=name, size=upload_size)
+
+    def test_filename(self):
+        filename(self.material, self.upload('TEST.PDF'))
+        with self.assertRaises(ValidationError):
+            filename(self.material, self.upload('test.exe'))
+        with self.assertRaises(ValidationError):
+            filename(self.material, self.upload('pdf'))
+
+    def test_size(self):
+        size(self.material, self.upload(upload_size=4096))
+        with self.assertRaises(ValidationError):
+            size(self.material, self.upload(upload_size=4097))
+        with self.assertRaises(ValidationError):
+            size(self.material, self.upload(upload_size=0))
+
+    def test_magic_bytes(self):
+        # Only checked on content
+        magic_bytes(self.material, self.upload())
+        magic_bytes(self.material, self.upload(), PDF[:64])
+        magic_bytes(self.material, self.upload('test.zip'), b'PK\x03\x04')
+        with self.assertRaises(ValidationError):
+            magic_bytes(self.material, self.upload(), b'PK\x03\x04')
+
+
+@override_settings(MATERIALS=STRICT_MATERIALS)
+class CreateValidationTestCase(MockStorageTestCase):
+    def setUp(self):
+        super().setUp()
+        get_event_model().objects.create(title='test', slug='test')
+
+    def create(self, material='slides', **kwargs):
+        data = {'action': 'create', 'filename': 'test.pdf', 'size': 1024}
+        data.update(kwargs)
+        return Client().post(f'/events/test/upload/{material}', data)
+
+    def test_valid(self):
+        r = self.create()
+        self.assertEqual(r.status_code, 201)
+
+    def test_extension(self):
+        r = self.create(filename='test.exe')
+        self.assertEqual(r.status_code, 400)
+        self.assertEqual(r.json(),
+                         {'error': 'Slides must be one of: pdf, zip'})
+        self.assertFalse(Upload.objects.exists())
+
+    def test_too_large(self):
+        r = self.create(size=4097)
+        self.assertEqual(r.status_code, 400)
+        self.assertIn('may not be larger than', r.json()['error'])
+
+    def test_unknown_material(self):
+        r = self.create(material='poster')
+        self.assertEqual(r.status_code, 404)
+
+
+class ChunkValidationMixin:
+    def setUp(self):
+        super().setUp()
+        # After FileSystemStorageTestCase's settings
+        settings = override_settings(MATERIALS=STRICT_MATERIALS)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        event = get_event_model().objects.create(title='test', slug='test')
+        self.upload = Upload.objects.create(
+            event=event, material_id='slides', filename='test.pdf',
+            size=1024)
+
+    def post_chunk(self, content):
+        return Client().post(
+            '/events/test/upload/slides?'
+            + make_args(resumableIdentifier=self.upload.id),
+            {'file': BytesIO(content)})
+
+    def test_valid(self):
+        r = self.post_chunk(PDF)
+        self.assertEqual(r.status_code, 201)
+
+    def test_invalid(self):
+        r = self.post_chunk(b'PK\x03\x04' + b'\x00' * 1020)
+        self.assertEqual(r.status_code, 415)
+        self.assertEqual(
+            r.content, b"The file's content doesn't look like test.pdf")
+        self.assertFalse(Chunk.objects.exists())
+
+
+class ChunkValidationTestCase(ChunkValidationMixin, MockStorageTestCase):
+    pass
+
+
+class StreamedChunkValidationTestCase(ChunkValidationMixin,
+                                      FileSystemStorageTestCase):
+    def test_invalid(self):
+        super().test_invalid()
+        # Nothing left behind
+        self.assertEqual(os.listdir(self.media_root), [])
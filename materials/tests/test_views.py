@@ -0,0 +1,59 @@
+from django.contrib.auth import get_user_model
+from django.test import Client
+
+from materials import get_event_model
+from materials.models import Review, Upload
+from materials.tests.support import MockStorageTestCase
+
+
+class EventDetailTestCase(MockStorageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.event = get_event_model().objects.create(
+            title='test', slug='test')
+        self.reviewer = get_user_model().objects.create(username='reviewer')
+        self.slides = Upload.objects.create(
+            event=self.event, material_id='slides', filename='test.pdf',
+            size=1024)
+        self.video = Upload.objects.create(
+            event=self.event, material_id='video', filename='test.mp4',
+            size=1024)
+        Review.objects.create(upload=self.slides, reviewer=self.reviewer,
+                              action=Review.Actions.ACCEPT,
+                              comment='Looks great')
+        Review.objects.create(upload=self.video, reviewer=self.reviewer,
+                              action=Review.Actions.REJECT,
+                              comment='Inaudible')
+
+    def test_detail(self):
+        c = Client()
+        # Event, Uploads, Reviews
+        with self.assertNumQueries(3):
+            r = c.get('/events/test/')
+        self.assertContains(r, 'Accept: Looks great')
+        self.assertContains(r, 'Reject: Inaudible')
+
+    def test_detail_cached(self):
+        c = Client()
+        c.get('/events/test/')
+        with self.assertNumQueries(1):
+            r = c.get('/events/test/')
+        self.assertContains(r, 'Accept: Looks great')
+
+    def test_review_invalidates(self):
+        c = Client()
+        c.get('/events/test/')
+        Review.objects.create(upload=self.slides, reviewer=self.reviewer,
+                              action=Review.Actions.COMMENT,
+                              comment='Typo on slide 3')
+        r = c.get('/events/test/')
+        self.assertContains(r, 'Comment: Typo on slide 3')
+
+    def test_upload_invalidates(self):
+        c = Client()
+        c.get('/events/test/')
+        self.slides.deleted = self.slides.created
+        self.slides.save()
+        r = c.get('/events/test/')
+        self.assertContains(r, 'Previous (deleted) uploads')
+        self.assertNotContains(r, 'Looks great')
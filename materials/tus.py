@@ -0,0 +1,217 @@
+"""The tus 1.0 resumable upload protocol, with the creation and checksum
+extensions. https://tus.io/protocols/resumable-upload
+
+Each PATCH is stored as a chunk of the Upload, as if it had come from
+resumable.js, so the rest of the upload lifecycle is shared.
+"""
+from base64 import b64decode
+from binascii import Error as Base64Error
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from django.http.response import HttpResponse
+
+from materials.handlers import (
+    ChecksumUploadHandler, ChunkUploadHandler, receive_raw_chunk)
+from materials.models import Upload
+from materials.upload import ResumableUpload
+
+TUS_VERSION = '1.0.0'
+TUS_EXTENSIONS = ('creation', 'checksum')
+CHECKSUM_ALGORITHMS = ('md5', 'sha1', 'sha256')
+PATCH_CONTENT_TYPE = 'application/offset+octet-stream'
+
+
+class TusError(Exception):
+    """A request that the protocol rejects, with its HTTP status, and
+    headers (as tus_response's)
+    """
+
+    def __init__(self, message: str, status: int = 400, **headers: str):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers
+
+
+@dataclass
+class TusRequest:
+    """A PATCH, appending a chunk to an upload"""
+    chunk_number: int  # The next chunk (1-indexed)
+    offset: int  # Upload-Offset - position in the file
+    size: int  # Content-Length - bytes appended
+    total_size: int  # The upload's size
+    # Upload-Checksum, when it's a SHA-256, as a hex digest
+    chunk_sha256: Optional[str] = None
+    chunk_size: Optional[int] = None  # Chunks vary in size
+
+    def expected_size(self, chunk_number: int) -> int:
+        return self.size
+
+
+def tus_response(status: int = 204, content: str = '',
+                 **headers: str) -> HttpResponse:
+    """A response, with the protocol's headers.
+
+    headers are named with underscores for dashes, e.g. Upload_Offset.
+    """
+    response = HttpResponse(content, status=status,
+                            content_type='text/plain')
+    response['Tus-Resumable'] = TUS_VERSION
+    for name, value in headers.items():
+        response[name.replace('_', '-')] = value
+    return response
+
+
+def options_response(max_size: Optional[int] = None) -> HttpResponse:
+    """Describe our support for the protocol"""
+    headers = {
+        'Tus_Version': TUS_VERSION,
+        'Tus_Extension': ','.join(TUS_EXTENSIONS),
+        'Tus_Checksum_Algorithm': ','.join(CHECKSUM_ALGORITHMS),
+    }
+    if max_size is not None:
+        headers['Tus_Max_Size'] = str(max_size)
+    return tus_response(204, **headers)
+
+
+def check_version(request):
+    """Every request, other than OPTIONS, declares the protocol version"""
+    if request.headers.get('Tus-Resumable') != TUS_VERSION:
+        raise TusError(f'Tus-Resumable must be {TUS_VERSION}', status=412,
+                       Tus_Version=TUS_VERSION)
+
+
+def parse_length(value: Optional[str], header: str) -> int:
+    try:
+        length = int(value or '')
+    except ValueError:
+        raise TusError(f'Invalid {header}')
+    if length < 0:
+        raise TusError(f'Invalid {header}')
+    return length
+
+
+def parse_metadata(value: str) -> Dict[str, str]:
+    """Parse Upload-Metadata: comma-separated keys, with base64 values"""
+    metadata = {}
+    for pair in value.split(','):
+        if not pair.strip():
+            continue
+        key, _, encoded = pair.strip().partition(' ')
+        try:
+            metadata[key] = b64decode(encoded, validate=True).decode('utf-8')
+        except (Base64Error, UnicodeDecodeError):
+            raise TusError(f'Invalid Upload-Metadata value for {key}')
+    return metadata
+
+
+def parse_checksum(value: str) -> Tuple[str, bytes]:
+    """Parse Upload-Checksum: algorithm, and base64 digest"""
+    algorithm, _, encoded = value.partition(' ')
+    if algorithm not in CHECKSUM_ALGORITHMS:
+        raise TusError(f'Unsupported checksum algorithm: {algorithm}')
+    try:
+        return algorithm, b64decode(encoded, validate=True)
+    except Base64Error:
+        raise TusError('Invalid Upload-Checksum')
+
+
+def get_filename(metadata: Dict[str, str]) -> str:
+    """The file's name, as tus clients describe it"""
+    filename = metadata.get('filename') or metadata.get('name')
+    if not filename:
+        raise TusError('Upload-Metadata must include a filename')
+    return filename
+
+
+def received_offset(manifest: Dict[int, int]) -> Tuple[int, int]:
+    """The next chunk, and its offset, following the contiguous chunks
+    received
+    """
+    chunk, offset = 1, 0
+    while chunk in manifest:
+        offset += manifest[chunk]
+        chunk += 1
+    return chunk, offset
+
+
+class TusUpload(ResumableUpload):
+    """An Upload, received through tus PATCH requests"""
+
+    def offset(self) -> int:
+        """Bytes received so far"""
+        if self.upload.uploaded:
+            return self.upload.size
+        return received_offset(self.chunks.manifest())[1]
+
+    def parse_patch(self, request) -> TusRequest:
+        """Parse a PATCH, checking that it appends at the current offset"""
+        if request.content_type != PATCH_CONTENT_TYPE:
+            raise TusError(f'Content-Type must be {PATCH_CONTENT_TYPE}',
+                           status=415)
+        offset = parse_length(request.headers.get('Upload-Offset'),
+                              'Upload-Offset')
+        if not request.META.get('CONTENT_LENGTH'):
+            # Not an empty PATCH, but a body of unknown length
+            raise TusError('Content-Length is required', status=411)
+        chunk_number, current = received_offset(self.chunks.manifest())
+        if offset != current:
+            raise TusError(f'Upload-Offset must be {current}', status=409)
+        t_req = TusRequest(
+            chunk_number=chunk_number,
+            offset=offset,
+            size=parse_length(request.META['CONTENT_LENGTH'],
+                              'Content-Length'),
+            total_size=self.upload.size,
+        )
+        self.validate_request(t_req)
+        return t_req
+
+    def append(self, request, t_req: TusRequest) -> int:
+        """Stream a PATCH body into place. Returns the new offset.
+
+        Raises TusError or ChunkCorrupted if an Upload-Checksum doesn't
+        match.
+        """
+        if not t_req.size:
+            return t_req.offset
+        checksum = None
+        if 'Upload-Checksum' in request.headers:
+            algorithm, digest = parse_checksum(
+                request.headers['Upload-Checksum'])
+            if algorithm == 'sha256':
+                # Verified, and kept in the manifest, as resumable.js
+                # chunk checksums are
+                t_req.chunk_sha256 = digest.hex()
+            else:
+                checksum = ChecksumUploadHandler(request, algorithm)
+
+        handler = ChunkUploadHandler(request, self, t_req)
+        request.upload_handlers.insert(0, handler)
+        if checksum:
+            request.upload_handlers.insert(0, checksum)
+        try:
+            chunk_f = receive_raw_chunk(request, self.upload.filename)
+            if checksum and checksum.digest() != digest:
+                raise TusError('Checksum mismatch', status=460)
+            files = [chunk_f] if chunk_f else []
+            self.save_chunk_files(t_req, files)
+        finally:
+            handler.abort()
+        return t_req.offset + files[0].size
+
+    def validate_request(self, r_req):
+        if r_req.offset + r_req.size > self.upload.size:
+            raise TusError('Upload-Length exceeded', status=413)
+        if r_req.chunk_number > 9999:
+            raise TusError('Too many PATCH requests', status=403)
+
+
+def get_tus_upload(upload_id: int, event_slug: str,
+                   material_id: str) -> Upload:
+    """Look up an upload, in any state"""
+    try:
+        return Upload.objects.select_related('event').get(
+            id=upload_id, event__slug=event_slug, material_id=material_id)
+    except Upload.DoesNotExist:
+        raise TusError('No such upload', status=404)
@@ -1,13 +1,31 @@
+import re
 from dataclasses import dataclass
 from hashlib import sha256
-from itertools import count
 from tempfile import TemporaryFile
+from typing import Dict, Iterable, List, Optional, Tuple
 
+from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
+from django.core.files.uploadedfile import UploadedFile
+from django.http import Http404
 from django.utils import timezone
 
+from materials.blobs import (
+    acquire_blob, add_blob, content_addressed, get_blob_path)
+from materials.chunks import ChunkFiles, ProgressCallback, get_chunk_store
+from materials.core import get_material
+from materials.download import read_range
+from materials.handlers import (
+    ChunkUploadHandler, StreamedChunk, is_raw_chunk, receive_raw_chunk)
+from materials.hashing import (
+    ChunkIdentity, RunningHash, discard_running_hash, get_running_hash)
+from materials.instrumentation import timed
+from materials.storage import get_storage
 from materials.models import Upload, UploadStates
-from materials.storage import get_chunk_path, get_storage, get_temp_storage
+from materials.validators import HEAD_SIZE, validate_upload
+
+SHA256_RE = re.compile(r'[0-9a-f]{64}')
 
 
 @dataclass
@@ -19,6 +37,8 @@ class ResumableRequest:
     id: str  # resumableIdentifier - unique identifier
     filename: str  # resumableFilename - original file name
     relative_path: str  # resumableRelativePath - original relative path
+    # resumableChunkSha256 - hex digest of the chunk, from the client
+    chunk_sha256: Optional[str] = None
 
     @classmethod
     def parse_query_string(cls, GET):
@@ -30,86 +50,417 @@ class ResumableRequest:
             id=GET['resumableIdentifier'],
             filename=GET['resumableFilename'],
             relative_path=GET['resumableRelativePath'],
+            chunk_sha256=GET.get('resumableChunkSha256', '').lower() or None,
         )
 
+    def expected_size(self, chunk_number: int) -> int:
+        """Size of the specified chunk. The last one carries the remainder"""
+        return expected_chunk_size(chunk_number, self.chunk_size,
+                                   self.total_size, self.total_chunks)
+
+    @property
+    def offset(self) -> int:
+        """Position of this chunk in the file"""
+        return (self.chunk_number - 1) * self.chunk_size
+
+
+def expected_chunk_size(chunk_number: int, chunk_size: int, total_size: int,
+                        total_chunks: Optional[int] = None) -> int:
+    """Size of the specified chunk, as resumable.js splits files"""
+    if total_chunks is None:
+        total_chunks = max(total_size // chunk_size, 1)
+    if chunk_number < total_chunks:
+        return chunk_size
+    return total_size - chunk_size * (total_chunks - 1)
+
+
+class ChunkCorrupted(Exception):
+    """A chunk didn't match the checksum the client sent with it"""
+
+
+def chunk_ranges(chunks: Iterable[int]) -> List[List[int]]:
+    """Chunk numbers, as a list of inclusive [first, last] ranges"""
+    ranges: List[List[int]] = []
+    for chunk in sorted(chunks):
+        if ranges and ranges[-1][1] == chunk - 1:
+            ranges[-1][1] = chunk
+        else:
+            ranges.append([chunk, chunk])
+    return ranges
+
+
+def delta_uploads() -> bool:
+    """settings.MATERIALS_DELTA_UPLOADS: Keep the checksums of each
+    upload's chunks, so that re-uploads can reuse unchanged chunks
+    """
+    return getattr(settings, 'MATERIALS_DELTA_UPLOADS', False)
+
+
+def get_upload_cache_key(upload_id) -> str:
+    return f'materials:upload:{upload_id}'
+
+
+def get_upload_cache_timeout() -> int:
+    return getattr(settings, 'MATERIALS_UPLOAD_CACHE_TIMEOUT', 60)
+
+
+def get_active_upload(upload_id, event_slug: str, material_id: str,
+                      writing: bool = False) -> Upload:
+    """Look up a CREATED Upload, with its event.
+
+    Every chunk request needs this, so it's cached briefly, and invalidated
+    when the Upload is saved. The cache may be per-process, and miss
+    another process' invalidation, so before writing, a cached Upload's
+    state is read again from the database.
+    """
+    key = get_upload_cache_key(upload_id)
+    upload = cache.get(key)
+    if upload is None:
+        try:
+            upload = Upload.objects.select_related('event').get(
+                id=upload_id)
+        except (Upload.DoesNotExist, ValueError):
+            raise Http404('No such upload')
+        cache.set(key, upload, get_upload_cache_timeout())
+    elif writing:
+        try:
+            upload.refresh_from_db(fields=['deleted', 'uploaded'])
+        except Upload.DoesNotExist:
+            raise Http404('No such upload')
+    if (upload.event.slug != event_slug
+            or upload.material_id != material_id):
+        raise Http404('No such upload')
+    if upload.state != UploadStates.CREATED:
+        raise PermissionDenied(
+            f'Upload is in state {upload.state}, not CREATED')
+    return upload
+
+
+def invalidate_active_upload(upload_id: int):
+    cache.delete(get_upload_cache_key(upload_id))
+
 
 class ResumableUpload:
     upload: Upload
+    chunks: ChunkFiles
 
     def __init__(self, upload):
         self.upload = upload
+        self.chunks = get_chunk_store(upload)
 
     @classmethod
-    def from_query_string(cls, request, event):
+    def from_query_string(cls, request, event_slug, material_id):
         """Create a ResumableUpload from a resumable.js request"""
         r_req = ResumableRequest.parse_query_string(request.GET)
-        upload = Upload.objects.get(id=r_req.id, event=event)
-        if upload.state != UploadStates.CREATED:
-            raise PermissionDenied(
-                f'Upload is in state {upload.state}, not CREATED')
+        upload = get_active_upload(r_req.id, event_slug, material_id,
+                                   writing=request.method == 'POST')
         return ResumableUpload(upload)
 
+    def prepare_upload(self):
+        """Prepare to receive chunks"""
+        self.chunks.prepare()
+
     def chunk_exists(self, request):
         """Was the specified chunk received?"""
         r_req = ResumableRequest.parse_query_string(request.GET)
-        target_path = self.get_req_chunk_path(r_req)
-        storage = get_temp_storage()
-        if storage.exists(target_path):
-            if storage.size(target_path) == r_req.chunk_size:
-                return True
-        return False
+        self.validate_request(r_req)
+        if (self.chunks.received_size(r_req.chunk_number)
+                != r_req.expected_size(r_req.chunk_number)):
+            return False
+        if r_req.chunk_sha256:
+            # Corrupted chunks, and those received without a checksum, are
+            # sent again
+            return (self.chunks.received_sha256(r_req.chunk_number)
+                    == r_req.chunk_sha256)
+        return True
+
+    def received_chunks(self, chunk_size: Optional[int] = None
+                        ) -> Dict[int, Optional[str]]:
+        """The client's checksums of the received chunks, by number.
+
+        Given the client's chunk_size, chunks of the wrong size are omitted.
+        """
+        return {
+            chunk: digest
+            for chunk, (size, digest, _) in self.chunks.received().items()
+            if not chunk_size or size == expected_chunk_size(
+                chunk, chunk_size, self.upload.size)}
+
+    def received_chunk_status(self, chunk_size: Optional[int] = None
+                              ) -> Dict[str, object]:
+        """The received chunks, for the client to skip those whose checksums
+        match its own.
+
+        As a list of inclusive [first, last] ranges, and their checksums
+        (where the client sent them), by number.
+        """
+        received = self.received_chunks(chunk_size)
+        return {
+            'chunks': chunk_ranges(received),
+            'digests': {chunk: digest for chunk, digest
+                        in sorted(received.items()) if digest},
+        }
 
     def save_chunk(self, request):
         """Save a chunk to our temporary storage"""
         r_req = ResumableRequest.parse_query_string(request.GET)
-        target_path = self.get_req_chunk_path(r_req)
-        temp_storage = get_temp_storage()
-        if temp_storage.exists(target_path):
-            temp_storage.delete(target_path)
+        self.validate_request(r_req)
+        if is_raw_chunk(request):
+            chunk_f = receive_raw_chunk(request, r_req.filename)
+            files = [chunk_f] if chunk_f else []
+        else:
+            files = list(request.FILES.values())
+        self.save_chunk_files(r_req, files)
 
-        if len(request.FILES) != 1:
+    def save_chunk_files(self, r_req, files: List[UploadedFile]):
+        """Save the chunk received in a request's files"""
+        running = get_running_hash(self.upload.id)
+        with running.lock:
+            if r_req.chunk_number < running.next_chunk:
+                # We've already hashed the chunk we're replacing
+                discard_running_hash(self.upload.id)
+
+        if len(files) != 1:
+            for chunk_f in files:
+                if isinstance(chunk_f, StreamedChunk):
+                    chunk_f.discard()
             raise PermissionDenied("Exactly one file will be accepted")
-        temp_storage.save(target_path, next(request.FILES.values()))
+        chunk_f = files[0]
+        if r_req.chunk_sha256:
+            self.verify_chunk(r_req, chunk_f)
+        if r_req.chunk_number == 1 and not isinstance(chunk_f, StreamedChunk):
+            chunk_f.seek(0)
+            self.validate_head(chunk_f.read(HEAD_SIZE))
+            chunk_f.seek(0)
+        received = self.chunks.save(r_req, chunk_f)
+        self.hash_chunk(r_req, chunk_f,
+                        (chunk_f.size, r_req.chunk_sha256, received))
+
+    def verify_chunk(self, r_req, chunk_f):
+        """Check a chunk against the client's checksum.
+
+        Raises ChunkCorrupted, so that the client sends it again.
+        """
+        if isinstance(chunk_f, StreamedChunk):
+            digest = chunk_f.sha256
+        else:
+            hasher = sha256()
+            for block in chunk_f.chunks():
+                hasher.update(block)
+            chunk_f.seek(0)
+            digest = hasher.hexdigest()
+        if digest != r_req.chunk_sha256:
+            if isinstance(chunk_f, StreamedChunk):
+                chunk_f.discard()
+            raise ChunkCorrupted(
+                f'Chunk {r_req.chunk_number} does not match its checksum')
 
-    def complete_upload(self):
-        temp_storage = get_temp_storage()
-        storage = get_storage()
+    def validate_head(self, head: bytes):
+        """Validate the start of the file, as the first chunk arrives.
+
+        Raises ValidationError.
+        """
+        validate_upload(self.upload.material, self.upload, head)
+
+    def get_upload_handler(self, request):
+        """An upload handler to stream this request's chunk into place"""
+        r_req = ResumableRequest.parse_query_string(request.GET)
+        self.validate_request(r_req)
+        return ChunkUploadHandler(request, self, r_req)
+
+    def hash_chunk(self, r_req, chunk_f, identity: ChunkIdentity):
+        """Feed a newly received chunk into the running hash.
+
+        Chunks that arrive out of order are held in temp storage, until the
+        gap before them is filled.
+        """
+        running = get_running_hash(self.upload.id)
+        with running.lock:
+            if r_req.chunk_number != running.next_chunk:
+                if r_req.chunk_number > running.next_chunk:
+                    running.waiting[r_req.chunk_number] = identity
+                return
+            if isinstance(chunk_f, StreamedChunk):
+                if chunk_f.hasher and chunk_f.running is running:
+                    running.adopt(chunk_f.hasher, identity)
+                else:
+                    running.update(self.chunks.read(r_req.chunk_number,
+                                                    r_req.chunk_size),
+                                   identity)
+            else:
+                running.update(chunk_f.chunks(), identity)
+            # Chunks we received out of order, that may now follow on
+            while running.next_chunk in running.waiting:
+                running.update(self.chunks.read(running.next_chunk,
+                                                r_req.chunk_size),
+                               running.waiting.pop(running.next_chunk))
+
+    def hash_stored_chunks(self, running: RunningHash,
+                           received: Dict[int, ChunkIdentity]):
+        """Feed chunks waiting in temp storage into the running hash.
+
+        Stops at the first gap in received.
+        """
+        while running.next_chunk in received:
+            running.update(self.chunks.read(running.next_chunk),
+                           received[running.next_chunk])
+
+    def complete_upload(self, progress: Optional[ProgressCallback] = None):
+        """Assemble the received chunks into storage.
+
+        progress is called as chunks are assembled.
+        """
         upload = self.upload
-        hasher = sha256()
-        size = 0
-
-        with TemporaryFile() as temp_f:
-            for chunk in count(1):
-                path = get_chunk_path(upload, chunk)
-                if not temp_storage.exists(path):
-                    break
-                with temp_storage.open(path, 'rb') as chunk_f:
-                    for block in iter(lambda: chunk_f.read(1024*1024), b''):
-                        size += len(block)
-                        temp_f.write(block)
-                        hasher.update(block)
-
-            temp_f.seek(0)
-            if size == upload.size:
-                storage.save(upload.storage_path, temp_f)
-                upload.sha256 = hasher.hexdigest()
-                upload.completed = timezone.now()
+        running = get_running_hash(upload.id)
+
+        with running.lock:
+            received = self.chunks.received()
+            manifest = {chunk: identity[0]
+                        for chunk, identity in received.items()}
+            chunks = len(manifest)
+            if (set(manifest) != set(range(1, chunks + 1))
+                    or sum(manifest.values()) != upload.size):
+                return
+            if not running.matches(received):
+                # Chunks we hashed were replaced, by another process
+                running = RunningHash()
+            # Usually a no-op, unless chunks were received by another process
+            with timed('complete.hash', upload,
+                       upload.size - running.size):
+                self.hash_stored_chunks(running, received)
+            if running.size == upload.size:
+                upload.sha256 = running.hexdigest()
+                if delta_uploads():
+                    upload.chunk_digests = self.chunk_digests(received)
+                with timed('complete.assemble', upload, upload.size):
+                    if content_addressed():
+                        upload.blob = self.store_blob(chunks, progress)
+                    else:
+                        self.chunks.assemble(chunks, upload.storage_path,
+                                             progress)
+                upload.uploaded = timezone.now()
                 upload.save()
 
-        self.delete_upload_chunks()
+        with timed('complete.cleanup', upload, upload.size):
+            self.delete_upload_chunks()
+
+    def chunk_digests(self, received: Dict[int, ChunkIdentity]
+                      ) -> Optional[List[List]]:
+        """[size, sha256] of each chunk, if the client sent all of their
+        checksums
+        """
+        if not all(identity[1] for identity in received.values()):
+            return None
+        return [[received[chunk][0], received[chunk][1]]
+                for chunk in sorted(received)]
+
+    def reuse_chunk(self, r_req, source: Upload, start: int):
+        """Copy a chunk from a previous upload's file, as if it had been
+        received.
+
+        Raises ChunkCorrupted if it doesn't match r_req's checksum.
+        """
+        size = r_req.expected_size(r_req.chunk_number)
+        blocks = read_range(get_storage().open(source.storage_path, 'rb'),
+                            start, size)
+        writer = self.chunks.open_writer(r_req)
+        if not writer:
+            with TemporaryFile() as temp_f:
+                for block in blocks:
+                    temp_f.write(block)
+                chunk_f = UploadedFile(temp_f, name=self.upload.filename,
+                                       size=temp_f.tell())
+                self.save_chunk_files(r_req, [chunk_f])
+            return
+
+        hasher = sha256()
+        try:
+            for block in blocks:
+                writer.write(block)
+                hasher.update(block)
+        except BaseException:
+            writer.abort()
+            raise
+        writer.close()
+        self.save_chunk_files(r_req, [StreamedChunk(
+            writer=writer, running=None, hasher=None,
+            sha256=hasher.hexdigest(), name=self.upload.filename,
+            size=writer.size)])
+
+    def store_blob(self, chunks: int,
+                   progress: Optional[ProgressCallback] = None):
+        """Reference the Blob with our content, storing it if it's new"""
+        upload = self.upload
+        blob = acquire_blob(upload.sha256)
+        if blob:
+            # Already stored, skip assembly
+            if progress:
+                progress(chunks, chunks)
+            return blob
+        name = self.chunks.assemble(chunks, get_blob_path(upload.sha256),
+                                    progress)
+        return add_blob(upload.sha256, upload.size, name)
 
     def delete_upload_chunks(self):
-        temp_storage = get_temp_storage()
-        for chunk in count(1):
-            path = get_chunk_path(self.upload, chunk)
-            if temp_storage.exists(path):
-                temp_storage.delete(path)
-            else:
-                break
+        discard_running_hash(self.upload.id)
+        self.chunks.delete()
 
-    def get_req_chunk_path(self, r_req):
+    def validate_request(self, r_req):
         if r_req.total_size != self.upload.size:
             raise PermissionDenied("Size mismatch")
         if max(r_req.chunk_number, r_req.total_chunks) > 9999:
             raise PermissionDenied("Chunks are too small")
-        return get_chunk_path(self.upload, r_req.chunk_number)
+        if r_req.chunk_sha256 and not SHA256_RE.fullmatch(r_req.chunk_sha256):
+            raise PermissionDenied("Invalid resumableChunkSha256")
+
+
+def create_upload(event, material_id: str, filename: str, size: int,
+                  resume: bool = False, fingerprint: Optional[str] = None
+                  ) -> Tuple[Upload, bool]:
+    """Prepare to receive an upload, superseding the event's existing
+    uploads of the material.
+
+    With resume, an unfinished upload of the same file (with the same
+    fingerprint, the client's checksum of its first chunk) is continued.
+    Returns the upload, and whether it was created.
+    Raises Http404 for an unknown material, PermissionDenied for an invalid
+    fingerprint, and ValidationError if the material's validators reject
+    the upload.
+    """
+    if fingerprint and not SHA256_RE.fullmatch(fingerprint):
+        raise PermissionDenied('Invalid fingerprint')
+    try:
+        material = get_material(material_id)
+    except KeyError:
+        raise Http404(f'Unknown material: {material_id}')
+
+    upload = Upload(
+        event=event,
+        material_id=material_id,
+        filename=filename,
+        size=size,
+        fingerprint=fingerprint or None,
+    )
+    validate_upload(material, upload)
+
+    if resume and fingerprint:
+        existing = Upload.objects.filter(
+            event=event, material_id=material_id,
+            filename=filename, size=size, fingerprint=fingerprint,
+            deleted__isnull=True, uploaded__isnull=True).first()
+        if existing:
+            return existing, False
+
+    # Supersede existing uploads
+    for superseded in Upload.objects.filter(
+                event=event,
+                material_id=material_id,
+                deleted__isnull=True):
+        if superseded.state == UploadStates.CREATED:
+            ResumableUpload(superseded).delete_upload_chunks()
+        superseded.deleted = timezone.now()
+        superseded.save()
+
+    upload.save()
+    ResumableUpload(upload).prepare_upload()
+    return upload, True
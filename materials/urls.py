@@ -1,12 +1,33 @@
 from django.urls import path
 
 from materials.views import (
-    EventDetailView, EventListView, ResumableUploadView)
+    ChunkStatusView, CompletionStatusView, DownloadView, EventDetailView,
+    EventExportView, EventListView, ExportView, MetricsView,
+    ResumableUploadView, TusCreationView, TusUploadView)
 
 
 urlpatterns = [
     path('', EventListView.as_view()),
+    path('metrics', MetricsView.as_view(), name='materials.metrics'),
+    path('export.<str:format>', ExportView.as_view(),
+         name='materials.export'),
     path('<slug:slug>/', EventDetailView.as_view(),
          name='materials.event_detail'),
-    path('<slug:slug>/upload/<slug:material>', ResumableUploadView.as_view()),
+    path('<slug:slug>/download/<int:upload>', DownloadView.as_view(),
+         name='materials.download'),
+    path('<slug:slug>/export.<str:format>', EventExportView.as_view(),
+         name='materials.event_export'),
+    path('<slug:slug>/upload/<slug:material>', ResumableUploadView.as_view(),
+         name='materials.upload'),
+    path('<slug:slug>/upload/<slug:material>/<int:identifier>/chunks',
+         ChunkStatusView.as_view(),
+         name='materials.chunk_status'),
+    path('<slug:slug>/upload/<slug:material>/completion/<int:job>',
+         CompletionStatusView.as_view(),
+         name='materials.completion_status'),
+    path('<slug:slug>/tus/<slug:material>', TusCreationView.as_view(),
+         name='materials.tus'),
+    path('<slug:slug>/tus/<slug:material>/<int:identifier>',
+         TusUploadView.as_view(),
+         name='materials.tus_upload'),
 ]
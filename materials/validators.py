@@ -0,0 +1,74 @@
+"""Upload validators, listed by path in each Material's validators.
+
+Each is called as validator(material, upload, head), and raises
+ValidationError to reject the upload:
+- When the upload is created (head is None), with its filename and size.
+- As the first chunk arrives, with its first HEAD_SIZE bytes (or fewer, in
+  a short file).
+"""
+from typing import Dict, Optional, Tuple
+
+from django.core.exceptions import ValidationError
+from django.template.defaultfilters import filesizeformat
+
+from materials.core import Material
+
+HEAD_SIZE = 64
+
+# Signatures: (offset, magic bytes) that a file of each extension starts with
+SIGNATURES: Dict[str, Tuple[Tuple[int, bytes], ...]] = {
+    'pdf': ((0, b'%PDF-'),),
+    'odp': ((0, b'PK\x03\x04'),),
+    'zip': ((0, b'PK\x03\x04'), (0, b'PK\x05\x06')),
+    'mp4': ((4, b'ftyp'),),
+    'webm': ((0, b'\x1a\x45\xdf\xa3'),),
+}
+
+
+def get_extension(filename: str) -> str:
+    if '.' not in filename:
+        return ''
+    return filename.rsplit('.', 1)[-1].lower()
+
+
+def filename(material: Material, upload, head: Optional[bytes] = None):
+    """The file extension is one of the material's extensions"""
+    if head is not None:
+        return
+    extension = get_extension(upload.filename)
+    if extension not in material.extensions:
+        raise ValidationError(
+            f'{material.name} must be one of: '
+            f'{", ".join(material.extensions)}')
+
+
+def size(material: Material, upload, head: Optional[bytes] = None):
+    """The file is no larger than the material's max_size"""
+    if head is not None:
+        return
+    if upload.size <= 0:
+        raise ValidationError('The file is empty')
+    if material.max_size is not None and upload.size > material.max_size:
+        raise ValidationError(
+            f'{material.name} may not be larger than '
+            f'{filesizeformat(material.max_size)}')
+
+
+def magic_bytes(material: Material, upload, head: Optional[bytes] = None):
+    """The file's content starts like its extension's type of file"""
+    if head is None:
+        return
+    signatures = SIGNATURES.get(get_extension(upload.filename))
+    if not signatures:
+        return
+    for offset, magic in signatures:
+        if head[offset:offset + len(magic)] == magic:
+            return
+    raise ValidationError(
+        f"The file's content doesn't look like {upload.filename}")
+
+
+def validate_upload(material: Material, upload, head: Optional[bytes] = None):
+    """Run all of the material's validators"""
+    for validator in material.get_validators():
+        validator(material, upload, head)
@@ -1,23 +1,77 @@
+from contextlib import nullcontext
+from copy import copy
 from logging import getLogger
+from typing import Optional
 
-from django.conf import settings
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.http import Http404
 from django.http.response import HttpResponse, JsonResponse
-from django.utils import timezone
-from django.views.generic import DetailView, ListView
+from django.middleware.csrf import CsrfViewMiddleware
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.generic import DetailView, TemplateView, View
 from django.views.generic.detail import BaseDetailView
 
 from materials import get_event_model
-from materials.models import Upload, UploadStates
-from materials.upload import ResumableUpload
+from materials.admission import Busy, admitted, get_wait
+from materials.completion import submit_completion
+from materials.delta import reuse_chunks
+from materials.core import get_material
+from materials.download import serve_upload
+from materials.event_list import render_event_list
+from materials.export import (
+    EXPORT_FORMATS, current_uploads, export_response)
+from materials.instrumentation import timed
+from materials.metrics import metrics_enabled, render_metrics
+from materials.models import CompletionJob, Upload, UploadStates
+from materials.summary import render_event_summary
+from materials.tus import (
+    TusError, TusUpload, check_version, get_filename, get_tus_upload,
+    options_response, parse_length, parse_metadata, tus_response)
+from materials.upload import (
+    ChunkCorrupted, ResumableRequest, ResumableUpload, create_upload,
+    delta_uploads, get_active_upload)
 
 
 log = getLogger(__name__)
 
 
-class EventListView(ListView):
-    model = get_event_model()
+def csrf_protected_view(request):
+    pass
+
+
+def check_csrf(request) -> Optional[HttpResponse]:
+    """Apply CsrfViewMiddleware to a chunk POST, returning its 403, if
+    rejected.
+
+    The token must be in the X-CSRFToken header, as it's checked before the
+    body is read: the middleware would read a POST's form data for it, so
+    it checks a copy of the request, as a PUT.
+    """
+    middleware = CsrfViewMiddleware(csrf_protected_view)
+    middleware.process_request(request)
+    probe = copy(request)
+    probe.method = 'PUT'
+    rejected = middleware.process_view(probe, csrf_protected_view, (), {})
+    if rejected is None:
+        # csrf_protect won't check (and read) it again
+        request.csrf_processing_done = True
+    return rejected
+
+
+class EventListView(TemplateView):
     template_name = 'materials/event_list.html'
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        search = self.request.GET.get('q', '').strip()
+        context['search'] = search
+        context['event_list'] = render_event_list(
+            search, self.request.GET.get('after'))
+        return context
+
 
 class EventDetailView(DetailView):
     model = get_event_model()
@@ -25,37 +79,75 @@ class EventDetailView(DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        event = context['object']
-        current_uploads = []
-        for mat_set in settings.MATERIALS:
-            material = mat_set.copy()
-            try:
-                material['upload'] = Upload.objects.get(
-                    event=event, deleted__isnull=True,
-                    material_id=material['id'])
-            except Upload.DoesNotExist:
-                material['upload'] = None
-            current_uploads.append(material)
-
-        context['current_uploads'] = current_uploads
-        context['deleted_uploads'] = Upload.objects.filter(
-            event=event).exclude(deleted__isnull=True).order_by('-created')
+        context['summary'] = render_event_summary(context['object'])
+        context['delta_uploads'] = delta_uploads()
         return context
 
 
+@method_decorator(csrf_exempt, name='dispatch')
 class ResumableUploadView(BaseDetailView):
     model = get_event_model()
+    resumable_upload: Optional[ResumableUpload] = None
 
     def dispatch(self, request, *args, **kwargs):
-        self.event = self.get_object()
         self.material = self.kwargs['material']
-        return super().dispatch(request, *args, **kwargs)
+        if 'resumableIdentifier' not in request.GET:
+            self.event = self.get_object()
+            return csrf_protect(super().dispatch)(request, *args, **kwargs)
+
+        # A chunk request, the hot path. The (cached) upload brings its
+        # event along
+        resumable_upload = ResumableUpload.from_query_string(
+            request, self.kwargs['slug'], self.material)
+        self.resumable_upload = resumable_upload
+        self.event = resumable_upload.upload.event
+        phase, size = 'chunk_exists', 0
+        admission = nullcontext()
+        handler = None
+        if request.method == 'POST':
+            # Before the body is streamed into place
+            rejected = check_csrf(request)
+            if rejected:
+                return rejected
+            handler = resumable_upload.get_upload_handler(request)
+            request.upload_handlers.insert(0, handler)
+            r_req = ResumableRequest.parse_query_string(request.GET)
+            phase = 'save_chunk'
+            size = r_req.expected_size(r_req.chunk_number)
+            admission = admitted('chunk', self.event.id, get_wait())
+        try:
+            with admission, timed(phase, resumable_upload.upload,
+                                  size) as timing:
+                response = csrf_protect(super().dispatch)(
+                    request, *args, **kwargs)
+                timing.failed = response.status_code >= 400
+                return response
+        except ValidationError as e:
+            # The first chunk isn't the right type of file. 415 stops
+            # resumable.js retrying it
+            return HttpResponse(' '.join(e.messages), status=415,
+                                content_type='text/plain')
+        except ChunkCorrupted as e:
+            # resumable.js will send it again
+            return HttpResponse(str(e), status=422,
+                                content_type='text/plain')
+        except Busy as e:
+            # resumable.js will retry it
+            response = HttpResponse(str(e), status=503,
+                                    content_type='text/plain')
+            response['Retry-After'] = str(e.retry_after)
+            return response
+        finally:
+            if handler:
+                handler.abort()
 
     def get(self, *args, **kwargs):
         """Resumable.js checking if a chunk is already fully uploaded.
         200 = yes, otherwise no.
         """
-        resumable_upload = ResumableUpload.from_query_string(self.request, self.event)
+        resumable_upload = self.resumable_upload
+        if not resumable_upload:
+            raise PermissionDenied('Missing resumableIdentifier')
         if resumable_upload.chunk_exists(self.request):
             return HttpResponse(status=200)
         # Not 200 but not an error to avoid JS console logging
@@ -67,50 +159,296 @@ class ResumableUploadView(BaseDetailView):
         if action == 'create':
             return self.create_upload(
                 filename=self.request.POST['filename'],
-                size=self.request.POST['size'])
+                size=int(self.request.POST['size']),
+                resume=bool(self.request.POST.get('resume')),
+                fingerprint=self.request.POST.get('fingerprint'))
         elif action == 'complete':
             return self.complete_upload(self.request.POST['identifier'])
+        elif action == 'reuse':
+            return self.reuse_chunks(
+                self.request.POST['identifier'],
+                chunk_size=self.request.POST['chunk_size'],
+                digests=self.request.POST['digests'].split(','))
         else:
             return self.save_chunk()
 
-    def create_upload(self, filename, size):
-        """Prepare to receive an upload"""
-        # TODO validate size against settings
-
-        # Supersede existing uploads
-        for upload in Upload.objects.filter(
-                    event=self.event,
-                    material_id=self.material,
-                    deleted__isnull=True):
-            if upload.state == UploadStates.CREATED:
-                ResumableUpload(upload).delete_upload_chunks()
-            upload.deleted = timezone.now()
-            upload.save()
-
-        upload = Upload(
-            event=self.event,
-            material_id=self.material,
-            filename=filename,
-            size=size,
-        )
-        upload.save()
+    def create_upload(self, filename, size, resume=False, fingerprint=None):
+        """Prepare to receive an upload.
 
+        With resume, an unfinished upload of the same file (with the same
+        fingerprint) is continued.
+        """
+        try:
+            upload, created = create_upload(
+                self.event, self.material, filename, size, resume,
+                fingerprint)
+        except ValidationError as e:
+            return JsonResponse({
+                'error': ' '.join(e.messages),
+            }, status=400)
         return JsonResponse({
             'identifier': upload.id,
-        }, status=201)
+        }, status=201 if created else 200)
+
+    def reuse_chunks(self, identifier, chunk_size, digests):
+        """Delta re-upload: Copy the chunks that are unchanged from the
+        previous upload, given the checksums of every chunk.
+
+        Responds with the chunks received so far, for resumable.js to skip,
+        and the number remaining to reuse, in further requests. Copying
+        chunks takes a chunk admission slot, as receiving them would, so 503
+        if they're all busy.
+        """
+        if not delta_uploads():
+            raise Http404('Delta uploads are disabled')
+        upload = get_object_or_404(Upload, id=identifier, event=self.event,
+                                   material_id=self.material)
+        if upload.state != UploadStates.CREATED:
+            raise PermissionDenied(
+                f'Upload is in state {upload.state}, not CREATED')
+        try:
+            chunk_size = int(chunk_size)
+        except ValueError:
+            raise PermissionDenied('Invalid chunk_size')
+        if chunk_size <= 0:
+            raise PermissionDenied('Invalid chunk_size')
+        resumable_upload = ResumableUpload(upload)
+        try:
+            with admitted('chunk', self.event.id, get_wait()):
+                reused, remaining = reuse_chunks(resumable_upload,
+                                                 chunk_size, digests)
+        except Busy as e:
+            response = JsonResponse({
+                'error': str(e),
+                'retry_after': e.retry_after,
+            }, status=503)
+            response['Retry-After'] = str(e.retry_after)
+            return response
+        return JsonResponse({
+            'identifier': upload.id,
+            'reused': reused,
+            'remaining': remaining,
+            **resumable_upload.received_chunk_status(chunk_size),
+        })
 
     def save_chunk(self):
-        resumable_upload = ResumableUpload.from_query_string(
-            self.request, self.event)
+        resumable_upload = self.resumable_upload
+        if not resumable_upload:
+            raise PermissionDenied('Missing resumableIdentifier')
         resumable_upload.save_chunk(self.request)
         return HttpResponse(status=201)
 
     def complete_upload(self, identifier):
-        """Combine all the chunks and hash them"""
-        upload = Upload.objects.get(id=identifier, event=self.event)
-        resumable_upload = ResumableUpload(upload)
-        resumable_upload.complete_upload()
+        """Combine all the chunks and hash them.
+
+        Possibly in the background: 202 and a status URL to poll.
+        """
+        upload = Upload.objects.get(id=identifier, event=self.event,
+                                    material_id=self.material)
+        try:
+            job = submit_completion(upload)
+        except Busy as e:
+            response = JsonResponse({
+                'state': upload.state,
+                'error': str(e),
+                'retry_after': e.retry_after,
+            }, status=503)
+            response['Retry-After'] = str(e.retry_after)
+            return response
+        if job.finished:
+            upload.refresh_from_db()
+            return JsonResponse({
+                'state': upload.state,
+                'sha256': upload.sha256,
+                'job': job.id,
+                'job_state': job.state,
+                'error': job.error,
+            }, status=201)
         return JsonResponse({
             'state': upload.state,
-            'sha256': upload.sha256,
-        }, status=201)
+            'job': job.id,
+            'status_url': reverse('materials.completion_status', kwargs={
+                'slug': self.event.slug,
+                'material': self.material,
+                'job': job.id,
+            }),
+        }, status=202)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class TusView(View):
+    """A tus 1.0 endpoint, for CLI tools and pipelines.
+
+    Exempt from CSRF checks: Every tus request carries a Tus-Resumable
+    header, so browsers won't send one cross-origin without a CORS
+    preflight.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            if request.method != 'OPTIONS':
+                check_version(request)
+            return super().dispatch(request, *args, **kwargs)
+        except TusError as e:
+            return tus_response(e.status, str(e), **e.headers)
+        except ChunkCorrupted as e:
+            return tus_response(460, str(e))
+        except ValidationError as e:
+            # The first PATCH isn't the right type of file
+            return tus_response(415, ' '.join(e.messages))
+        except Busy as e:
+            return tus_response(503, str(e), Retry_After=str(e.retry_after))
+
+    def options(self, *args, **kwargs):
+        try:
+            max_size = get_material(self.kwargs['material']).max_size
+        except KeyError:
+            raise Http404(f'Unknown material: {self.kwargs["material"]}')
+        return options_response(max_size)
+
+
+class TusCreationView(TusView):
+    def post(self, *args, **kwargs):
+        """Create an upload, for PATCHes to follow"""
+        request = self.request
+        event = get_object_or_404(get_event_model(), slug=self.kwargs['slug'])
+        if 'Upload-Defer-Length' in request.headers:
+            raise TusError('Upload-Defer-Length is not supported')
+        size = parse_length(request.headers.get('Upload-Length'),
+                            'Upload-Length')
+        metadata = parse_metadata(request.headers.get('Upload-Metadata', ''))
+        try:
+            upload = create_upload(
+                event, self.kwargs['material'], get_filename(metadata),
+                size)[0]
+        except ValidationError as e:
+            raise TusError(' '.join(e.messages))
+        location = reverse('materials.tus_upload', kwargs={
+            'slug': event.slug,
+            'material': upload.material_id,
+            'identifier': upload.id,
+        })
+        return tus_response(201, Location=request.build_absolute_uri(location))
+
+
+class TusUploadView(TusView):
+    def head(self, *args, **kwargs):
+        """The upload's offset, for the client to resume from"""
+        upload = get_tus_upload(self.kwargs['identifier'], self.kwargs['slug'],
+                                self.kwargs['material'])
+        if upload.deleted:
+            raise TusError('Upload was superseded', status=410)
+        return tus_response(
+            200, Upload_Offset=str(TusUpload(upload).offset()),
+            Upload_Length=str(upload.size), Cache_Control='no-store')
+
+    def patch(self, *args, **kwargs):
+        """Append to the upload. Completes it, once it's all received"""
+        request = self.request
+        upload = get_active_upload(self.kwargs['identifier'],
+                                   self.kwargs['slug'],
+                                   self.kwargs['material'], writing=True)
+        tus_upload = TusUpload(upload)
+        t_req = tus_upload.parse_patch(request)
+        with admitted('chunk', upload.event_id, get_wait()), \
+                timed('save_chunk', upload, t_req.size):
+            offset = tus_upload.append(request, t_req)
+        if offset == upload.size:
+            try:
+                submit_completion(upload)
+            except Busy:
+                # The client is done. Left QUEUED, for complete_uploads
+                log.warning('Too busy to complete upload %s', upload.id)
+        return tus_response(204, Upload_Offset=str(offset))
+
+
+class DownloadView(BaseDetailView):
+    model = get_event_model()
+
+    def get(self, *args, **kwargs):
+        """Download an upload. Supports Range and conditional requests"""
+        event = self.get_object()
+        upload = get_object_or_404(
+            Upload.objects.select_related('event', 'blob'),
+            id=self.kwargs['upload'], event=event, uploaded__isnull=False,
+            purged__isnull=True)
+        return serve_upload(self.request, upload)
+
+
+class EventExportView(BaseDetailView):
+    model = get_event_model()
+
+    def get(self, *args, **kwargs):
+        """Stream an archive of the event's current uploads"""
+        event = self.get_object()
+        format = self.kwargs['format']
+        if format not in EXPORT_FORMATS:
+            raise Http404(f'Unknown format: {format}')
+        return export_response(self.request, current_uploads([event]),
+                               format, f'{event.slug}-materials')
+
+
+class ExportView(View):
+    def get(self, *args, **kwargs):
+        """Stream an archive of every event's current uploads"""
+        format = self.kwargs['format']
+        if format not in EXPORT_FORMATS:
+            raise Http404(f'Unknown format: {format}')
+        return export_response(self.request, current_uploads(), format,
+                               'materials')
+
+
+class ChunkStatusView(BaseDetailView):
+    model = get_event_model()
+
+    def get(self, *args, **kwargs):
+        """The chunks received so far, and their checksums, for resumable.js
+        to skip those that match.
+
+        One request, rather than one per chunk.
+        """
+        event = self.get_object()
+        upload = get_object_or_404(
+            Upload, id=self.kwargs['identifier'], event=event,
+            material_id=self.kwargs['material'])
+        if upload.state != UploadStates.CREATED:
+            raise PermissionDenied(
+                f'Upload is in state {upload.state}, not CREATED')
+        try:
+            chunk_size = int(self.request.GET.get('chunk_size', 0))
+        except ValueError:
+            raise PermissionDenied('Invalid chunk_size')
+        return JsonResponse({
+            'identifier': upload.id,
+            **ResumableUpload(upload).received_chunk_status(chunk_size),
+        })
+
+
+class CompletionStatusView(BaseDetailView):
+    model = get_event_model()
+
+    def get(self, *args, **kwargs):
+        """Progress of a CompletionJob"""
+        event = self.get_object()
+        job = get_object_or_404(
+            CompletionJob.objects.select_related('upload'),
+            id=self.kwargs['job'], upload__event=event,
+            upload__material_id=self.kwargs['material'])
+        return JsonResponse({
+            'job': job.id,
+            'job_state': job.state,
+            'progress': job.progress,
+            'error': job.error,
+            'state': job.upload.state,
+            'sha256': job.upload.sha256,
+        })
+
+
+class MetricsView(View):
+    def get(self, *args, **kwargs):
+        """Upload metrics, for Prometheus to scrape"""
+        if not metrics_enabled():
+            raise Http404('Metrics are disabled')
+        return HttpResponse(
+            render_metrics(),
+            content_type='text/plain; version=0.0.4; charset=utf-8')
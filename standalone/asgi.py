@@ -13,4 +13,10 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'standalone.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imports models, so Django must be set up first
+from materials.asgi import StreamingChunkMiddleware  # noqa: E402
+
+# Receive upload chunks without tying up a thread per connection
+application = StreamingChunkMiddleware(django_application)
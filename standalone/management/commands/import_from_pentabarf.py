@@ -1,25 +1,105 @@
+from typing import BinaryIO, Dict, Iterable, Iterator, Tuple
+from urllib.parse import urlparse
 from xml.etree import ElementTree
 
 from django.core.management.base import BaseCommand
+from django.db import transaction
 
 import requests
 
-from standalone.models import Event
+from materials.event_list import invalidate_event_list
+from standalone.models import Event, ScheduleFeed
+
+
+def parse_events(f: BinaryIO) -> Iterator[Tuple[str, str]]:
+    """Stream (slug, title) pairs out of a Pentabarf XML schedule"""
+    # The open elements, from the root, to detach events from their parents
+    path = []
+    for action, element in ElementTree.iterparse(f, ('start', 'end')):
+        if action == 'start':
+            path.append(element)
+            continue
+        path.pop()
+        if element.tag != 'event':
+            continue
+        conf_url = element.findtext('conf_url', '')
+        slug = conf_url.strip('/').rsplit('/', 1)[-1]
+        yield slug, element.findtext('title', '')
+        # Don't hold the whole schedule in memory
+        if path:
+            path[-1].remove(element)
+
+
+def import_events(events: Iterable[Tuple[str, str]]) -> Tuple[int, int]:
+    """Create and update Events, in bulk, skipping unchanged ones.
+
+    Returns the number of Events created and updated.
+    """
+    with transaction.atomic():
+        existing = {event.slug: event
+                    for event in Event.objects.only('id', 'slug', 'title')}
+        new: Dict[str, Event] = {}
+        changed: Dict[str, Event] = {}
+        for slug, title in events:
+            event = existing.get(slug)
+            if event is None:
+                new[slug] = Event(slug=slug, title=title)
+            elif event.title != title:
+                event.title = title
+                changed[slug] = event
+        Event.objects.bulk_create(new.values(), batch_size=500)
+        Event.objects.bulk_update(changed.values(), ['title'], batch_size=500)
+    if new or changed:
+        # Bulk operations don't send post_save
+        invalidate_event_list()
+    return len(new), len(changed)
 
 
 class Command(BaseCommand):
     help = 'Import a schedule from Pentabarf XML'
 
     def add_arguments(self, parser):
-        parser.add_argument('url', help='Pentabarf XML feed URL')
+        parser.add_argument('url', help='Pentabarf XML feed URL, or file')
+        parser.add_argument('--force', action='store_true',
+                            help='Import the feed, even if it is unchanged')
 
     def handle(self, *args, **options):
-        with requests.get(options['url']) as r:
-            tree = ElementTree.fromstring(r.content)
-
-        for event in tree.findall('.//event'):
-            conf_url = event.findtext('conf_url')
-            slug = conf_url.strip('/').rsplit('/', 1)[-1]
-            Event.objects.update_or_create(
-                slug=slug,
-                defaults={'title': event.findtext('title')})
+        url = options['url']
+        if urlparse(url).scheme in ('http', 'https'):
+            counts = self.import_url(url, options['force'])
+        else:
+            with open(url, 'rb') as f:
+                counts = import_events(parse_events(f))
+
+        if counts is None:
+            message = 'Schedule unchanged'
+        else:
+            message = 'Created {} and updated {} events'.format(*counts)
+        if options['verbosity'] > 0:
+            self.stdout.write(message)
+
+    def import_url(self, url, force):
+        """Import the feed, if it changed since we last fetched it.
+
+        Returns the number of events created & updated, or None if the feed
+        was unchanged.
+        """
+        feed, _ = ScheduleFeed.objects.get_or_create(url=url)
+        headers = {}
+        if not force:
+            if feed.etag:
+                headers['If-None-Match'] = feed.etag
+            if feed.last_modified:
+                headers['If-Modified-Since'] = feed.last_modified
+
+        with requests.get(url, headers=headers, stream=True) as r:
+            if r.status_code == 304:
+                return None
+            r.raise_for_status()
+            r.raw.decode_content = True
+            counts = import_events(parse_events(r.raw))
+
+        feed.etag = r.headers.get('ETag', '')
+        feed.last_modified = r.headers.get('Last-Modified', '')
+        feed.save()
+        return counts
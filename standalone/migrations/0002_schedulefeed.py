@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('standalone', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduleFeed',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.TextField(unique=True)),
+                ('etag', models.TextField(blank=True)),
+                ('last_modified', models.TextField(blank=True)),
+                ('fetched', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.2.25 on 2026-10-18 13:14
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('standalone', '0002_schedulefeed'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['title', 'id'], name='event_title_id'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(django.db.models.functions.text.Lower('title'), name='event_title_lower'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['slug'], name='event_slug'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 13:40
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('standalone', '0003_event_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(django.db.models.functions.text.Lower('slug'), name='event_slug_lower'),
+        ),
+    ]
@@ -1,4 +1,5 @@
-from django.db.models import TextField, Model
+from django.db.models import DateTimeField, Index, Model, TextField
+from django.db.models.functions import Lower
 
 
 class Event(Model):
@@ -7,3 +8,20 @@ class Event(Model):
 
     class Meta:
         swappable = 'MATERIALS_EVENT_MODEL'
+        indexes = [
+            # The event list's order, and its pages' cursors
+            Index(fields=['title', 'id'], name='event_title_id'),
+            # Searching the event list
+            Index(Lower('title'), name='event_title_lower'),
+            Index(Lower('slug'), name='event_slug_lower'),
+            # Looking events up by slug
+            Index(fields=['slug'], name='event_slug'),
+        ]
+
+
+class ScheduleFeed(Model):
+    """Caching state of a schedule feed, for conditional requests"""
+    url: TextField = TextField(unique=True)
+    etag: TextField = TextField(blank=True)
+    last_modified: TextField = TextField(blank=True)
+    fetched: DateTimeField = DateTimeField(auto_now=True)
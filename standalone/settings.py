@@ -130,17 +130,79 @@ MATERIALS = (
         'id': 'slides',
         'name': 'Slides',
         'extensions': ['pdf', 'odp', 'zip'],
-        'validators': ['materials.validators.filename'],
+        'max_size': 512 * 1024 * 1024,
+        'validators': [
+            'materials.validators.filename',
+            'materials.validators.size',
+            'materials.validators.magic_bytes',
+        ],
     }, {
         'id': 'video',
         'name': 'Video',
         'extensions': ['mp4', 'webm'],
-        'validators': ['materials.validators.filename'],
+        'max_size': 16 * 1024 * 1024 * 1024,
+        'validators': [
+            'materials.validators.filename',
+            'materials.validators.size',
+            'materials.validators.magic_bytes',
+        ],
     },
 )
 MATERIALS_EVENT_MODEL = 'standalone.Event'
+# For S3-compatible object storage, 'materials.s3.S3ComposingStorage' (with
+# django-storages' S3Boto3Storage as MATERIALS_TEMP_STORAGE) assembles
+# uploads from their chunks on the server, without downloading them
 MATERIALS_STORAGE = 'django.core.files.storage.FileSystemStorage'
 MATERIALS_TEMP_STORAGE = 'django.core.files.storage.FileSystemStorage'
+# Write chunks in place into a preallocated file, rather than separate files
+# (requires a FileSystemStorage MATERIALS_TEMP_STORAGE)
+MATERIALS_PREALLOCATE_UPLOADS = False
+# Keep the checksums of each upload's chunks, so that re-uploads of a
+# material only send the chunks that changed
+MATERIALS_DELTA_UPLOADS = False
+# Bytes of unchanged chunks copied per delta re-upload request (at least one
+# chunk). The client makes further requests for the rest
+MATERIALS_REUSE_LIMIT = 64 * 1024 * 1024
+# Complete uploads: None = within the request, 0 = queued for
+# "manage.py complete_uploads", n = in a pool of n background threads.
+# Under ASGI, prefer a pool, so completion doesn't hold up Django's thread
+# for sync views.
+MATERIALS_COMPLETION_WORKERS = None
+# Seconds a RUNNING completion can go without progress, before it's
+# considered abandoned (by a crashed worker), and run again.
+MATERIALS_COMPLETION_TIMEOUT = 600
+# Seconds to cache each event's rendered uploads. Invalidated on changes, but
+# only within a process, unless CACHES is shared between processes.
+MATERIALS_SUMMARY_CACHE_TIMEOUT = 300
+# Seconds to cache the upload looked up by each chunk request (as above).
+# Chunks are only written once its state is read again from the database.
+MATERIALS_UPLOAD_CACHE_TIMEOUT = 60
+# Events on each page of the event list, and seconds to cache each rendered
+# page (invalidated on changes, as above)
+MATERIALS_EVENT_LIST_PAGE_SIZE = 100
+MATERIALS_EVENT_LIST_CACHE_TIMEOUT = 300
+# Have the front-end web server send downloads: None, 'x-accel-redirect'
+# (nginx, with an internal location at MATERIALS_DOWNLOAD_ACCEL_PREFIX that
+# serves MEDIA_ROOT) or 'x-sendfile' (Apache mod_xsendfile, lighttpd)
+MATERIALS_DOWNLOAD_OFFLOAD = None
+MATERIALS_DOWNLOAD_ACCEL_PREFIX = '/protected-materials/'
+# Store identical uploads once, named by sha256, and reference counted
+MATERIALS_CONTENT_ADDRESSED_STORAGE = False
+# Record upload phase timings, and serve them for Prometheus at
+# /events/metrics. Only expose that to your monitoring.
+MATERIALS_METRICS = False
+# Bound concurrent chunk writes and completions (assembly), globally and per
+# event, across the processes on this host (None = unlimited). Requests
+# queue for up to MATERIALS_CONCURRENCY_WAIT seconds, before a 503 that
+# asks clients to retry after MATERIALS_RETRY_AFTER seconds. Slots are
+# flock()ed files in MATERIALS_LOCK_DIR (default: in the temp directory).
+MATERIALS_CONCURRENCY = {
+    'chunk': {'global': None, 'per_event': None},
+    'complete': {'global': None, 'per_event': None},
+}
+MATERIALS_CONCURRENCY_WAIT = 5
+MATERIALS_RETRY_AFTER = 10
+MATERIALS_LOCK_DIR = None
 MEDIA_ROOT = BASE_DIR / 'media'
 
 try:
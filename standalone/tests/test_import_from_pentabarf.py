@@ -0,0 +1,120 @@
+import os
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from io import BytesIO, StringIO
+from tempfile import TemporaryDirectory
+from threading import Thread
+from unittest import mock
+from xml.etree import ElementTree
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase
+
+from standalone.management.commands.import_from_pentabarf import (
+    parse_events)
+from standalone.models import Event
+
+
+def make_schedule(*events):
+    xml = ['<?xml version="1.0"?><schedule><day><room name="A">']
+    for slug, title in events:
+        xml.append(
+            f'<event><title>{title}</title>'
+            f'<conf_url>/2020/schedule/event/{slug}/</conf_url></event>')
+    xml.append('</room></day></schedule>')
+    return ''.join(xml).encode('utf-8')
+
+
+class ScheduleHandler(BaseHTTPRequestHandler):
+    schedule = b''
+    etag = '"v1"'
+    requests = 0
+
+    def do_GET(self):
+        type(self).requests += 1
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/xml')
+        self.send_header('ETag', self.etag)
+        self.send_header('Content-Length', str(len(self.schedule)))
+        self.end_headers()
+        self.wfile.write(self.schedule)
+
+    def log_message(self, *args):
+        pass
+
+
+class ImportTestCase(TestCase):
+    def call_command(self, *args):
+        stdout = StringIO()
+        call_command('import_from_pentabarf', *args, stdout=stdout)
+        return stdout.getvalue().strip()
+
+    def test_import_file(self):
+        Event.objects.create(slug='keynote', title='Keynote')
+        Event.objects.create(slug='lunch', title='Lunch')
+        tempdir = TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        path = os.path.join(tempdir.name, 'schedule.xml')
+        with open(path, 'wb') as f:
+            f.write(make_schedule(('keynote', 'Keynote'),
+                                  ('lunch', 'Lunch!'),
+                                  ('closing', 'Closing')))
+
+        # Savepoints around: Events, create, update
+        with self.assertNumQueries(5):
+            output = self.call_command(path)
+        self.assertEqual(output, 'Created 1 and updated 1 events')
+        self.assertEqual(
+            dict(Event.objects.values_list('slug', 'title')),
+            {'keynote': 'Keynote', 'lunch': 'Lunch!', 'closing': 'Closing'})
+
+    def test_parse_events_detached(self):
+        iterparse = ElementTree.iterparse
+        rooms = []
+
+        def parse(*args, **kwargs):
+            for action, element in iterparse(*args, **kwargs):
+                if element.tag == 'room':
+                    rooms.append(element)
+                yield action, element
+
+        schedule = make_schedule(('keynote', 'Keynote'), ('lunch', 'Lunch'))
+        with mock.patch.object(ElementTree, 'iterparse', parse):
+            events = list(parse_events(BytesIO(schedule)))
+        self.assertEqual(events, [('keynote', 'Keynote'), ('lunch', 'Lunch')])
+        # Parsed events aren't kept in the tree
+        self.assertEqual(len(rooms[0]), 0)
+
+    def test_import_invalidates_event_list(self):
+        cache.clear()
+        Event.objects.create(slug='keynote', title='Keynote')
+        c = Client()
+        c.get('/events/')
+        tempdir = TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        path = os.path.join(tempdir.name, 'schedule.xml')
+        with open(path, 'wb') as f:
+            f.write(make_schedule(('keynote', 'Opening Keynote')))
+        self.call_command(path)
+        self.assertContains(c.get('/events/'), 'Opening Keynote')
+
+    def test_import_url(self):
+        ScheduleHandler.schedule = make_schedule(('keynote', 'Keynote'))
+        ScheduleHandler.requests = 0
+        server = HTTPServer(('127.0.0.1', 0), ScheduleHandler)
+        Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = f'http://127.0.0.1:{server.server_port}/schedule.xml'
+
+        self.assertEqual(self.call_command(url),
+                         'Created 1 and updated 0 events')
+        self.assertEqual(self.call_command(url), 'Schedule unchanged')
+        self.assertEqual(self.call_command(url, '--force'),
+                         'Created 0 and updated 0 events')
+        self.assertEqual(ScheduleHandler.requests, 3)
+        self.assertEqual(Event.objects.get().title, 'Keynote')